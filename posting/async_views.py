@@ -0,0 +1,15 @@
+from westagram_project.async_views import asyncify
+from .                             import views
+
+PostingDetailView    = asyncify(views.PostingDetailView)
+BatchView            = asyncify(views.BatchView)
+PostingListView      = asyncify(views.PostingListView)
+FeedView             = asyncify(views.FeedView)
+CommentView          = asyncify(views.CommentView)
+CommentOfCommentView = asyncify(views.CommentOfCommentView)
+CommentThreadView    = asyncify(views.CommentThreadView)
+LikeView             = asyncify(views.LikeView)
+RelationshipView     = asyncify(views.RelationshipView)
+SearchView           = asyncify(views.SearchView)
+TagView              = asyncify(views.TagView)
+TrendingTagView      = asyncify(views.TrendingTagView)
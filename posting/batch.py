@@ -0,0 +1,218 @@
+import uuid
+
+from collections       import Counter, defaultdict
+
+from django.conf       import settings
+from django.db         import connection, transaction
+
+from user.models       import User, Follow, UserCounter
+from user              import graph
+from westagram_project import counters
+from .models           import Posting, Image, Comment, Like, PostingCounter
+from .                 import feed, cache, search, tags
+
+OPERATIONS = ('posting', 'comment', 'like', 'follow')
+
+
+class InvalidBatch(Exception):
+    pass
+
+
+def parse(operation):
+    """operation 에서 쓰기에 필요한 값만 꺼낸다. 빠지거나 잘못된 값이 있으면 KeyError."""
+    try:
+        if operation['type'] == 'posting':
+            if not isinstance(operation['image'], list):
+                raise KeyError('image')
+            return {'content': operation.get('content', None), 'image': operation['image']}
+
+        if operation['type'] == 'comment':
+            return {'posting_id': int(operation['posting_id']), 'content': operation['content']}
+
+        if operation['type'] == 'like':
+            return {'posting_id': int(operation['posting_id'])}
+
+        return {'to_user_id': int(operation['to_user_id'])}
+
+    except (TypeError, ValueError) as error:
+        raise KeyError(error)
+
+
+def create_postings(postings):
+    if connection.features.can_return_rows_from_bulk_insert:
+        postings = Posting.objects.bulk_create(postings)
+        # bulk_create 는 post_save 를 보내지 않으므로 직접 index 한다.
+        search.index_many('posting', [(posting.id, posting.content) for posting in postings])
+        return postings
+
+    # insert 한 row 의 pk 를 돌려받지 못하는 DB(MySQL, SQLite)는 image 를 연결하려면 하나씩 insert 해야 한다.
+    # search index 는 post_save(signals.index_posting)가 넣는다.
+    for posting in postings:
+        posting.save(force_insert=True)
+    return postings
+
+
+def create_comments(comments):
+    """댓글을 bulk_create 하고 path 를 채운 뒤 id 가 채워진 댓글을 돌려준다."""
+    if not comments:
+        return []
+
+    posting_ids = {comment.posting_id for comment in comments}
+    if connection.features.can_return_rows_from_bulk_insert:
+        Comment.objects.bulk_create(comments)
+        Comment.objects.fill_paths(posting_id__in=posting_ids, id__in=[comment.id for comment in comments])
+        return comments
+
+    # insert 한 row 의 pk 를 돌려받지 못하는 DB(MySQL, SQLite)는 path 를 채우기 전까지 batch 마다 다른 값을 넣어두고 그 값으로 찾는다.
+    # 같은 user 의 batch 가 동시에 들어와도 서로의 댓글을 가져가지 않는다.
+    marker = 'batch:' + uuid.uuid4().hex
+    for comment in comments:
+        comment.path = marker
+    Comment.objects.bulk_create(comments)
+    created = list(Comment.objects.filter(posting_id__in=posting_ids, path=marker))
+    Comment.objects.fill_paths(marker=marker, posting_id__in=posting_ids)
+    return created
+
+
+def insert_pairs(model, owner, target, rows, results):
+    """(owner, target) 이 unique 인 row 들을 충돌은 무시하고 insert 한 뒤 실제로 들어간 row 만 돌려준다.
+
+    transaction 안에서 insert 전후로 읽어서, 그 사이 동시에 들어온 요청이 먼저 넣은 row 는 빼고 ALREADY EXIST 로 바꾼다.
+    """
+    if not rows:
+        return []
+
+    existing = (
+        model.objects
+        .filter(**{owner: getattr(rows[0][1], owner), target + '__in': [getattr(row, target) for _, row in rows]})
+        .values_list(target, flat=True)
+    )
+    before = set(existing)
+    model.objects.bulk_create([row for _, row in rows], ignore_conflicts=True)
+    inserted = set(existing.all()) - before
+
+    for index, row in rows:
+        if getattr(row, target) not in inserted:
+            results[index]['message'] = 'ALREADY EXIST'
+    return [row for _, row in rows if getattr(row, target) in inserted]
+
+
+def apply(user, operations):
+    """게시물, 댓글, 좋아요, follow operation 목록을 한 transaction 으로 쓰고 operation 별 결과를 돌려준다.
+
+    참조하는 게시물과 user 는 table 마다 IN 조회 한 번으로 검증하고, 쓰기는 bulk_create 로 한다.
+    실패한 operation 은 결과에 message 만 남고 나머지 operation 은 그대로 쓴다.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise InvalidBatch('KEY ERROR')
+
+    if len(operations) > settings.BATCH_MAX_OPERATIONS:
+        raise InvalidBatch('TOO MANY OPERATIONS')
+
+    if not all(isinstance(operation, dict) for operation in operations):
+        raise InvalidBatch('KEY ERROR')
+
+    results = [{'type': operation.get('type'), 'message': 'SUCCESS'} for operation in operations]
+    parsed  = defaultdict(list)
+
+    for index, operation in enumerate(operations):
+        if operation.get('type') not in OPERATIONS:
+            results[index]['message'] = 'INVALID TYPE'
+            continue
+
+        try:
+            parsed[operation['type']].append((index, parse(operation)))
+        except KeyError:
+            results[index]['message'] = 'KEY ERROR'
+
+    posting_ids = {value['posting_id'] for kind in ('comment', 'like') for _, value in parsed[kind]}
+    like_ids    = {value['posting_id'] for _, value in parsed['like']}
+    user_ids    = {value['to_user_id'] for _, value in parsed['follow']}
+
+    postings = set(Posting.objects.filter(id__in=posting_ids).values_list('id', flat=True)) if posting_ids else set()
+    liked    = set(
+        Like.objects
+        .filter(user_id=user.id, posting_id__in=like_ids)
+        .values_list('posting_id', flat=True)
+    ) if like_ids else set()
+    users    = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True)) if user_ids else set()
+    followed = set(
+        Follow.objects
+        .filter(from_user_id=user.id, to_user_id__in=user_ids)
+        .values_list('to_user_id', flat=True)
+    ) if user_ids else set()
+
+    comments, likes, follows = [], [], []
+
+    for index, value in parsed['comment']:
+        if value['posting_id'] not in postings:
+            results[index]['message'] = 'NOT FOUND'
+            continue
+        comments.append(Comment(user_id=user.id, **value))
+
+    for index, value in parsed['like']:
+        if value['posting_id'] not in postings:
+            results[index]['message'] = 'NOT FOUND'
+        elif value['posting_id'] in liked:
+            results[index]['message'] = 'ALREADY EXIST'
+        else:
+            liked.add(value['posting_id'])
+            likes.append((index, Like(user_id=user.id, **value)))
+
+    for index, value in parsed['follow']:
+        if value['to_user_id'] not in users:
+            results[index]['message'] = 'NOT FOUND'
+        elif value['to_user_id'] in followed:
+            results[index]['message'] = 'ALREADY EXIST'
+        else:
+            followed.add(value['to_user_id'])
+            follows.append((index, Follow(from_user_id=user.id, **value)))
+
+    with transaction.atomic():
+        pushed      = feed.is_pushed(user.id) if parsed['posting'] else False
+        new_posting = create_postings([
+            Posting(user_id=user.id, content=value['content'], is_pushed=pushed)
+            for _, value in parsed['posting']
+        ])
+        Image.objects.bulk_create([
+            Image(image=image, posting_id=posting.id)
+            for posting, (_, value) in zip(new_posting, parsed['posting'])
+            for image in value['image']
+        ])
+        for posting, (index, _) in zip(new_posting, parsed['posting']):
+            results[index]['id'] = posting.id
+
+        new_comments = create_comments(comments)
+        # 위에서 확인했지만 동시에 들어온 요청과 겹칠 수 있으므로 unique 충돌은 무시한다.
+        # counter 와 timeline, follow graph 는 이 batch 가 실제로 넣은 row 에만 반영한다.
+        likes   = insert_pairs(Like, 'user_id', 'posting_id', likes, results)
+        follows = insert_pairs(Follow, 'from_user_id', 'to_user_id', follows, results)
+
+        posting_deltas = defaultdict(Counter)
+        for comment in comments:
+            posting_deltas[comment.posting_id]['comments'] += 1
+        for like in likes:
+            posting_deltas[like.posting_id]['likes'] += 1
+        for posting_id, deltas in posting_deltas.items():
+            counters.increment(PostingCounter, 'posting_id', posting_id, **deltas)
+
+        user_deltas = Counter(posts=len(new_posting), following=len(follows))
+        if +user_deltas:
+            counters.increment(UserCounter, 'user_id', user.id, **+user_deltas)
+        for follow in follows:
+            counters.increment(UserCounter, 'user_id', follow.to_user_id, followers=1)
+
+        # bulk_create 는 signal 을 보내지 않으므로 timeline, cache, follow graph, tag, search index 는 여기서 직접 처리한다.
+        feed.fan_out_many(new_posting)
+        for follow in follows:
+            feed.backfill(user.id, follow.to_user_id)
+            graph.follow(user.id, follow.to_user_id)
+
+        tags.attach(new_posting)
+        tags.attach_comments(new_comments)
+        search.index_many('comment', [(comment.id, comment.content) for comment in new_comments])
+        cache.invalidate_postings(list(posting_deltas) + [posting.id for posting in new_posting])
+        if new_posting:
+            cache.invalidate_posting_list(user.id)
+
+    return results
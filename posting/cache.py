@@ -0,0 +1,149 @@
+import time
+import uuid
+
+from collections                  import namedtuple
+
+from django.conf                  import settings
+from django.core.cache            import caches
+from django.db                    import transaction
+
+from westagram_project.pagination import paginate, encode_cursor
+from westagram_project.replicas   import primary
+from .models                      import Posting
+from .serializers                 import serialize_postings
+
+Entry = namedtuple('Entry', ['payload', 'updated_at'])
+
+
+def backend():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def posting_key(posting_id):
+    return 'posting:{}'.format(posting_id)
+
+
+def list_version_key(user_id):
+    return 'posting_list_version:{}'.format(user_id)
+
+
+def single_flight(key, build):
+    """cache 에 없는 값은 lock 을 잡은 요청 하나만 build 하고 나머지는 그 결과를 기다린다.
+
+    build 결과가 None 이어도 cache 할 수 있도록 (value,) 로 감싸서 저장한다.
+    lock 을 잡은 요청이 죽어서 RESPONSE_CACHE_LOCK_TIMEOUT 이 지나면 기다리던 요청이 직접 build 한다.
+    """
+    cache  = backend()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0]
+
+    lock     = 'lock:' + key
+    deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_TIMEOUT
+    while not cache.add(lock, True, settings.RESPONSE_CACHE_LOCK_TIMEOUT):
+        time.sleep(settings.RESPONSE_CACHE_LOCK_WAIT)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[0]
+        if time.monotonic() > deadline:
+            return build()
+
+    try:
+        # lock 을 기다리는 사이에 다른 요청이 채워 넣었을 수 있다.
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[0]
+
+        # 모든 요청이 같이 보는 값이므로 replica 가 아닌 default 에서 읽는다.
+        with primary():
+            value = build()
+        cache.set(key, (value,), settings.RESPONSE_CACHE_TIMEOUT)
+        return value
+    finally:
+        cache.delete(lock)
+
+
+def build_entries(postings):
+    """payload 와 함께 조건부 요청의 validator 로 쓸 updated_at 을 담는다."""
+    postings = list(postings)
+    return {
+        payload['id']: Entry(payload, posting.updated_at)
+        for posting, payload in zip(postings, serialize_postings(postings))
+    }
+
+
+def get_posting(posting_id):
+    """게시물 하나의 Entry. 없는 게시물이면 None 이다."""
+    def build():
+        return next(iter(build_entries(Posting.objects.filter(id=posting_id)).values()), None)
+
+    return single_flight(posting_key(posting_id), build)
+
+
+def get_postings(postings):
+    """게시물 id 목록(또는 이미 읽은 Posting 목록)의 Entry 를 순서대로 돌려준다. cache 에 없는 것만 한 번에 만든다."""
+    ids    = [getattr(posting, 'id', posting) for posting in postings]
+    cache  = backend()
+    cached = cache.get_many([posting_key(posting_id) for posting_id in ids])
+    found  = {posting_id: cached[posting_key(posting_id)][0] for posting_id in ids if posting_key(posting_id) in cached}
+
+    missing = [posting for posting in postings if getattr(posting, 'id', posting) not in found]
+    if missing:
+        if not isinstance(missing[0], Posting):
+            missing = Posting.objects.filter(id__in=missing)
+
+        with primary():
+            built = build_entries(missing)
+        cache.set_many(
+            {posting_key(posting_id): (entry,) for posting_id, entry in built.items()},
+            settings.RESPONSE_CACHE_TIMEOUT
+        )
+        found.update(built)
+
+    return [found[posting_id] for posting_id in ids if found.get(posting_id) is not None]
+
+
+def list_version(user_id):
+    cache   = backend()
+    version = cache.get(list_version_key(user_id))
+    if version is None:
+        cache.add(list_version_key(user_id), uuid.uuid4().hex, None)
+        version = cache.get(list_version_key(user_id))
+    return version
+
+
+def get_posting_list(user_id, limit, position):
+    """user 의 게시물 목록 한 page 의 Entry 목록과 다음 position. page 에는 게시물 id 만 담고 payload 는 게시물 cache 에서 꺼낸다."""
+    key   = 'posting_list:{}:{}:{}:{}'.format(user_id, list_version(user_id), limit, encode_cursor(position))
+    built = []
+
+    def build():
+        postings, next_position = paginate(
+            Posting.objects.filter(user_id=user_id),
+            ('-created_at', '-id'),
+            limit,
+            position
+        )
+        built.extend(postings)
+        return [posting.id for posting in postings], next_position
+
+    ids, next_position = single_flight(key, build)
+    return get_postings(built or ids), next_position
+
+
+def _delete(keys):
+    # 지금 지우고 transaction 이 commit 된 뒤에 한 번 더 지운다. commit 전에 다른 요청이 다시 cache 한 예전 값까지 지우기 위해서다.
+    backend().delete_many(keys)
+    transaction.on_commit(lambda: backend().delete_many(keys))
+
+
+def invalidate_postings(posting_ids):
+    _delete([posting_key(posting_id) for posting_id in set(posting_ids)])
+
+
+def invalidate_posting_list(user_id):
+    def bump():
+        backend().set(list_version_key(user_id), uuid.uuid4().hex, None)
+
+    bump()
+    transaction.on_commit(bump)
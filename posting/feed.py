@@ -0,0 +1,188 @@
+import heapq
+import logging
+import time
+
+from django.conf                  import settings
+
+from user.models                  import Follow, UserCounter
+from westagram_project            import counters, metrics
+from westagram_project.pagination import after
+from .models                      import Posting, Timeline, PulledAuthor
+
+logger = logging.getLogger(__name__)
+
+# fan-out 쓰기량과 feed 읽기 비용. /metrics 로 내보내서 FEED_FANOUT_THRESHOLD 튜닝에 쓴다.
+POSTINGS        = metrics.Counter('westagram_feed_postings_total', '작성된 게시물 수 (mode=pushed 는 fan-out, pulled 는 읽을 때 가져온다)', labels=('mode',))
+TIMELINE_WRITES = metrics.Counter('westagram_feed_timeline_writes_total', 'fan-out 으로 쓴 timeline row 수', labels=())
+READ_ROWS       = metrics.Counter('westagram_feed_read_rows_total', 'feed 를 읽을 때 가져온 row 수 (source=pushed, pulled)', labels=('source',))
+READ_SECONDS    = metrics.Histogram('westagram_feed_read_seconds', 'feed 한 page 를 읽는 시간', metrics.LATENCY_BUCKETS, labels=())
+MERGE_SECONDS   = metrics.Histogram('westagram_feed_merge_seconds', 'pushed, pulled stream 을 merge 하는 시간', metrics.LATENCY_BUCKETS, labels=())
+
+metrics.register(POSTINGS, TIMELINE_WRITES, READ_ROWS, READ_SECONDS, MERGE_SECONDS)
+
+
+def follower_count(user_id):
+    return counters.total(UserCounter, 'user_id', user_id, ['followers'])['followers']
+
+
+def is_pushed(user_id):
+    """follower가 threshold 이하인 작성자만 write 시점에 fan-out 한다."""
+    return follower_count(user_id) <= settings.FEED_FANOUT_THRESHOLD
+
+
+def fan_out(posting):
+    """새 게시물을 작성자 본인의 timeline에 기록하고, push 대상이면 모든 follower의 timeline에도 기록한다."""
+    fan_out_many([posting])
+
+
+def fan_out_many(postings):
+    """fan_out 을 여러 게시물에 한꺼번에 한다. follower 목록은 작성자마다 한 번만 조회한다."""
+    entries   = []
+    writes    = 0
+    followers = {}
+
+    def flush():
+        nonlocal entries, writes
+        Timeline.objects.bulk_create(entries, ignore_conflicts=True)
+        writes += len(entries)
+        entries = []
+
+    # push 하지 않는 작성자는 feed 가 읽는 시점에 가져올 수 있도록 등록한다.
+    PulledAuthor.objects.bulk_create(
+        [PulledAuthor(user_id=user_id) for user_id in {posting.user_id for posting in postings if not posting.is_pushed}],
+        ignore_conflicts=True
+    )
+
+    for posting in postings:
+        user_ids = [posting.user_id]
+
+        if posting.is_pushed:
+            if posting.user_id not in followers:
+                followers[posting.user_id] = list(
+                    Follow.objects
+                    .filter(to_user_id=posting.user_id)
+                    .values_list('from_user_id', flat=True)
+                    .iterator()
+                )
+            user_ids += followers[posting.user_id]
+
+        for user_id in user_ids:
+            entries.append(Timeline(
+                user_id    = user_id,
+                author_id  = posting.user_id,
+                posting    = posting,
+                created_at = posting.created_at
+            ))
+
+            if len(entries) >= settings.FEED_FANOUT_BATCH_SIZE:
+                flush()
+
+    flush()
+
+    pushed = sum(1 for posting in postings if posting.is_pushed)
+    POSTINGS.inc(('pushed',), pushed)
+    POSTINGS.inc(('pulled',), len(postings) - pushed)
+    TIMELINE_WRITES.inc((), writes)
+
+
+def backfill(user_id, author_id):
+    """follow 직후 author의 최근 push 게시물을 user의 timeline에 채워 넣는다."""
+    postings = (
+        Posting.objects
+        .filter(user_id=author_id, is_pushed=True)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'created_at')[:settings.FEED_BACKFILL_SIZE]
+    )
+
+    Timeline.objects.bulk_create([Timeline(
+        user_id    = user_id,
+        author_id  = author_id,
+        posting_id = posting_id,
+        created_at = created_at
+    ) for posting_id, created_at in postings], ignore_conflicts=True)
+
+
+def remove(user_id, author_id):
+    """unfollow 하면 user의 timeline에서 author의 게시물을 지운다."""
+    Timeline.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def pushed_entries(user_id, limit, position=None):
+    keys    = ('-created_at', '-posting_id')
+    entries = Timeline.objects.filter(user_id=user_id)
+    if position is not None:
+        entries = entries.filter(after(keys, position, Timeline))
+
+    return list(entries.order_by(*keys).values_list('created_at', 'posting_id')[:limit])
+
+
+def pulled_entries(user_id, limit, position=None):
+    """push 되지 않은(follower가 많은 작성자의) 게시물을 읽는 시점에 가져온다.
+
+    follow 하는 작성자 중 PulledAuthor 에 있는 작성자의 게시물만 읽으므로 대부분의 user 는 query 하나로 끝난다.
+    """
+    keys    = ('-created_at', '-id')
+    authors = list(
+        Follow.objects
+        .filter(from_user_id=user_id, to_user_id__in=PulledAuthor.objects.values('user_id'))
+        .values_list('to_user_id', flat=True)
+    )
+    if not authors:
+        return []
+
+    entries = Posting.objects.filter(is_pushed=False, user_id__in=authors)
+    if position is not None:
+        entries = entries.filter(after(keys, position, Posting))
+
+    return list(entries.order_by(*keys).values_list('created_at', 'id')[:limit])
+
+
+def merge(streams, limit):
+    """(created_at, posting_id) 내림차순으로 정렬된 stream들을 k-way merge 한다."""
+    results = []
+    seen    = set()
+
+    for entry in heapq.merge(*streams, reverse=True):
+        if entry[1] in seen:
+            continue
+        seen.add(entry[1])
+        results.append(entry)
+
+        if len(results) == limit:
+            break
+
+    return results
+
+
+def read(user_id, limit, position=None):
+    """feed 한 페이지의 게시물과 다음 페이지 position을 돌려준다."""
+    started = time.perf_counter()
+
+    # 다음 페이지가 있는지 알기 위해 한 개씩 더 읽는다.
+    pushed = pushed_entries(user_id, limit + 1, position)
+    pulled = pulled_entries(user_id, limit + 1, position)
+
+    merge_started = time.perf_counter()
+    entries       = merge([pushed, pulled], limit + 1)
+    merge_seconds = time.perf_counter() - merge_started
+
+    next_position = None
+    if len(entries) > limit:
+        entries       = entries[:limit]
+        next_position = list(entries[-1])
+    posting_ids = [posting_id for created_at, posting_id in entries]
+
+    postings = Posting.objects.in_bulk(posting_ids)
+    results  = [postings[posting_id] for posting_id in posting_ids if posting_id in postings]
+
+    read_seconds = time.perf_counter() - started
+    READ_ROWS.inc(('pushed',), len(pushed))
+    READ_ROWS.inc(('pulled',), len(pulled))
+    READ_SECONDS.observe((), read_seconds)
+    MERGE_SECONDS.observe((), merge_seconds)
+    logger.debug(
+        'feed read user=%s pushed=%s pulled=%s merge=%.6fs total=%.6fs',
+        user_id, len(pushed), len(pulled), merge_seconds, read_seconds
+    )
+
+    return results, next_position
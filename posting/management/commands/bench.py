@@ -0,0 +1,354 @@
+import json
+import time
+import random
+import shutil
+import datetime
+import tempfile
+import jwt
+
+from collections                 import Counter, namedtuple
+
+from django.conf                 import settings
+from django.core.cache           import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db                   import connections, close_old_connections
+from django.test                 import Client
+from django.test.utils           import override_settings, setup_databases, teardown_databases
+from my_settings                 import SECRET, ALGORITHM
+
+from user                        import urls as user_urls
+from posting                     import urls as posting_urls
+from posting.models              import Posting, Comment, Tag
+from posting.synthetic           import Generator, EMAIL, PASSWORD
+from westagram_project           import metrics, pool
+
+# build(context, index) 는 (경로, JSON body 또는 None, 로그인할 user id 또는 None) 을 돌려준다.
+Route = namedtuple('Route', ['name', 'pattern', 'method', 'build'])
+
+ROUTES = [
+    Route('signup', 'user/signup', 'POST', lambda c, i: (
+        '/user/signup', {'email': 'bench-signup-{}-{}@bench.bench'.format(c.run, i), 'password': PASSWORD}, None
+    )),
+    Route('signin', 'user/signin', 'POST', lambda c, i: (
+        '/user/signin', {'email': EMAIL.format(c.user(i)), 'password': PASSWORD}, None
+    )),
+    # 같은 두 user 로 follow, unfollow 를 번갈아 한다.
+    Route('follow', 'user/follow', 'POST', lambda c, i: (
+        '/user/follow', {'to_user_id': c.user(i // 2, 1), 'follow_button': '+-'[i % 2]}, c.user(i // 2)
+    )),
+    Route('follow_list', 'user/follow', 'GET', lambda c, i: (
+        '/user/follow?user-id={}'.format(c.user(i)), None, None
+    )),
+    Route('follow_status', 'user/follow/status', 'GET', lambda c, i: (
+        '/user/follow/status?user-id={}&target-ids={}'.format(c.user(i), ','.join(str(c.user(i, n)) for n in range(1, 21))), None, None
+    )),
+    Route('follow_mutual', 'user/follow/mutual', 'GET', lambda c, i: (
+        '/user/follow/mutual?user-id={}&target-id={}'.format(c.user(i), c.user(i, 1)), None, None
+    )),
+    Route('follow_suggestion', 'user/follow/suggestion', 'GET', lambda c, i: (
+        '/user/follow/suggestion?user-id={}'.format(c.user(i)), None, None
+    )),
+    Route('posting_create', 'posting', 'POST', lambda c, i: (
+        '/posting', {'content': 'bench w1 #t1', 'image': ['https://bench.bench/{}.jpg'.format(i)]}, c.user(i)
+    )),
+    Route('posting_detail', 'posting/<int:posting_id>', 'GET', lambda c, i: (
+        '/posting/{}'.format(c.posting(i)[0]), None, None
+    )),
+    Route('posting_update', 'posting/<int:posting_id>', 'PATCH', lambda c, i: (
+        '/posting/{}'.format(c.posting(i)[0]), {'content': 'updated w2 #t2', 'image': ['https://bench.bench/u.jpg']}, c.posting(i)[1]
+    )),
+    Route('batch', 'posting/batch', 'POST', lambda c, i: ('/posting/batch', {'operations': [
+        {'type': 'posting', 'content': 'batch w3', 'image': []},
+        {'type': 'comment', 'posting_id': c.posting(i)[0], 'content': 'batch'},
+        {'type': 'like', 'posting_id': c.posting(i, 1)[0]},
+        {'type': 'follow', 'to_user_id': c.user(i, 1)},
+    ]}, c.user(i))),
+    Route('posting_list', 'posting/list/<int:user_id>', 'GET', lambda c, i: (
+        '/posting/list/{}'.format(c.user(i)), None, None
+    )),
+    Route('feed', 'posting/feed', 'GET', lambda c, i: (
+        '/posting/feed', None, c.user(i)
+    )),
+    Route('comment_create', 'posting/comment', 'POST', lambda c, i: (
+        '/posting/comment', {'posting_id': c.posting(i)[0], 'content': 'bench comment'}, c.user(i)
+    )),
+    Route('comment_list', 'posting/comment', 'GET', lambda c, i: (
+        '/posting/comment?posting-id={}'.format(c.posting(i)[0]), None, None
+    )),
+    Route('comment_thread', 'posting/comment/thread', 'GET', lambda c, i: (
+        '/posting/comment/thread?posting-id={}'.format(c.posting(i)[0]), None, None
+    )),
+    Route('comment_subtree', 'posting/comment/thread', 'GET', lambda c, i: (
+        '/posting/comment/thread?comment-id={}'.format(c.comment(i)), None, None
+    )),
+    Route('reply_create', 'posting/commentofcomment', 'POST', lambda c, i: (
+        '/posting/commentofcomment', {'comment_id': c.comment(i), 'content': 'bench reply'}, c.user(i)
+    )),
+    Route('reply_list', 'posting/commentofcomment', 'GET', lambda c, i: (
+        '/posting/commentofcomment?comment-id={}'.format(c.comment(i)), None, None
+    )),
+    Route('like_toggle', 'posting/like/<int:posting_id>', 'POST', lambda c, i: (
+        '/posting/like/{}'.format(c.posting(i)[0]), None, c.user(i)
+    )),
+    Route('like_list', 'posting/like/<int:posting_id>', 'GET', lambda c, i: (
+        '/posting/like/{}'.format(c.posting(i)[0]), None, None
+    )),
+    Route('relationship', 'posting/relationship', 'GET', lambda c, i: (
+        '/posting/relationship?posting-ids={}&user-ids={}'.format(
+            ','.join(str(c.posting(i, n)[0]) for n in range(20)), ','.join(str(c.user(i, n)) for n in range(1, 21))
+        ), None, c.user(i)
+    )),
+    Route('search', 'posting/search', 'GET', lambda c, i: (
+        '/posting/search?q=w{}'.format(i % 10), None, None
+    )),
+    Route('tag', 'posting/tag/<str:name>', 'GET', lambda c, i: (
+        '/posting/tag/{}'.format(c.tag(i)), None, None
+    )),
+    Route('trending_tag', 'posting/trending/tag', 'GET', lambda c, i: (
+        '/posting/trending/tag', None, None
+    )),
+    # 지우는 route 는 다른 route 가 쓰는 seed data 를 건드리지 않도록 benchmark 중에 만든 row 를 지운다.
+    Route('comment_delete', 'posting/comment/<int:comment_id>', 'DELETE', lambda c, i: (
+        '/posting/comment/{}'.format(c.created(Comment, i)[0]), None, c.created(Comment, i)[1]
+    )),
+    Route('posting_delete', 'posting/<int:posting_id>', 'DELETE', lambda c, i: (
+        '/posting/{}'.format(c.created(Posting, i)[0]), None, c.created(Posting, i)[1]
+    )),
+]
+
+
+def endpoints():
+    """posting, user url 의 pattern 마다 (view 이름, method) 목록."""
+    for prefix, module in (('posting', posting_urls), ('user', user_urls)):
+        for pattern in module.urlpatterns:
+            view = pattern.callback.view_class
+            yield prefix + str(pattern.pattern), [
+                (view.__name__, method.upper())
+                for method in view.http_method_names
+                if method != 'options' and hasattr(view, method)
+            ]
+
+
+def uncovered():
+    """ROUTES 가 요청하지 않는 url pattern 과 (view, method). url 을 추가하면 ROUTES 에도 추가해야 한다."""
+    patterns = dict(endpoints())
+    covered  = {(patterns[route.pattern][0][0], route.method) for route in ROUTES if route.pattern in patterns}
+    missing  = [pattern for pattern in patterns if pattern not in {route.pattern for route in ROUTES}]
+    missing += sorted({pair for pairs in patterns.values() for pair in pairs} - covered)
+    return missing
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * ratio))] * 1000, 3)
+
+
+class Context:
+    """seed 한 user, 게시물, 댓글을 요청 번호로 고른다. 번호와 --seed 가 같으면 같은 대상을 고른다."""
+
+    def __init__(self, generator, seed):
+        self.run       = int(time.time())
+        self.seed      = seed
+        self.users     = generator.user_ids(0, generator.users)
+        posting_ids    = generator.posting_ids(0, generator.users)
+        self.postings  = list(Posting.objects.filter(id__range=(posting_ids[0], posting_ids[-1])).values_list('id', 'user_id'))
+        self.comments  = list(
+            Comment.objects
+            .filter(posting__id__range=(posting_ids[0], posting_ids[-1]), parent__isnull=True)
+            .values_list('id', flat=True)
+        )
+        self.tags      = list(Tag.objects.order_by('id').values_list('name', flat=True)[:100]) or ['nothing']
+        self.last_ids  = {model: model.objects.order_by('-id').values_list('id', flat=True).first() or 0 for model in (Posting, Comment)}
+        self._created  = {}
+        self._tokens   = {}
+
+    def pick(self, values, index, offset):
+        return random.Random('{}:{}:{}'.format(self.seed, index, offset)).choice(values)
+
+    def user(self, index, offset=0):
+        return self.pick(self.users, index, offset)
+
+    def posting(self, index, offset=0):
+        """(게시물 id, 작성자 id)"""
+        return self.pick(self.postings, index, offset)
+
+    def comment(self, index, offset=0):
+        return self.pick(self.comments, index, offset)
+
+    def tag(self, index):
+        return self.pick(self.tags, index, 0)
+
+    def created(self, model, index):
+        """benchmark 중에 만든 row 의 (id, 작성자 id). 없으면 seed 한 row 를 뒤에서부터 쓴다."""
+        if model not in self._created:
+            rows = model.objects.values_list('id', 'user_id')
+            self._created[model] = (
+                list(rows.filter(id__gt=self.last_ids[model]).order_by('id'))
+                or list(rows.order_by('-id')[:settings.MAX_PAGE_SIZE])
+            )
+        rows = self._created[model]
+        return rows[index % len(rows)]
+
+    def token(self, user_id):
+        if user_id not in self._tokens:
+            expire = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+            self._tokens[user_id] = jwt.encode({'user_id': user_id, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+        return self._tokens[user_id]
+
+
+class Command(BaseCommand):
+    help = '가짜 social graph 를 test database 에 만들고 posting, user 의 모든 route 를 요청해서 처리량, latency, query 수를 JSON 으로 낸다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--follows', type=int, default=20, help='user 하나가 follow 하는 평균 수')
+        parser.add_argument('--follow-exponent', type=float, default=1.0, help='follow 대상을 고르는 Zipf 지수. 0 이면 균등하게 고른다.')
+        parser.add_argument('--posts', type=int, default=5, help='user 하나의 게시물 수')
+        parser.add_argument('--images', type=int, default=2, help='게시물 하나의 이미지 수')
+        parser.add_argument('--likes', type=int, default=10, help='게시물 하나의 좋아요 수')
+        parser.add_argument('--comments', type=int, default=3, help='게시물 하나의 최상위 댓글 수')
+        parser.add_argument('--replies', type=int, default=1, help='댓글 하나의 대댓글 수')
+        parser.add_argument('--requests', type=int, default=100, help='route 마다 재는 요청 수')
+        parser.add_argument('--warmup', type=int, default=5, help='route 마다 재기 전에 보내는 요청 수')
+        parser.add_argument('--routes', help='쉼표로 구분한 route 이름. 없으면 모두 요청한다.')
+        parser.add_argument('--bcrypt-rounds', type=int, default=settings.BCRYPT_ROUNDS)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keepdb', action='store_true', help='test database 를 지우지 않고 다시 쓴다.')
+        parser.add_argument('--baseline', help='예전 실행 결과(이 command 의 출력) 파일. route 마다 변화량을 같이 낸다.')
+        parser.add_argument('--max-regression', type=float, help='p95 가 baseline 의 이 배수를 넘거나 query 수가 늘면 실패한다.')
+        parser.add_argument(
+            '--conn-max-age', type=int,
+            help='connection 을 다시 쓰는 시간(초). 0 이면 요청마다 연결한다. 없으면 DATABASES 설정을 쓴다. '
+                 '(SQLite in-memory test DB 는 닫지 않으므로 TEST NAME 에 파일을 준다)'
+        )
+
+    def handle(self, *args, **options):
+        missing = uncovered()
+        if missing:
+            raise CommandError('ROUTES 에 없는 route: {}'.format(missing))
+
+        routes = ROUTES
+        if options['routes']:
+            names  = options['routes'].split(',')
+            routes = [route for route in ROUTES if route.name in names]
+
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = {result['route']: result for result in map(json.loads, file) if 'route' in result}
+
+        directory  = tempfile.mkdtemp()
+        old_config = setup_databases(0, False, keepdb=options['keepdb'])
+        if options['conn_max_age'] is not None:
+            for connection in connections.all():
+                connection.settings_dict['CONN_MAX_AGE'] = options['conn_max_age']
+                connection.close()
+        try:
+            # 요청마다 query 를 직접 세므로 metrics middleware 는 끈다.
+            with override_settings(
+                DEBUG               = False,
+                BCRYPT_ROUNDS       = options['bcrypt_rounds'],
+                METRICS_SAMPLE_RATE = 0,
+                SEARCH_INDEX_PATH   = directory + '/search.sqlite3'
+            ):
+                for alias in settings.CACHES:
+                    caches[alias].clear()
+                context = self.seed(options)
+                results = [self.measure(route, context, options) for route in routes]
+        finally:
+            teardown_databases(old_config, 0, keepdb=options['keepdb'])
+            shutil.rmtree(directory)
+
+        regressions = []
+        for result in results:
+            previous = baseline.get(result['route'])
+            if previous:
+                result['baseline_p95_ms'] = previous['p95_ms']
+                result['p95_change']      = round(result['p95_ms'] / previous['p95_ms'], 3) if previous['p95_ms'] else None
+                result['queries_change']  = round(result['queries'] - previous['queries'], 2)
+                if options['max_regression'] and (
+                    (result['p95_change'] or 0) > options['max_regression'] or result['queries_change'] > 0
+                ):
+                    regressions.append(result['route'])
+            self.write(result)
+
+        if regressions:
+            raise CommandError('baseline 보다 느려진 route: {}'.format(', '.join(regressions)))
+
+    def seed(self, options):
+        generator = Generator(
+            users           = options['users'],
+            follows         = options['follows'],
+            follow_exponent = options['follow_exponent'],
+            posts           = options['posts'],
+            images          = options['images'],
+            likes           = options['likes'],
+            comments        = options['comments'],
+            replies         = options['replies'],
+            seed            = options['seed']
+        )
+        started = time.perf_counter()
+        rows    = generator.run()
+        self.write({
+            'case'        : 'seed',
+            'vendor'      : connections['default'].vendor,
+            'conn_max_age': connections['default'].settings_dict['CONN_MAX_AGE'],
+            'options'     : {key: options[key] for key in ('users', 'follows', 'follow_exponent', 'posts', 'images', 'likes', 'comments', 'replies', 'seed')},
+            'rows'        : rows,
+            'seconds'     : round(time.perf_counter() - started, 3),
+        })
+        for connection in connections.all():
+            metrics.install(connection)
+        return Context(generator, options['seed'])
+
+    def measure(self, route, context, options):
+        client    = Client()
+        latencies = []
+        queries   = []
+        repeated  = []
+        statuses  = Counter()
+        connects  = 0
+
+        for index in range(options['warmup'] + options['requests']):
+            path, body, user_id = route.build(context, index)
+            extra               = {'HTTP_Authorization': context.token(user_id)} if user_id else {}
+            if body is not None:
+                extra.update(data=json.dumps(body), content_type='application/json')
+
+            recorder = metrics.Recorder()
+            token    = metrics.current.set(recorder)
+            opened   = pool.CONNECTS.get(('default',))
+            started  = time.perf_counter()
+            try:
+                response = client.generic(route.method, path, **extra)
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.current.reset(token)
+                # test Client 는 request_finished 에서 connection 을 닫지 않으므로 server 처럼 직접 닫는다. (CONN_MAX_AGE)
+                close_old_connections()
+
+            if index >= options['warmup']:
+                connects += pool.CONNECTS.get(('default',)) - opened
+                latencies.append(elapsed)
+                queries.append(recorder.queries)
+                repeated.append(recorder.duplicates())
+                statuses[response.status_code] += 1
+
+        return {
+            'route'            : route.name,
+            'method'           : route.method,
+            'pattern'          : route.pattern,
+            'requests'         : len(latencies),
+            'throughput'       : round(len(latencies) / sum(latencies), 2),
+            'p50_ms'           : percentile(latencies, 0.50),
+            'p95_ms'           : percentile(latencies, 0.95),
+            'p99_ms'           : percentile(latencies, 0.99),
+            'queries'          : round(sum(queries) / len(queries), 2),
+            'max_queries'      : max(queries),
+            'duplicate_queries': round(sum(repeated) / len(repeated), 2),
+            'connects'         : round(connects / len(latencies), 2),
+            'statuses'         : {str(status): count for status, count in sorted(statuses.items())},
+        }
+
+    def write(self, result):
+        self.stdout.write(json.dumps(result))
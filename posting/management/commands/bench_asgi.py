@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import subprocess
+
+from concurrent.futures          import ThreadPoolExecutor
+
+from django.conf                 import settings
+from django.core.management.base import BaseCommand
+from django.test                 import Client, AsyncClient
+
+from user.models                 import User
+from posting.models              import Posting
+from westagram_project.testing   import bench_databases
+
+
+def percentile(values, rate):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * rate))]
+
+
+def summary(latencies, elapsed):
+    return {
+        'requests'  : len(latencies),
+        'seconds'   : round(elapsed, 4),
+        'throughput': round(len(latencies) / elapsed, 2),
+        'p50_ms'    : round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms'    : round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms'    : round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+class Command(BaseCommand):
+    help = '높은 동시성에서 WSGI(동기 view)와 ASGI(async view) 처리량을 비교한다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['both', 'wsgi', 'asgi'], default='both')
+        parser.add_argument('--path', help='요청할 경로. 없으면 benchmark 용 게시물을 만들어서 쓴다. (test database 에서 요청한다)')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--wsgi-workers', type=int, default=8, help='WSGI 서버의 worker thread 수')
+        parser.add_argument('--client-delay', type=float, default=0.01, help='느린 client 가 요청을 보내는 데 걸리는 시간(초)')
+
+    def handle(self, *args, **options):
+        if options['mode'] != 'both':
+            # 설정된 DB 에 쓰지 않도록 process 마다 test database 를 만들고 그 안에서 요청한다.
+            with bench_databases():
+                if not options['path']:
+                    user    = User.objects.create(email='bench-asgi@bench.bench', password='bench')
+                    posting = Posting.objects.create(user=user, content='bench')
+                    options['path'] = '/posting/{}'.format(posting.id)
+                self.stdout.write(json.dumps(self.run(options)))
+            return
+
+        # url 설정이 ASYNC_VIEWS 로 정해지므로 mode 마다 process 를 따로 띄운다.
+        for mode in ('wsgi', 'asgi'):
+            command = [
+                sys.executable, sys.argv[0], 'bench_asgi',
+                '--mode', mode,
+                '--requests', str(options['requests']),
+                '--concurrency', str(options['concurrency']),
+                '--wsgi-workers', str(options['wsgi_workers']),
+                '--client-delay', str(options['client_delay']),
+            ]
+            if options['path']:
+                command += ['--path', options['path']]
+            env    = dict(os.environ, ASYNC_VIEWS='1' if mode == 'asgi' else '0')
+            output = subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE).stdout
+            self.stdout.write(output.decode('utf-8').strip().splitlines()[-1])
+
+    def run(self, options):
+        if options['mode'] == 'asgi':
+            latencies, elapsed = asyncio.run(self.run_asgi(options))
+        else:
+            latencies, elapsed = self.run_wsgi(options)
+
+        result = summary(latencies, elapsed)
+        result.update(
+            mode        = options['mode'],
+            path        = options['path'],
+            concurrency = options['concurrency'],
+            async_views = settings.ASYNC_VIEWS
+        )
+        return result
+
+    def run_wsgi(self, options):
+        # 느린 client 를 기다리는 동안에도 WSGI worker thread 는 묶여 있다.
+        def request(_):
+            started = time.perf_counter()
+            time.sleep(options['client_delay'])
+            Client().get(options['path'])
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(options['wsgi_workers'], options['concurrency'])) as executor:
+            latencies = list(executor.map(request, range(options['requests'])))
+        return latencies, time.perf_counter() - started
+
+    async def run_asgi(self, options):
+        slots = asyncio.Semaphore(options['concurrency'])
+
+        async def request():
+            async with slots:
+                started = time.perf_counter()
+                await asyncio.sleep(options['client_delay'])
+                await AsyncClient().get(options['path'])
+                return time.perf_counter() - started
+
+        started   = time.perf_counter()
+        latencies = await asyncio.gather(*[request() for _ in range(options['requests'])])
+        return latencies, time.perf_counter() - started
@@ -0,0 +1,100 @@
+import json
+import time
+import random
+
+from django.core.management.base import BaseCommand
+from django.test                 import Client
+
+from user.models                 import User
+from posting.models              import Posting
+from posting                     import search
+from westagram_project.testing   import bench_databases
+
+EMAIL = 'bench-search@bench.bench'
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * ratio))] * 1000, 3)
+
+
+class Command(BaseCommand):
+    help = '게시물 corpus(기본 100만 개)를 test database 에 만들어 search backend 의 index, 검색 시간을 잰다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--postings', type=int, default=1000000)
+        parser.add_argument('--vocabulary', type=int, default=50000, help='corpus 에 쓰는 단어 수. 빈도는 Zipf 분포를 따른다.')
+        parser.add_argument('--words', type=int, default=20, help='게시물 하나의 단어 수')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        vocabulary = ['w{}'.format(index) for index in range(options['vocabulary'])]
+        weights    = [1 / (rank + 1) for rank in range(options['vocabulary'])]
+
+        # 운영 DB 와 index 파일을 건드리지 않도록 test database 와 임시 index 에 만든다.
+        with bench_databases():
+            user = User.objects.create(email=EMAIL, password='bench')
+            self.build(user, vocabulary, weights, options)
+            self.query(vocabulary, options)
+
+    def build(self, user, vocabulary, weights, options):
+        backend     = search.backend()
+        insert_time = index_time = 0
+        for start in range(0, options['postings'], options['batch_size']):
+            size     = min(options['batch_size'], options['postings'] - start)
+            contents = [' '.join(random.choices(vocabulary, weights, k=options['words'])) for _ in range(size)]
+
+            started = time.perf_counter()
+            Posting.objects.bulk_create([Posting(user=user, content=content) for content in contents])
+            insert_time += time.perf_counter() - started
+
+            # bulk_create 는 signal 을 보내지 않으므로 직접 index 한다. (MySQL FULLTEXT 는 insert 할 때 같이 만들어진다)
+            started = time.perf_counter()
+            if isinstance(backend, search.LocalIndex):
+                rows = Posting.objects.filter(user=user).order_by('-id').values_list('id', 'content')[:size]
+                backend.index_many('posting', list(rows))
+            index_time += time.perf_counter() - started
+
+        self.write(
+            case      = 'build',
+            backend   = type(backend).__name__,
+            postings  = options['postings'],
+            insert_s  = round(insert_time, 3),
+            index_s   = round(index_time, 3),
+            per_sec   = round(options['postings'] / index_time) if index_time else None
+        )
+
+    def query(self, vocabulary, options):
+        client  = Client()
+        queries = {
+            'common'   : vocabulary[0],
+            'middle'   : vocabulary[len(vocabulary) // 100],
+            'rare'     : vocabulary[-1],
+            'two_terms': '{} {}'.format(vocabulary[1], vocabulary[len(vocabulary) // 10]),
+        }
+
+        for name, query in queries.items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                search.search('posting', query, 0, 20)
+                timings.append(time.perf_counter() - started)
+
+            started  = time.perf_counter()
+            response = client.get('/posting/search', {'q': query})
+            endpoint = time.perf_counter() - started
+
+            self.write(
+                case        = 'search',
+                query       = name,
+                p50_ms      = percentile(timings, 0.5),
+                p99_ms      = percentile(timings, 0.99),
+                endpoint_ms = round(endpoint * 1000, 3),
+                results     = len(response.json()['posting_list'])
+            )
+
+    def write(self, **result):
+        self.stdout.write(json.dumps(result))
@@ -0,0 +1,120 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.http                 import JsonResponse as DjangoJsonResponse
+from django.test                 import Client
+from django.test.utils           import override_settings
+
+from user.models                 import User
+from westagram_project           import renderers
+from posting.models              import Posting, Image, Comment, Like
+from westagram_project.testing   import bench_databases
+
+EMAIL = 'bench-serialization@bench.bench'
+
+
+def measure(func, repeat):
+    """func 를 repeat 번 실행하고 평균 ms 와 마지막 결과를 돌려준다."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return round((time.perf_counter() - started) / repeat * 1000, 3), result
+
+
+class Command(BaseCommand):
+    help = 'test database 에 목록 data 를 만들고 목록 API 의 serialization 비용을 endpoint, JSON backend 별로 잰다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='endpoint 마다 만들 댓글, 좋아요, 대댓글 수')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--backends', default='json,orjson', help='쉼표로 구분한 JSON_BACKEND 목록')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        with bench_databases():
+            user    = User.objects.create(email=EMAIL, password='bench')
+            posting = Posting.objects.create(user=user, content='bench')
+            Image.objects.bulk_create([Image(posting=posting, image='http://bench.bench/{}'.format(index)) for index in range(5)])
+            User.objects.bulk_create([
+                User(email='bench-serialization-{}@bench.bench'.format(index), password='bench')
+                for index in range(rows)
+            ])
+            users = User.objects.filter(email__startswith='bench-serialization-')
+            Like.objects.bulk_create([Like(user=liker, posting=posting) for liker in users])
+            Comment.objects.bulk_create([Comment(user=user, posting=posting, content='comment') for _ in range(rows)])
+            Comment.objects.fill_paths(posting=posting)
+            comment = Comment.objects.filter(posting=posting).first()
+            Comment.objects.bulk_create([
+                Comment(user=user, posting=posting, parent=comment, root=comment, depth=1, content='reply')
+                for _ in range(rows)
+            ])
+            Comment.objects.fill_paths(parent=comment)
+
+            self.render(posting, options)
+            self.endpoints(posting, comment, options)
+
+    def render(self, posting, options):
+        """DB 를 제외한 순수 serialization 비용. model instance + strftime + JsonResponse 와 values_list 경로를 비교한다."""
+        comments = list(Comment.objects.filter(posting=posting, parent__isnull=True))
+        values   = list(Comment.objects.filter(posting=posting, parent__isnull=True).values_list('id', 'content', 'user_id', 'created_at'))
+
+        def legacy():
+            return DjangoJsonResponse({'comment_data': [{
+                'id'        : data.id,
+                'content'   : data.content,
+                'user_id'   : data.user_id,
+                'posting_id': posting.id,
+                'created_at': data.created_at.strftime('%Y-%m-%d %H:%M')
+            } for data in comments]}).content
+
+        def fast():
+            return renderers.dumps({'comment_data': [{
+                'id'        : id,
+                'content'   : content,
+                'user_id'   : user_id,
+                'posting_id': posting.id,
+                'created_at': renderers.minutes(created_at)
+            } for id, content, user_id, created_at in values]})
+
+        elapsed, expected = measure(legacy, options['repeat'])
+        self.write(case='render', path='legacy', rows=len(comments), ms=elapsed, bytes=len(expected))
+
+        for name in options['backends'].split(','):
+            with override_settings(JSON_BACKEND=name):
+                elapsed, content = measure(fast, options['repeat'])
+                self.write(
+                    case      = 'render',
+                    path      = 'values_list',
+                    backend   = renderers.backend(),
+                    rows      = len(values),
+                    ms        = elapsed,
+                    bytes     = len(content),
+                    identical = content == expected
+                )
+
+    def endpoints(self, posting, comment, options):
+        """endpoint 전체(DB 포함) 응답 시간. page 크기는 --rows 까지 늘린다."""
+        paths = {
+            'posting_detail'  : '/posting/{}'.format(posting.id),
+            'posting_list'    : '/posting/list/{}'.format(posting.user_id),
+            'comment_list'    : '/posting/comment?posting-id={}&limit={}'.format(posting.id, options['rows']),
+            'like_list'       : '/posting/like/{}?limit={}'.format(posting.id, options['rows']),
+            'commentofcomment': '/posting/commentofcomment?comment-id={}&limit={}'.format(comment.id, options['rows']),
+        }
+        client = Client()
+
+        for name in options['backends'].split(','):
+            with override_settings(JSON_BACKEND=name, MAX_PAGE_SIZE=options['rows']):
+                for endpoint, path in paths.items():
+                    elapsed, response = measure(lambda: client.get(path), options['repeat'])
+                    self.write(
+                        case     = 'endpoint',
+                        endpoint = endpoint,
+                        backend  = renderers.backend(),
+                        ms       = elapsed,
+                        bytes    = len(response.content)
+                    )
+
+    def write(self, **result):
+        self.stdout.write(json.dumps(result))
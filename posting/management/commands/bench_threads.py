@@ -0,0 +1,108 @@
+import json
+import time
+
+from collections                 import deque
+
+from django.core.management.base import BaseCommand
+from django.db                   import connection
+from django.db.models            import Max
+from django.test                 import Client
+from django.test.utils           import CaptureQueriesContext, override_settings
+
+from user.models                 import User
+from posting.models              import Posting, Comment, path_segment
+from westagram_project.testing   import bench_databases
+
+EMAIL = 'bench-threads@bench.bench'
+
+
+class Command(BaseCommand):
+    help = '큰 댓글 트리(기본 10k 개)를 test database 에 만들고 대댓글 목록을 하나씩 읽는 방식과 thread API 를 비교한다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=10000, help='만들 댓글 수')
+        parser.add_argument('--roots', type=int, default=100, help='최상위 댓글 수')
+        parser.add_argument('--fanout', type=int, default=3, help='댓글 하나에 달리는 대댓글 수')
+        parser.add_argument('--branches', type=int, default=20, help='thread API 가 한 번에 읽는 최상위 댓글 수')
+        parser.add_argument('--replies', type=int, default=5, help='thread API 가 최상위 댓글마다 읽는 대댓글 수')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with bench_databases():
+            user    = User.objects.create(email=EMAIL, password='bench')
+            posting = Posting.objects.create(user=user, content='bench')
+            roots   = self.build(posting, options)
+
+            # 최상위 댓글 목록 + 최상위 댓글마다 대댓글 목록 (예전 CommentOfComment 방식)
+            def per_comment(client):
+                paths = ['/posting/comment?posting-id={}&limit={}'.format(posting.id, options['branches'])]
+                paths += ['/posting/commentofcomment?comment-id={}&limit={}'.format(root, options['replies'])
+                          for root in roots[:options['branches']]]
+                return [client.get(path) for path in paths]
+
+            cases = {
+                'per_comment': per_comment,
+                'branches'   : lambda client: [client.get('/posting/comment/thread?posting-id={}&limit={}&replies={}'.format(
+                    posting.id, options['branches'], options['replies']
+                ))],
+                'subtree'    : lambda client: [client.get('/posting/comment/thread?comment-id={}'.format(roots[0]))],
+            }
+
+            with override_settings(MAX_PAGE_SIZE=options['nodes']):
+                for name, case in cases.items():
+                    self.stdout.write(json.dumps(dict(self.measure(case, options['repeat']), case=name)))
+
+    def build(self, posting, options):
+        """id 를 미리 정해서 path 까지 채운 트리를 bulk_create 한다. 최상위 댓글 id 목록을 돌려준다."""
+        next_id  = (Comment.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        comments = []
+        queue    = deque()
+
+        for _ in range(min(options['roots'], options['nodes'])):
+            comment = Comment(
+                id      = next_id,
+                posting = posting,
+                user_id = posting.user_id,
+                path    = path_segment(next_id),
+                content = 'root'
+            )
+            comments.append(comment)
+            queue.append(comment)
+            next_id += 1
+
+        while len(comments) < options['nodes']:
+            parent = queue.popleft()
+            for _ in range(min(options['fanout'], options['nodes'] - len(comments))):
+                comment = Comment(
+                    id        = next_id,
+                    posting   = posting,
+                    user_id   = posting.user_id,
+                    parent_id = parent.id,
+                    root_id   = parent.root_id or parent.id,
+                    depth     = parent.depth + 1,
+                    path      = parent.path + path_segment(next_id),
+                    content   = 'reply'
+                )
+                comments.append(comment)
+                queue.append(comment)
+                next_id += 1
+
+        Comment.objects.bulk_create(comments, batch_size=1000)
+        return [comment.id for comment in comments if comment.parent_id is None]
+
+    def measure(self, case, repeat):
+        client = Client()
+        case(client)
+
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                responses = case(client)
+            elapsed = time.perf_counter() - started
+
+        return {
+            'requests': len(responses),
+            'queries' : len(context) // repeat,
+            'ms'      : round(elapsed / repeat * 1000, 3),
+            'bytes'   : sum(len(response.content) for response in responses),
+        }
@@ -0,0 +1,30 @@
+from django.core.management.base  import BaseCommand
+
+from westagram_project.pagination import iterate
+from posting                      import search
+
+
+class Command(BaseCommand):
+    help = '게시물, 댓글 table 에서 search index 를 처음부터 다시 만든다. (MySQL FULLTEXT backend 는 할 일이 없다)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = search.backend()
+        if not isinstance(backend, search.LocalIndex):
+            self.stdout.write('search backend is {}, nothing to rebuild'.format(type(backend).__name__))
+            return
+
+        for kind, model in search.MODELS.items():
+            backend.clear(kind)
+
+            count, chunk = 0, []
+            for row in iterate(model.objects.values_list('id', 'content'), ('id',), options['batch_size']):
+                chunk.append(row)
+                if len(chunk) >= options['batch_size']:
+                    backend.index_many(kind, chunk)
+                    count, chunk = count + len(chunk), []
+            backend.index_many(kind, chunk)
+
+            self.stdout.write('indexed {} {}s'.format(count + len(chunk), kind))
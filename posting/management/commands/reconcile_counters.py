@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db                   import transaction
+from django.db.models            import Count
+
+from user.models                 import User, Follow, UserCounter
+from posting.models              import Posting, Comment, Like, PostingCounter, Tag, PostingTag, TagCounter
+
+
+def count_by(queryset, field, ids):
+    rows = (
+        queryset
+        .filter(**{field + '__in': ids})
+        .values(field)
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return {row[field]: row['count'] for row in rows}
+
+
+class Command(BaseCommand):
+    help = '좋아요/댓글/follow/tag 원본 table 에서 counter 를 다시 계산한다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        postings = self.reconcile(Posting, PostingCounter, 'posting_id', batch_size, lambda ids: {
+            'likes'   : count_by(Like.objects, 'posting_id', ids),
+            'comments': count_by(Comment.objects.filter(parent__isnull=True), 'posting_id', ids),
+            'replies' : count_by(Comment.objects.filter(parent__isnull=False), 'posting_id', ids),
+        })
+        users = self.reconcile(User, UserCounter, 'user_id', batch_size, lambda ids: {
+            'followers': count_by(Follow.objects, 'to_user_id', ids),
+            'following': count_by(Follow.objects, 'from_user_id', ids),
+            'posts'    : count_by(Posting.objects, 'user_id', ids),
+        })
+
+        tags = self.reconcile(Tag, TagCounter, 'tag_id', batch_size, lambda ids: {
+            'postings': count_by(PostingTag.objects, 'tag_id', ids),
+        })
+
+        self.stdout.write('reconciled {} postings, {} users, {} tags'.format(postings, users, tags))
+
+    def reconcile(self, model, counter_model, owner, batch_size, count):
+        """owner id 를 batch 단위로 나눠서 shard 들을 합계 하나(shard 0)로 덮어쓴다.
+
+        MySQL(InnoDB)은 잠근 범위에 새 shard row 를 insert 하는 것도 막는다. SQLite 는 write lock 하나로 직렬화된다.
+        """
+        last_id = 0
+        total   = 0
+
+        while True:
+            ids = list(
+                model.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+
+            with transaction.atomic():
+                # 센 뒤 지우기 전에 더해진 값이 사라지지 않도록 shard row 를 먼저 잠그고 센다.
+                # 잠근 동안 들어온 increment 는 이 transaction 이 commit 된 뒤에 새 값에 더해진다.
+                list(counter_model.objects.select_for_update().filter(**{owner + '__in': ids}).values_list('id', flat=True))
+                counts = count(ids)
+                counter_model.objects.filter(**{owner + '__in': ids}).delete()
+                counter_model.objects.bulk_create([counter_model(
+                    **{owner: owner_id},
+                    shard=0,
+                    **{field: values.get(owner_id, 0) for field, values in counts.items()}
+                ) for owner_id in ids])
+
+            last_id = ids[-1]
+            total  += len(ids)
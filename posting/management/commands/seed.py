@@ -0,0 +1,133 @@
+import json
+import time
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db                   import connection, connections
+
+from posting                     import search
+from posting.synthetic           import Generator
+
+# vendor 별 한 번에 insert 하는 row 수. SQLite 는 Django 가 query parameter 999 개 안으로 다시 나눈다.
+BATCH_SIZES = {
+    'mysql' : 5000,
+    'sqlite': 2000,
+}
+
+# SQLite 에서 worker 가 다른 worker 의 write 를 기다리는 최대 시간(ms)
+LOCK_TIMEOUT = 600000
+
+# fork 한 worker 가 쓰는 generator. fork 전에 정해둔다.
+generator = None
+
+
+def tune():
+    """대량 insert 하는 동안만 쓰는 session 설정. 만드는 data 는 generator 가 정합성을 맞춘다."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # 전원이 나가지 않는 한 안전하다. commit 마다 fsync 하지 않는다. (transaction 안에서는 바꿀 수 없다)
+            if not connection.in_atomic_block:
+                cursor.execute('PRAGMA synchronous = OFF')
+            # SQLite 는 writer 가 하나뿐이라 worker 끼리 lock 을 기다려야 한다.
+            cursor.execute('PRAGMA busy_timeout = {}'.format(LOCK_TIMEOUT))
+        elif connection.vendor == 'mysql':
+            cursor.execute('SET unique_checks = 0, foreign_key_checks = 0')
+
+    backend = search.backend()
+    if isinstance(backend, search.LocalIndex):
+        # 다른 worker 가 index 에 batch 하나를 다 쓸 때까지 기다린다. (SEARCH_INDEX_TIMEOUT 은 요청 하나 기준이다)
+        backend.db.execute('PRAGMA busy_timeout = {}'.format(LOCK_TIMEOUT))
+
+
+def run(task):
+    phase, start, stop = task
+    tune()
+    return getattr(generator, 'create_' + phase)(start, stop)
+
+
+class Command(BaseCommand):
+    help = 'User, Follow, Posting, Image, Comment(대댓글 포함), Like 를 대량으로 만들고 단계별 초당 row 수를 낸다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=50, help='user 하나가 follow 하는 평균 수')
+        parser.add_argument('--follow-exponent', type=float, default=1.0, help='follow 대상을 고르는 Zipf 지수. 0 이면 균등하게 고른다.')
+        parser.add_argument('--posts', type=int, default=10, help='user 하나의 게시물 수')
+        parser.add_argument('--images', type=int, default=1, help='게시물 하나의 이미지 수')
+        parser.add_argument('--likes', type=int, default=10, help='게시물 하나의 좋아요 수')
+        parser.add_argument('--comments', type=int, default=2, help='게시물 하나의 최상위 댓글 수')
+        parser.add_argument('--replies', type=int, default=1, help='댓글 하나의 대댓글 수')
+        parser.add_argument('--batch-size', type=int, help='bulk_create 한 번에 넣는 row 수. 없으면 vendor 별 기본값(BATCH_SIZES)')
+        parser.add_argument('--chunk-users', type=int, default=1000, help='worker 에 한 번에 나눠주는 user 수')
+        parser.add_argument('--workers', type=int, default=1, help='1 보다 크면 process 를 나눠서 만든다.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        global generator
+
+        if options['workers'] > 1 and connection.vendor == 'sqlite' and connection.creation.is_in_memory_db(connection.settings_dict['NAME']):
+            raise CommandError('in-memory SQLite 는 process 끼리 나눠 쓸 수 없다.')
+
+        generator = Generator(
+            users           = options['users'],
+            follows         = options['follows'],
+            follow_exponent = options['follow_exponent'],
+            posts           = options['posts'],
+            images          = options['images'],
+            likes           = options['likes'],
+            comments        = options['comments'],
+            replies         = options['replies'],
+            batch_size      = options['batch_size'] or BATCH_SIZES.get(connection.vendor, 1000),
+            seed            = options['seed']
+        )
+        # chunk 경계가 같으면 worker 수와 상관없이 같은 data 가 나온다.
+        chunks = [
+            (start, min(start + options['chunk_users'], options['users']))
+            for start in range(0, options['users'], options['chunk_users'])
+        ]
+
+        pool = None
+        if options['workers'] > 1:
+            # worker 가 부모의 DB connection 을 같이 쓰지 않도록 닫고 fork 한다.
+            connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(options['workers'])
+
+        totals  = {}
+        started = time.perf_counter()
+        try:
+            # 단계마다 앞 단계가 모든 user 에 대해 끝나야 한다. (ex. follower 수로 fan-out 여부를 정한다)
+            for phase in Generator.PHASES:
+                phase_started = time.perf_counter()
+                tasks         = [(phase, start, stop) for start, stop in chunks]
+                rows          = {}
+                for result in (pool.imap_unordered(run, tasks) if pool else map(run, tasks)):
+                    for table, count in result.items():
+                        rows[table] = rows.get(table, 0) + count
+
+                seconds = time.perf_counter() - phase_started
+                self.write(phase=phase, rows=rows, seconds=seconds)
+                for table, count in rows.items():
+                    totals[table] = totals.get(table, 0) + count
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        self.write(
+            phase      = 'total',
+            rows       = totals,
+            seconds    = time.perf_counter() - started,
+            workers    = options['workers'],
+            batch_size = generator.batch_size,
+            first_ids  = generator.first_ids
+        )
+
+    def write(self, phase, rows, seconds, **extra):
+        total = sum(rows.values())
+        self.stdout.write(json.dumps(dict(
+            phase        = phase,
+            rows         = rows,
+            seconds      = round(seconds, 3),
+            rows_per_sec = round(total / seconds) if seconds else None,
+            **extra
+        )))
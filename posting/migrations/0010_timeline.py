@@ -0,0 +1,40 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_auto_20201004_0542'),
+        ('posting', '0009_auto_20201014_0410'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Timeline',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='user.user')),
+                ('posting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posting.posting')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='user.user')),
+            ],
+            options={
+                'db_table': 'timelines',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timeline',
+            index=models.Index(fields=['user', '-created_at', '-posting'], name='timelines_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeline',
+            index=models.Index(fields=['user', 'author'], name='timelines_author_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timeline',
+            unique_together={('user', 'posting')},
+        ),
+    ]
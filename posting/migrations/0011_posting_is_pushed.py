@@ -0,0 +1,22 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posting', '0010_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posting',
+            name='is_pushed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='posting',
+            index=models.Index(fields=['user', 'is_pushed', '-created_at'], name='postings_pull_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posting', '0011_posting_is_pushed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostingCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('likes', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('replies', models.IntegerField(default=0)),
+                ('posting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posting.posting')),
+            ],
+            options={
+                'db_table': 'posting_counters',
+                'unique_together': {('posting', 'shard')},
+            },
+        ),
+    ]
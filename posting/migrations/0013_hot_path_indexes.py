@@ -0,0 +1,44 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:28
+
+from django.db        import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    Like       = apps.get_model('posting', 'Like')
+    duplicates = (
+        Like.objects
+        .values('user_id', 'posting_id')
+        .annotate(first_id=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        Like.objects.filter(
+            user_id    = duplicate['user_id'],
+            posting_id = duplicate['posting_id'],
+            id__gt     = duplicate['first_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_unique_email_follow'),
+        ('posting', '0012_postingcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='like',
+            unique_together={('user', 'posting')},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['posting', 'created_at'], name='comments_posting_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='posting',
+            index=models.Index(fields=['user', 'created_at'], name='postings_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:50
+
+from django.db                  import migrations, models
+from django.db.models           import Value
+from django.db.models.functions import Cast, Concat, LPad
+import django.db.models.deletion
+
+# posting.models.PATH_WIDTH
+PATH_WIDTH = 10
+BATCH_SIZE = 1000
+
+
+def padded(field):
+    return LPad(Cast(field, models.CharField()), PATH_WIDTH, Value('0'))
+
+
+def move_replies(apps, schema_editor):
+    Comment          = apps.get_model('posting', 'Comment')
+    CommentOfComment = apps.get_model('posting', 'CommentOfComment')
+
+    # 지금까지의 댓글은 모두 최상위 댓글이다.
+    Comment.objects.update(path=Concat(padded('id'), Value('/')))
+
+    replies = CommentOfComment.objects.select_related('comment').order_by('id').iterator(chunk_size=BATCH_SIZE)
+    batch   = []
+    for reply in replies:
+        batch.append(Comment(
+            posting_id = reply.comment.posting_id,
+            user_id    = reply.user_id,
+            parent_id  = reply.comment_id,
+            root_id    = reply.comment_id,
+            depth      = 1,
+            content    = reply.content
+        ))
+        if len(batch) >= BATCH_SIZE:
+            Comment.objects.bulk_create(batch)
+            batch = []
+    Comment.objects.bulk_create(batch)
+
+    Comment.objects.filter(parent__isnull=False, path='').update(
+        path=Concat(padded('root_id'), Value('/'), padded('id'), Value('/'))
+    )
+
+
+def restore_replies(apps, schema_editor):
+    Comment          = apps.get_model('posting', 'Comment')
+    CommentOfComment = apps.get_model('posting', 'CommentOfComment')
+
+    # 대댓글의 대댓글은 되돌릴 곳이 없으므로 최상위 댓글의 대댓글로 옮긴다.
+    replies = Comment.objects.filter(root__isnull=False).order_by('path')
+    CommentOfComment.objects.bulk_create([
+        CommentOfComment(comment_id=reply.root_id, user_id=reply.user_id, content=reply.content)
+        for reply in replies.iterator(chunk_size=BATCH_SIZE)
+    ], batch_size=BATCH_SIZE)
+    replies.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posting', '0013_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='posting.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='root',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='descendants', to='posting.comment'),
+        ),
+        migrations.RunPython(move_replies, restore_replies),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['posting', 'path'], name='comments_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['root', 'path'], name='comments_root_path_idx'),
+        ),
+        migrations.RemoveField(
+            model_name='commentofcomment',
+            name='comment',
+        ),
+        migrations.RemoveField(
+            model_name='commentofcomment',
+            name='user',
+        ),
+        migrations.DeleteModel(
+            name='CommentOfComment',
+        ),
+    ]
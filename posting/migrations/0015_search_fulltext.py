@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# (table, index) - MySQL 에서만 만든다. 다른 DB 는 posting.search.LocalIndex 를 쓴다.
+FULLTEXT_INDEXES = [
+    ('postings', 'postings_content_ft'),
+    ('comments', 'comments_content_ft'),
+]
+
+
+def add_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table, name in FULLTEXT_INDEXES:
+        # 한글은 띄어쓰기만으로 단어가 나뉘지 않으므로 ngram parser 를 쓴다.
+        schema_editor.execute('ALTER TABLE {} ADD FULLTEXT INDEX {} (content) WITH PARSER ngram'.format(table, name))
+
+
+def remove_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table, name in FULLTEXT_INDEXES:
+        schema_editor.execute('ALTER TABLE {} DROP INDEX {}'.format(table, name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posting', '0014_comment_tree'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fulltext, remove_fulltext),
+    ]
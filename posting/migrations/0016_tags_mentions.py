@@ -0,0 +1,150 @@
+# Generated by Django 3.1.1 on 2026-10-18 15:31
+
+import re
+
+from collections import Counter
+
+from django.db   import migrations, models
+import django.db.models.deletion
+
+# posting.tags 의 pattern 과 같다.
+TAG_PATTERN         = re.compile(r'#(\w+)')
+MENTION_PATTERN     = re.compile(r'@([\w.+-]+@[\w-]+(?:\.[\w-]+)+)')
+TAG_MAX_LENGTH      = 100
+TAG_MAX_PER_POSTING = 30
+BATCH_SIZE          = 1000
+
+
+def parse_existing(apps, schema_editor):
+    """이미 있는 게시물 본문에서 hashtag, mention 을 채운다. 인기 tag bucket 은 채우지 않는다."""
+    Posting    = apps.get_model('posting', 'Posting')
+    Tag        = apps.get_model('posting', 'Tag')
+    PostingTag = apps.get_model('posting', 'PostingTag')
+    TagCounter = apps.get_model('posting', 'TagCounter')
+    Mention    = apps.get_model('posting', 'Mention')
+    User       = apps.get_model('user', 'User')
+
+    counts = Counter()
+    tags   = {}
+    rows   = Posting.objects.exclude(content=None).order_by('id').values_list('id', 'content', 'created_at')
+    for start in range(0, rows.count(), BATCH_SIZE):
+        chunk    = list(rows[start:start + BATCH_SIZE])
+        names    = {
+            id: list(dict.fromkeys(name.lower() for name in TAG_PATTERN.findall(content) if len(name) <= TAG_MAX_LENGTH))[:TAG_MAX_PER_POSTING]
+            for id, content, _ in chunk
+        }
+        mentions = {id: list(dict.fromkeys(MENTION_PATTERN.findall(content))) for id, content, _ in chunk}
+
+        missing = {name for values in names.values() for name in values} - tags.keys()
+        Tag.objects.bulk_create([Tag(name=name) for name in missing])
+        tags.update(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+
+        PostingTag.objects.bulk_create([
+            PostingTag(posting_id=id, tag_id=tags[name], created_at=created_at)
+            for id, _, created_at in chunk
+            for name in names[id]
+        ])
+        counts.update(tags[name] for values in names.values() for name in values)
+
+        users = dict(User.objects.filter(email__in={email for values in mentions.values() for email in values}).values_list('email', 'id'))
+        Mention.objects.bulk_create([
+            Mention(posting_id=id, user_id=users[email])
+            for id, values in mentions.items()
+            for email in values
+            if email in users
+        ])
+
+    TagCounter.objects.bulk_create([TagCounter(tag_id=tag_id, shard=0, postings=count) for tag_id, count in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_unique_email_follow'),
+        ('posting', '0015_search_fulltext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'tags',
+            },
+        ),
+        migrations.CreateModel(
+            name='TagActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posting.tag')),
+            ],
+            options={
+                'db_table': 'tag_activities',
+            },
+        ),
+        migrations.CreateModel(
+            name='PostingTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('posting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posting.posting')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posting.tag')),
+            ],
+            options={
+                'db_table': 'posting_tags',
+            },
+        ),
+        migrations.CreateModel(
+            name='Mention',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('comment', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='posting.comment')),
+                ('posting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posting.posting')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='user.user')),
+            ],
+            options={
+                'db_table': 'mentions',
+            },
+        ),
+        migrations.CreateModel(
+            name='TagCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('postings', models.IntegerField(default=0)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posting.tag')),
+            ],
+            options={
+                'db_table': 'tag_counters',
+                'unique_together': {('tag', 'shard')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tagactivity',
+            index=models.Index(fields=['bucket', 'tag'], name='tag_activities_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tagactivity',
+            unique_together={('tag', 'bucket')},
+        ),
+        migrations.AddIndex(
+            model_name='postingtag',
+            index=models.Index(fields=['tag', '-created_at', '-id'], name='posting_tags_tag_created_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='postingtag',
+            unique_together={('posting', 'tag')},
+        ),
+        migrations.AddIndex(
+            model_name='mention',
+            index=models.Index(fields=['user', '-created_at'], name='mentions_user_created_idx'),
+        ),
+        migrations.RunPython(parse_existing, migrations.RunPython.noop),
+    ]
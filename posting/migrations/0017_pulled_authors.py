@@ -0,0 +1,61 @@
+# Generated by Django 3.1.1 on 2026-10-18 16:28
+
+from django.conf             import settings
+from django.db               import migrations, models
+from django.db.models        import Count
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def classify_existing(apps, schema_editor):
+    """is_pushed 가 생기기 전(0011)의 게시물은 모두 push 되지 않은 채로 남아 있다.
+
+    follower 가 FEED_FANOUT_THRESHOLD 이하인 작성자의 게시물은 지금 fan-out 하고 is_pushed 로 바꾸고,
+    넘는 작성자만 PulledAuthor 에 넣는다. 그래야 feed 가 모든 followee 의 게시물을 뒤지지 않는다.
+    """
+    Posting      = apps.get_model('posting', 'Posting')
+    Timeline     = apps.get_model('posting', 'Timeline')
+    PulledAuthor = apps.get_model('posting', 'PulledAuthor')
+    Follow       = apps.get_model('user', 'Follow')
+
+    author_ids = list(Posting.objects.filter(is_pushed=False).values_list('user_id', flat=True).distinct().order_by())
+    for start in range(0, len(author_ids), BATCH_SIZE):
+        chunk     = author_ids[start:start + BATCH_SIZE]
+        followers = dict(
+            Follow.objects.filter(to_user_id__in=chunk).values('to_user_id').annotate(count=Count('id')).order_by().values_list('to_user_id', 'count')
+        )
+        pulled    = [user_id for user_id in chunk if followers.get(user_id, 0) > settings.FEED_FANOUT_THRESHOLD]
+        PulledAuthor.objects.bulk_create([PulledAuthor(user_id=user_id) for user_id in pulled], ignore_conflicts=True)
+
+        for author_id in set(chunk) - set(pulled):
+            user_ids = [author_id] + list(Follow.objects.filter(to_user_id=author_id).values_list('from_user_id', flat=True))
+            postings = Posting.objects.filter(user_id=author_id, is_pushed=False).values_list('id', 'created_at')
+            Timeline.objects.bulk_create([
+                Timeline(user_id=user_id, author_id=author_id, posting_id=posting_id, created_at=created_at)
+                for posting_id, created_at in postings
+                for user_id in user_ids
+            ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+            Posting.objects.filter(user_id=author_id, is_pushed=False).update(is_pushed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_unique_email_follow'),
+        ('posting', '0016_tags_mentions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PulledAuthor',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='user.user')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'pulled_authors',
+            },
+        ),
+        migrations.RunPython(classify_existing, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,17 @@
-from django.db   import models
-from user.models import User
+from django.db                   import models, connections, transaction, IntegrityError
+from django.db.models            import Count, Value
+from django.db.models.functions  import Cast, Concat, LPad
+from user.models                 import User
+
+# materialized path 에서 댓글 id 하나가 차지하는 자리수. 0 으로 채워서 문자열 정렬이 트리 순서가 되게 한다.
+# path 는 255 자라서 깊이 22 까지 들어가므로 COMMENT_MAX_DEPTH 는 그보다 크면 안 된다.
+PATH_WIDTH = 10
 
 
 class Posting(models.Model):
     user       = models.ForeignKey('user.User', on_delete=models.CASCADE)
     content    = models.CharField(max_length=500, null=True, blank=True)
+    is_pushed  = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -13,6 +20,10 @@ class Posting(models.Model):
 
     class Meta:
         db_table = 'postings'
+        indexes  = [
+            models.Index(fields=['user', 'created_at'], name='postings_user_created_idx'),
+            models.Index(fields=['user', 'is_pushed', '-created_at'], name='postings_pull_idx'),
+        ]
 
 
 class Image(models.Model):
@@ -26,38 +37,260 @@ class Image(models.Model):
         db_table = 'images'
 
 
+def path_segment(comment_id):
+    return str(comment_id).zfill(PATH_WIDTH) + '/'
+
+
+class CommentManager(models.Manager):
+    def add(self, posting_id, user_id, content, parent=None):
+        """댓글을 만들고 path 를 채운다. parent 가 있으면 그 댓글의 대댓글이 된다."""
+        with transaction.atomic(using=self.db):
+            comment = self.create(
+                posting_id = posting_id,
+                user_id    = user_id,
+                content    = content,
+                parent     = parent,
+                root_id    = (parent.root_id or parent.id) if parent else None,
+                depth      = parent.depth + 1 if parent else 0
+            )
+            comment.path = (parent.path if parent else '') + path_segment(comment.id)
+            self.filter(id=comment.id).update(path=comment.path)
+        return comment
+
+    def fill_paths(self, parent=None, marker='', **filters):
+        """bulk_create 로 만든 댓글은 id 를 모르므로 parent 가 같고 path 가 marker 인 댓글들의 path 를 DB 에서 한 번에 채운다."""
+        self.filter(parent=parent, path=marker, **filters).update(path=Concat(
+            Value(parent.path if parent else ''),
+            LPad(Cast('id', models.CharField()), PATH_WIDTH, Value('0')),
+            Value('/')
+        ))
+
+    def first_replies(self, root_ids, limit):
+        """root 댓글마다 트리 순서로 처음 limit 개의 대댓글을 query 한 번으로 읽는다.
+
+        각 댓글의 reply_total 에는 그 root 아래 전체 대댓글 수가 들어간다.
+        window function(ROW_NUMBER, COUNT OVER)은 MySQL 8.0.2, MariaDB 10.2, SQLite 3.25 부터 쓸 수 있고
+        그보다 오래된 server 에서는 root 마다 query 를 나눠 읽는다. (first_replies_without_window)
+        """
+        if not root_ids:
+            return []
+
+        if not connections[self.db].features.supports_over_clause:
+            return self.first_replies_without_window(root_ids, limit)
+
+        sql = '''
+            SELECT * FROM (
+                SELECT {comments}.*,
+                       ROW_NUMBER() OVER (PARTITION BY {root} ORDER BY {path}) AS reply_rank,
+                       COUNT(*) OVER (PARTITION BY {root}) AS reply_total
+                FROM {comments}
+                WHERE {root} IN ({placeholders})
+            ) replies
+            WHERE reply_rank <= %s
+            ORDER BY {path}
+        '''.format(
+            comments     = self.model._meta.db_table,
+            root         = self.model._meta.get_field('root').column,
+            path         = self.model._meta.get_field('path').column,
+            placeholders = ', '.join(['%s'] * len(root_ids))
+        )
+        return list(self.raw(sql, [*root_ids, limit]))
+
+    def first_replies_without_window(self, root_ids, limit):
+        """first_replies 와 같은 결과를 window function 없이 읽는다. 대댓글 수 query 한 번과 대댓글이 있는 root 마다 query 한 번."""
+        totals = dict(
+            self.filter(root_id__in=root_ids)
+            .values('root_id')
+            .annotate(total=Count('id'))
+            .values_list('root_id', 'total')
+            .order_by()
+        )
+        replies = []
+        for root_id, total in totals.items():
+            for reply in self.filter(root_id=root_id).order_by('path')[:limit]:
+                reply.reply_total = total
+                replies.append(reply)
+        return sorted(replies, key=lambda reply: reply.path)
+
+
 class Comment(models.Model):
+    """댓글과 대댓글. parent 로 이어지는 트리이고 path 에 root 부터 자기 자신까지의 id 가 들어있다."""
     posting    = models.ForeignKey(Posting, on_delete=models.CASCADE)
     user       = models.ForeignKey('user.User', on_delete=models.CASCADE)
+    parent     = models.ForeignKey('self', on_delete=models.CASCADE, null=True, related_name='children')
+    root       = models.ForeignKey('self', on_delete=models.CASCADE, null=True, related_name='descendants')
+    path       = models.CharField(max_length=255, default='')
+    depth      = models.PositiveSmallIntegerField(default=0)
     content    = models.CharField(max_length=500)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommentManager()
+
     def __str__(self):
         return self.posting.content
     
     class Meta:
         db_table = 'comments'
+        indexes  = [
+            models.Index(fields=['posting', 'created_at'], name='comments_posting_created_idx'),
+            models.Index(fields=['posting', 'path'], name='comments_thread_idx'),
+            models.Index(fields=['root', 'path'], name='comments_root_path_idx'),
+        ]
+
+
+class LikeManager(models.Manager):
+    def toggle(self, user_id, posting_id):
+        """좋아요를 누르거나 취소하고 (liked, changed) 를 돌려준다. 게시물이 없으면 Posting.DoesNotExist.
+
+        raw SQL 이라 post_save, post_delete signal 은 보내지 않는다.
+        delete 한 번, 필요하면 게시물이 있을 때만 insert 하는 statement 한 번으로 끝난다.
+        (user, posting) unique 제약 때문에 동시에 두 번 눌러도 좋아요는 하나만 남는다.
+        """
+        table   = self.model._meta.db_table
+        user    = self.model._meta.get_field('user').column
+        posting = self.model._meta.get_field('posting').column
+
+        # Like 에 signal receiver 가 있으면 ORM delete 는 지울 row 를 먼저 SELECT 하므로 직접 DELETE 한다.
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {likes} WHERE {user} = %s AND {posting} = %s'.format(likes=table, user=user, posting=posting),
+                [user_id, posting_id]
+            )
+            if cursor.rowcount:
+                return False, True
+
+        sql = 'INSERT INTO {likes} ({user}, {posting}) SELECT %s, {id} FROM {postings} WHERE {id} = %s'.format(
+            likes    = table,
+            user     = user,
+            posting  = posting,
+            postings = Posting._meta.db_table,
+            id       = Posting._meta.pk.column
+        )
+        try:
+            with transaction.atomic(using=self.db), connections[self.db].cursor() as cursor:
+                cursor.execute(sql, [user_id, posting_id])
+                inserted = cursor.rowcount
+        except IntegrityError:
+            # 다른 요청이 먼저 좋아요를 눌렀다.
+            return True, False
+
+        if not inserted:
+            raise Posting.DoesNotExist
+        return True, True
 
 
 class Like(models.Model):
     user = models.ForeignKey('user.User', on_delete=models.CASCADE)
     posting = models.ForeignKey(Posting, on_delete=models.CASCADE)
 
+    objects = LikeManager()
+
     def __str__(self):
         return self.posting.content
 
     class Meta:
-        db_table = 'likes'
+        db_table        = 'likes'
+        unique_together = [['user', 'posting']]
 
 
-class CommentOfComment(models.Model):
-    content    = models.CharField(max_length=500)
-    user       = models.ForeignKey('user.User', on_delete=models.CASCADE)
-    comment    = models.ForeignKey(Comment, on_delete=models.CASCADE)
+class PostingCounter(models.Model):
+    posting  = models.ForeignKey(Posting, on_delete=models.CASCADE)
+    shard    = models.PositiveSmallIntegerField()
+    likes    = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    replies  = models.IntegerField(default=0)
+
+    class Meta:
+        db_table        = 'posting_counters'
+        unique_together = [['posting', 'shard']]
+
+
+class Timeline(models.Model):
+    user       = models.ForeignKey('user.User', on_delete=models.CASCADE, related_name='timeline_entries')
+    author     = models.ForeignKey('user.User', on_delete=models.CASCADE, related_name='+')
+    posting    = models.ForeignKey(Posting, on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
 
     def __str__(self):
-        return self.content 
+        return self.posting.content
+
+    class Meta:
+        db_table        = 'timelines'
+        unique_together = [['user', 'posting']]
+        indexes         = [
+            models.Index(fields=['user', '-created_at', '-posting'], name='timelines_feed_idx'),
+            models.Index(fields=['user', 'author'], name='timelines_author_idx'),
+        ]
+
+
+class PulledAuthor(models.Model):
+    """게시물을 fan-out 하지 않는(follower 가 FEED_FANOUT_THRESHOLD 를 넘는) 작성자. feed 는 이 작성자들의 게시물만 읽는 시점에 가져온다."""
+    user       = models.OneToOneField('user.User', on_delete=models.CASCADE, primary_key=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'pulled_authors'
+
+
+class Tag(models.Model):
+    name       = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        db_table = 'tags'
+
+
+class PostingTag(models.Model):
+    posting    = models.ForeignKey(Posting, on_delete=models.CASCADE)
+    tag        = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    # tag 목록을 posting 과 join 없이 최신순으로 읽기 위해 게시물 작성 시각을 같이 저장한다.
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table        = 'posting_tags'
+        unique_together = [['posting', 'tag']]
+        indexes         = [
+            models.Index(fields=['tag', '-created_at', '-id'], name='posting_tags_tag_created_idx'),
+        ]
+
+
+class TagCounter(models.Model):
+    tag      = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    shard    = models.PositiveSmallIntegerField()
+    postings = models.IntegerField(default=0)
+
+    class Meta:
+        db_table        = 'tag_counters'
+        unique_together = [['tag', 'shard']]
+
+
+class TagActivity(models.Model):
+    """tag 가 붙은 횟수를 TAG_BUCKET_MINUTES 단위 시간 bucket 으로 나눠 센다. 인기 tag 는 최근 bucket 만 더해서 구한다."""
+    tag    = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    bucket = models.DateTimeField()
+    count  = models.IntegerField(default=0)
+
+    class Meta:
+        db_table        = 'tag_activities'
+        unique_together = [['tag', 'bucket']]
+        indexes         = [
+            models.Index(fields=['bucket', 'tag'], name='tag_activities_bucket_idx'),
+        ]
+
+
+class Mention(models.Model):
+    posting    = models.ForeignKey(Posting, on_delete=models.CASCADE)
+    # 게시물 본문의 mention 이면 null 이다.
+    comment    = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True)
+    user       = models.ForeignKey('user.User', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        db_table = 'comment_of_comment'
\ No newline at end of file
+        db_table = 'mentions'
+        indexes  = [
+            models.Index(fields=['user', '-created_at'], name='mentions_user_created_idx'),
+        ]
@@ -0,0 +1,235 @@
+import re
+import math
+import logging
+import sqlite3
+import threading
+
+from collections                  import Counter
+
+from django.conf                  import settings
+from django.db                    import connection, transaction
+from django.db.models             import FloatField
+from django.db.models.expressions import RawSQL
+
+from .models                      import Posting, Comment
+
+logger = logging.getLogger(__name__)
+
+MODELS = {
+    'posting': Posting,
+    'comment': Comment,
+}
+
+# BM25 parameter
+K1 = 1.2
+B  = 0.75
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+class DatabaseBackend:
+    """MySQL FULLTEXT index(ngram parser, migration 0015)를 쓴다. index 는 MySQL 이 직접 관리한다."""
+
+    def index(self, kind, id, text):
+        pass
+
+    def index_many(self, kind, documents):
+        pass
+
+    def remove(self, kind, id):
+        pass
+
+    def clear(self, kind):
+        pass
+
+    def search(self, kind, query, offset, limit):
+        score = RawSQL('MATCH(content) AGAINST (%s IN NATURAL LANGUAGE MODE)', [query], output_field=FloatField())
+        return list(
+            MODELS[kind].objects
+            .annotate(score=score)
+            .filter(score__gt=0)
+            .order_by('-score', '-id')
+            .values_list('id', flat=True)[offset:offset + limit]
+        )
+
+
+class LocalIndex:
+    """SEARCH_INDEX_PATH 파일에 저장하는 inverted index. MySQL 이 아닌 배포(SQLite, test)에서 쓴다.
+
+    tokenize 와 BM25 ranking 은 여기서 하고, term 별 posting list 는 stdlib sqlite3 B-tree 에 저장한다.
+    문서 하나를 고치면 그 문서의 row 만 바뀌므로 signal 에서 바로 반영할 수 있다.
+
+    posting 에는 BM25 의 tf, 문서 길이 부분(weight)을 index 할 때 계산해서 넣고 (term, weight) 순서로 정렬해 둔다.
+    검색할 때는 term 마다 weight 가 큰 SEARCH_TERM_CANDIDATES 개만 읽어서 idf 를 곱해 더하므로
+    자주 나오는 단어도 corpus 크기와 상관없이 일정한 시간에 끝난다.
+    """
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS documents (kind TEXT, id INTEGER, length INTEGER, PRIMARY KEY (kind, id)) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS postings (term TEXT, kind TEXT, id INTEGER, weight REAL, PRIMARY KEY (term, kind, id)) WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS postings_impact_idx ON postings (term, kind, weight DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS postings_document_idx ON postings (kind, id)',
+        'CREATE TABLE IF NOT EXISTS terms (term TEXT, kind TEXT, documents INTEGER, PRIMARY KEY (term, kind)) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS stats (kind TEXT PRIMARY KEY, documents INTEGER, length INTEGER)',
+    ]
+
+    def __init__(self, path):
+        self.path   = path
+        self._local = threading.local()
+
+    @property
+    def db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=settings.SEARCH_INDEX_TIMEOUT, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.SCHEMA:
+                db.execute(statement)
+            self._local.db = db
+        return db
+
+    def index(self, kind, id, text):
+        self.index_many(kind, [(id, text)])
+
+    def index_many(self, kind, documents):
+        """(id, text) 목록을 한 transaction 으로 (다시) index 한다. 통계와 단어별 문서 수는 묶어서 한 번에 고친다."""
+        documents = dict(documents)
+        db        = self.db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            for id in documents:
+                self._remove(db, kind, id)
+
+            stats                 = db.execute('SELECT documents, length FROM stats WHERE kind = ?', (kind,)).fetchone()
+            total, total_length   = stats or (0, 0)
+            rows, lengths, counts = [], [], Counter()
+            for id, text in documents.items():
+                frequencies   = Counter(tokenize(text or ''))
+                length        = sum(frequencies.values())
+                total        += 1
+                total_length += length
+                average       = total_length / total or 1
+
+                lengths.append((kind, id, length))
+                counts.update(frequencies.keys())
+                rows.extend(
+                    (term, kind, id, frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average)))
+                    for term, frequency in frequencies.items()
+                )
+
+            db.executemany('INSERT INTO documents VALUES (?, ?, ?)', lengths)
+            # term 순서로 넣으면 B-tree 의 같은 page 를 이어서 고치므로 훨씬 빠르다.
+            rows.sort()
+            db.executemany('INSERT INTO postings VALUES (?, ?, ?, ?)', rows)
+            db.executemany(
+                'INSERT INTO terms VALUES (?, ?, ?) ON CONFLICT (term, kind) DO UPDATE SET documents = documents + excluded.documents',
+                [(term, kind, count) for term, count in counts.items()]
+            )
+            db.execute(
+                'INSERT INTO stats VALUES (?, ?, ?) ON CONFLICT (kind) DO UPDATE SET documents = excluded.documents, length = excluded.length',
+                (kind, total, total_length)
+            )
+
+    def remove(self, kind, id):
+        db = self.db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            self._remove(db, kind, id)
+
+    def _remove(self, db, kind, id):
+        row = db.execute('SELECT length FROM documents WHERE kind = ? AND id = ?', (kind, id)).fetchone()
+        if row is None:
+            return
+
+        terms = [(term, kind) for term, in db.execute('SELECT term FROM postings WHERE kind = ? AND id = ?', (kind, id))]
+        db.executemany('UPDATE terms SET documents = documents - 1 WHERE term = ? AND kind = ?', terms)
+        db.execute('DELETE FROM postings WHERE kind = ? AND id = ?', (kind, id))
+        db.execute('DELETE FROM documents WHERE kind = ? AND id = ?', (kind, id))
+        db.execute('UPDATE stats SET documents = documents - 1, length = length - ? WHERE kind = ?', (row[0], kind))
+
+    def clear(self, kind):
+        db = self.db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            for table in ('postings', 'documents', 'terms', 'stats'):
+                db.execute('DELETE FROM {} WHERE kind = ?'.format(table), (kind,))
+
+    def search(self, kind, query, offset, limit):
+        """BM25 점수가 높은 순서(같으면 최신 id 순서)로 문서 id 를 돌려준다."""
+        terms = sorted(set(tokenize(query)))
+        db    = self.db
+        stats = db.execute('SELECT documents FROM stats WHERE kind = ?', (kind,)).fetchone()
+        if not terms or not stats or not stats[0]:
+            return []
+
+        total       = stats[0]
+        frequencies = dict(db.execute(
+            'SELECT term, documents FROM terms WHERE kind = ? AND term IN ({}) AND documents > 0'.format(', '.join('?' * len(terms))),
+            [kind] + terms
+        ))
+        if not frequencies:
+            return []
+
+        # term 마다 impact index 를 따로 읽도록 sub query 를 UNION ALL 로 잇는다.
+        candidates = ' UNION ALL '.join(
+            'SELECT id, ? * weight AS score FROM ('
+            'SELECT id, weight FROM postings WHERE term = ? AND kind = ? ORDER BY weight DESC, id DESC LIMIT ?'
+            ')' for _ in frequencies
+        )
+        parameters = [
+            value
+            for term, documents in frequencies.items()
+            for value in (math.log(1 + (total - documents + 0.5) / (documents + 0.5)), term, kind, settings.SEARCH_TERM_CANDIDATES)
+        ]
+        rows       = db.execute(
+            'SELECT id FROM ({}) GROUP BY id ORDER BY SUM(score) DESC, id DESC LIMIT ? OFFSET ?'.format(candidates),
+            parameters + [limit, offset]
+        )
+        return [id for id, in rows]
+
+
+_local_index = None
+
+
+def backend():
+    """SEARCH_BACKEND 가 'database' 여도 MySQL 이 아니면 local index 를 쓴다."""
+    global _local_index
+
+    if settings.SEARCH_BACKEND == 'database' and connection.vendor == 'mysql':
+        return DatabaseBackend()
+    if _local_index is None or _local_index.path != settings.SEARCH_INDEX_PATH:
+        _local_index = LocalIndex(settings.SEARCH_INDEX_PATH)
+    return _local_index
+
+
+def apply(method, kind, *args):
+    """index 를 고친다. index 를 못 고쳐도 이미 commit 된 쓰기를 실패시키지 않도록 log 만 남긴다.
+
+    빠진 문서는 rebuild_search_index 로 다시 채운다.
+    """
+    try:
+        getattr(backend(), method)(kind, *args)
+    except Exception:
+        logger.exception('search index %s failed for %s (run rebuild_search_index)', method, kind)
+
+
+def index(kind, id, text):
+    # rollback 된 글이 검색되지 않도록 commit 된 뒤에 반영한다.
+    transaction.on_commit(lambda: apply('index', kind, id, text))
+
+
+def index_many(kind, documents):
+    documents = list(documents)
+    if documents:
+        transaction.on_commit(lambda: apply('index_many', kind, documents))
+
+
+def remove(kind, id):
+    transaction.on_commit(lambda: apply('remove', kind, id))
+
+
+def search(kind, query, offset, limit):
+    return backend().search(kind, query, offset, limit)
@@ -0,0 +1,32 @@
+from django.db.models            import Prefetch, prefetch_related_objects
+
+from westagram_project           import counters
+from westagram_project.renderers import seconds
+from .models                     import Image, PostingCounter
+
+
+def image_prefetch():
+    return Prefetch('image_set', queryset=Image.objects.order_by('id'))
+
+
+def serialize_postings(postings):
+    """게시물 payload 목록을 만든다. 게시물 수와 관계없이 image 1번, counter 1번만 조회한다."""
+    postings = list(postings)
+    prefetch_related_objects(postings, image_prefetch())
+
+    count = counters.totals(
+        PostingCounter,
+        'posting_id',
+        [posting.id for posting in postings],
+        ['likes', 'comments']
+    )
+
+    return [{
+        'id'           : posting.id,
+        'user_id'      : posting.user_id,
+        'content'      : posting.content,
+        'image'        : [image.image for image in posting.image_set.all()],
+        'like_count'   : count[posting.id]['likes'],
+        'comment_count': count[posting.id]['comments'],
+        'created_at'   : seconds(posting.created_at)
+    } for posting in postings]
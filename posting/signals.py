@@ -0,0 +1,58 @@
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch          import receiver
+
+from user.models              import Follow
+from .models                  import Posting, Image, Comment, Like
+from .                        import feed, cache, search, tags
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        feed.backfill(instance.from_user_id, instance.to_user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_timeline(sender, instance, **kwargs):
+    feed.remove(instance.from_user_id, instance.to_user_id)
+
+
+@receiver(post_save, sender=Posting)
+@receiver(post_delete, sender=Posting)
+def invalidate_posting(sender, instance, **kwargs):
+    cache.invalidate_postings([instance.id])
+    # 수정은 목록 순서를 바꾸지 않으므로 작성, 삭제일 때만 목록을 버린다.
+    if kwargs.get('created', True):
+        cache.invalidate_posting_list(instance.user_id)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def invalidate_posting_payload(sender, instance, **kwargs):
+    cache.invalidate_postings([instance.posting_id])
+
+
+@receiver(post_save, sender=Posting)
+def index_posting(sender, instance, **kwargs):
+    search.index('posting', instance.id, instance.content)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, **kwargs):
+    search.index('comment', instance.id, instance.content)
+
+
+@receiver(post_delete, sender=Posting)
+@receiver(post_delete, sender=Comment)
+def remove_from_index(sender, instance, **kwargs):
+    search.remove(sender._meta.model_name, instance.id)
+
+
+@receiver(pre_delete, sender=Posting)
+def release_tags(sender, instance, **kwargs):
+    # cascade 로 posting_tags 가 먼저 지워지기 전에 tag counter 를 줄인다.
+    tags.release(instance.id)
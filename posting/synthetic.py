@@ -0,0 +1,258 @@
+import random
+import itertools
+
+from django.conf       import settings
+from django.db         import connection
+from django.db.models  import Count, Max
+
+from user              import graph, hashing
+from user.models       import User, Follow, UserCounter
+from .models           import Posting, Image, Comment, Like, PostingCounter, Timeline, PulledAuthor, path_segment
+from .                 import cache, search, tags
+
+EMAIL    = 'seed-{}@seed.seed'
+PASSWORD = 'seed-password'
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def follow_counts(field, user_ids):
+    rows = Follow.objects.filter(**{field + '__in': user_ids}).values(field).annotate(count=Count('id')).order_by()
+    return {row[field]: row['count'] for row in rows}
+
+
+def fan_out(first_id, last_id):
+    """feed.fan_out_many 와 같은 timeline row 를 INSERT ... SELECT 로 DB 안에서 만든다. 만든 row 수를 돌려준다.
+
+    작성자 본인의 timeline 에는 모든 게시물을, follower 의 timeline 에는 push 하는 게시물만 넣는다.
+    """
+    names = {
+        'timelines': Timeline._meta.db_table,
+        'postings' : Posting._meta.db_table,
+        'follows'  : Follow._meta.db_table,
+    }
+    statements = [
+        'INSERT INTO {timelines} (user_id, author_id, posting_id, created_at) '
+        'SELECT user_id, user_id, id, created_at FROM {postings} WHERE id BETWEEN %s AND %s',
+        'INSERT INTO {timelines} (user_id, author_id, posting_id, created_at) '
+        'SELECT f.from_user_id, p.user_id, p.id, p.created_at FROM {postings} p '
+        'JOIN {follows} f ON f.to_user_id = p.user_id WHERE p.id BETWEEN %s AND %s AND p.is_pushed',
+    ]
+    rows = 0
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement.format(**names), [first_id, last_id])
+            rows += cursor.rowcount
+    return rows
+
+
+def chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class Generator:
+    """benchmark 용 가짜 social graph 를 bulk_create 로 만든다.
+
+    user, 게시물, 댓글 id 를 미리 정해두므로 user 범위(start, stop)를 나눠서 여러 process 가 동시에 만들 수 있다.
+    단계(PHASES)는 순서대로 모든 범위가 끝난 뒤에 다음 단계로 넘어가야 한다.
+
+    - follow 대상은 순위가 높은 user 일수록 많이 고르는 Zipf 분포(follow_exponent)라서 follower 수가 power law 를 따른다.
+    - password 는 bcrypt 를 한 번만 돌려서 모든 user 가 같은 hash 를 쓴다. (PASSWORD 로 로그인된다)
+    - bulk_create 는 signal 을 보내지 않으므로 counter, timeline, hashtag, 검색 index 는 'derived' 단계에서 채운다.
+    """
+
+    PHASES = ('users', 'follows', 'postings', 'comments', 'likes', 'derived')
+
+    def __init__(self, users, follows=10, follow_exponent=1.0, posts=5, images=1, comments=2, replies=1, likes=5,
+                 vocabulary=1000, batch_size=1000, seed=0, password=None, first_ids=None):
+        self.users           = users
+        self.follows         = follows
+        self.follow_exponent = follow_exponent
+        self.posts           = posts
+        self.images          = images
+        self.comments        = comments
+        self.replies         = replies
+        self.likes           = min(likes, users)
+        self.vocabulary      = vocabulary
+        self.batch_size      = batch_size
+        self.seed            = seed
+        self.password        = password or hashing._hashpw(PASSWORD, settings.BCRYPT_ROUNDS)
+        self.first_ids       = first_ids or {
+            'user'   : next_id(User),
+            'posting': next_id(Posting),
+            'comment': next_id(Comment),
+        }
+        self._weights        = None
+
+    @property
+    def weights(self):
+        """순위(user 순서) r 의 누적 가중치. (r + 1) ^ -follow_exponent 이고 0 이면 균등하게 고른다."""
+        if self._weights is None:
+            self._weights = list(itertools.accumulate((rank + 1) ** -self.follow_exponent for rank in range(self.users)))
+        return self._weights
+
+    def random(self, phase, start):
+        # 단계와 범위마다 seed 가 정해져 있으므로 같은 옵션으로 나눠 만들면 같은 data 가 나온다.
+        return random.Random('{}:{}:{}'.format(self.seed, phase, start))
+
+    def user_id(self, index):
+        return self.first_ids['user'] + index
+
+    def posting_id(self, index, number):
+        return self.first_ids['posting'] + index * self.posts + number
+
+    def user_ids(self, start, stop):
+        return [self.user_id(index) for index in range(start, stop)]
+
+    def posting_ids(self, start, stop):
+        return list(range(self.posting_id(start, 0), self.posting_id(stop, 0)))
+
+    def content(self, rng):
+        words = ['w{}'.format(int(rng.paretovariate(1)) % self.vocabulary) for _ in range(rng.randint(3, 12))]
+        # 게시물 셋 중 하나 정도에 hashtag 를 붙인다.
+        if rng.random() < 0.3:
+            words.append('#t{}'.format(int(rng.paretovariate(1)) % 100))
+        return ' '.join(words)
+
+    def run(self, start=0, stop=None):
+        """모든 단계를 차례로 실행하고 table 별로 만든 row 수를 돌려준다."""
+        stop, rows = self.users if stop is None else stop, {}
+        for phase in self.PHASES:
+            for table, count in getattr(self, 'create_' + phase)(start, stop).items():
+                rows[table] = rows.get(table, 0) + count
+        return rows
+
+    def create_users(self, start, stop):
+        users = [User(id=user_id, email=EMAIL.format(user_id), password=self.password) for user_id in self.user_ids(start, stop)]
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        return {'User': len(users)}
+
+    def create_follows(self, start, stop):
+        rng, total = self.random('follows', start), 0
+        population = range(self.users)
+
+        for indexes in chunks(range(start, stop), self.batch_size):
+            rows = []
+            for index in indexes:
+                degree  = min(self.users - 1, int(rng.expovariate(1 / self.follows))) if self.follows else 0
+                targets = set(rng.choices(population, cum_weights=self.weights, k=degree)) - {index}
+                rows.extend(Follow(from_user_id=self.user_id(index), to_user_id=self.user_id(target)) for target in sorted(targets))
+            Follow.objects.bulk_create(rows, batch_size=self.batch_size)
+            total += len(rows)
+        return {'Follow': total}
+
+    def create_postings(self, start, stop):
+        rng, total, images = self.random('postings', start), 0, 0
+
+        for indexes in chunks(range(start, stop), max(1, self.batch_size // max(1, self.posts))):
+            followers = follow_counts('to_user_id', [self.user_id(index) for index in indexes])
+            postings = [
+                Posting(
+                    id        = self.posting_id(index, number),
+                    user_id   = self.user_id(index),
+                    content   = self.content(rng),
+                    is_pushed = followers.get(self.user_id(index), 0) <= settings.FEED_FANOUT_THRESHOLD
+                )
+                for index in indexes
+                for number in range(self.posts)
+            ]
+            Posting.objects.bulk_create(postings, batch_size=self.batch_size)
+            rows = [
+                Image(posting_id=posting.id, image='https://seed.seed/{}/{}.jpg'.format(posting.id, number))
+                for posting in postings
+                for number in range(self.images)
+            ]
+            Image.objects.bulk_create(rows, batch_size=self.batch_size)
+            total  += len(postings)
+            images += len(rows)
+        return {'Posting': total, 'Image': images}
+
+    def create_comments(self, start, stop):
+        """게시물마다 최상위 댓글 comments 개와, 댓글마다 대댓글 replies 개를 단다. 대댓글 id 는 부모 id 바로 다음이다."""
+        rng, total = self.random('comments', start), 0
+        block      = self.comments * (1 + self.replies)
+
+        for posting_ids in chunks(self.posting_ids(start, stop), max(1, self.batch_size // max(1, block))):
+            rows = []
+            for posting_id in posting_ids:
+                first = self.first_ids['comment'] + (posting_id - self.first_ids['posting']) * block
+                for number in range(self.comments):
+                    root_id = first + number * (1 + self.replies)
+                    rows.append(Comment(
+                        id         = root_id,
+                        posting_id = posting_id,
+                        user_id    = self.user_id(rng.randrange(self.users)),
+                        path       = path_segment(root_id),
+                        content    = self.content(rng)
+                    ))
+                    rows.extend(Comment(
+                        id         = root_id + reply,
+                        posting_id = posting_id,
+                        user_id    = self.user_id(rng.randrange(self.users)),
+                        parent_id  = root_id,
+                        root_id    = root_id,
+                        depth      = 1,
+                        path       = path_segment(root_id) + path_segment(root_id + reply),
+                        content    = self.content(rng)
+                    ) for reply in range(1, self.replies + 1))
+            Comment.objects.bulk_create(rows, batch_size=self.batch_size)
+            total += len(rows)
+        return {'Comment': total}
+
+    def create_likes(self, start, stop):
+        rng, total = self.random('likes', start), 0
+
+        for posting_ids in chunks(self.posting_ids(start, stop), max(1, self.batch_size // max(1, self.likes))):
+            rows = [
+                Like(user_id=self.user_id(index), posting_id=posting_id)
+                for posting_id in posting_ids
+                for index in rng.sample(range(self.users), self.likes)
+            ]
+            Like.objects.bulk_create(rows, batch_size=self.batch_size)
+            total += len(rows)
+        return {'Like': total}
+
+    def create_derived(self, start, stop):
+        """counter(shard 0), timeline fan-out, hashtag, 검색 index 를 채우고 남아 있을 수 있는 cache 를 지운다."""
+        user_ids  = self.user_ids(start, stop)
+        followers = follow_counts('to_user_id', user_ids)
+        following = follow_counts('from_user_id', user_ids)
+        UserCounter.objects.bulk_create([UserCounter(
+            user_id   = user_id,
+            shard     = 0,
+            followers = followers.get(user_id, 0),
+            following = following.get(user_id, 0),
+            posts     = self.posts
+        ) for user_id in user_ids], batch_size=self.batch_size)
+        PulledAuthor.objects.bulk_create([
+            PulledAuthor(user_id=user_id) for user_id in user_ids if followers.get(user_id, 0) > settings.FEED_FANOUT_THRESHOLD
+        ], ignore_conflicts=True)
+        graph.backend().delete_many([graph.key(direction, user_id) for direction in graph.DIRECTIONS for user_id in user_ids])
+        for user_id in user_ids:
+            cache.invalidate_posting_list(user_id)
+
+        backend, counts = search.backend(), {'UserCounter': len(user_ids), 'PostingCounter': 0, 'Timeline': 0}
+        for posting_ids in chunks(self.posting_ids(start, stop), self.batch_size):
+            PostingCounter.objects.bulk_create([PostingCounter(
+                posting_id = posting_id,
+                shard      = 0,
+                likes      = self.likes,
+                comments   = self.comments,
+                replies    = self.comments * self.replies
+            ) for posting_id in posting_ids])
+            counts['PostingCounter'] += len(posting_ids)
+
+            counts['Timeline']       += fan_out(posting_ids[0], posting_ids[-1])
+
+            postings = list(Posting.objects.filter(id__in=posting_ids).only('id', 'user_id', 'content', 'created_at'))
+            tags.attach(postings)
+            cache.invalidate_postings(posting_ids)
+
+            # MySQL FULLTEXT index 는 insert 할 때 같이 만들어진다.
+            if isinstance(backend, search.LocalIndex):
+                backend.index_many('posting', [(posting.id, posting.content) for posting in postings])
+                backend.index_many('comment', Comment.objects.filter(posting_id__in=posting_ids).values_list('id', 'content'))
+        return counts
@@ -0,0 +1,184 @@
+import re
+import datetime
+
+from collections       import Counter
+
+from django.conf       import settings
+from django.db         import IntegrityError, transaction
+from django.db.models  import F, Sum
+from django.utils      import timezone
+
+from user.models       import User
+from westagram_project import counters
+from .models           import Posting, Tag, PostingTag, TagCounter, TagActivity, Mention
+
+TAG_PATTERN     = re.compile(r'#(\w+)')
+# user 는 email 로 구분하므로 '@' 다음에 email 을 쓴다. (ex. '@test@naver.com')
+MENTION_PATTERN = re.compile(r'@([\w.+-]+@[\w-]+(?:\.[\w-]+)+)')
+
+
+def unique(values):
+    return list(dict.fromkeys(values))
+
+
+def parse_tags(text):
+    """본문의 hashtag 이름 목록. 소문자로 맞추고 중복을 빼며 TAG_MAX_PER_POSTING 개까지만 쓴다."""
+    max_length = Tag._meta.get_field('name').max_length
+    names      = unique(name.lower() for name in TAG_PATTERN.findall(text or '') if len(name) <= max_length)
+    return names[:settings.TAG_MAX_PER_POSTING]
+
+
+def parse_mentions(text):
+    return unique(MENTION_PATTERN.findall(text or ''))
+
+
+def bucket(moment):
+    """moment 가 들어가는 TAG_BUCKET_MINUTES 단위 bucket 의 시작 시각."""
+    size      = settings.TAG_BUCKET_MINUTES * 60
+    timestamp = moment.timestamp()
+    return datetime.datetime.fromtimestamp(timestamp - timestamp % size, tz=moment.tzinfo)
+
+
+def get_or_create_tags(names):
+    """tag 이름 -> id. 없는 tag 는 한 번에 만든다."""
+    if not names:
+        return {}
+
+    ids     = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = [name for name in names if name not in ids]
+    if missing:
+        # 동시에 같은 tag 가 만들어질 수 있으므로 충돌은 무시하고 다시 읽는다.
+        Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+        ids.update(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+    return ids
+
+
+def record_activity(tag_counts):
+    """tag id -> 새로 붙은 게시물 수. 지금 bucket 에 더한다."""
+    now = bucket(timezone.now())
+    for tag_id, count in tag_counts.items():
+        lookup = {'tag_id': tag_id, 'bucket': now}
+        if TagActivity.objects.filter(**lookup).update(count=F('count') + count):
+            continue
+        try:
+            with transaction.atomic():
+                TagActivity.objects.create(**lookup, count=count)
+        except IntegrityError:
+            TagActivity.objects.filter(**lookup).update(count=F('count') + count)
+
+
+def add_tags(postings_names):
+    """(게시물, tag 이름 목록) 목록. 이미 붙어 있는 tag 는 건너뛰고 새로 붙은 것만 counter 에 더한다."""
+    postings_names = [(posting, names) for posting, names in postings_names if names]
+    if not postings_names:
+        return
+
+    ids      = get_or_create_tags(unique(name for _, names in postings_names for name in names))
+    existing = set(
+        PostingTag.objects
+        .filter(posting_id__in=[posting.id for posting, _ in postings_names], tag_id__in=ids.values())
+        .values_list('posting_id', 'tag_id')
+    )
+    rows = {
+        (posting.id, ids[name]): PostingTag(posting_id=posting.id, tag_id=ids[name], created_at=posting.created_at)
+        for posting, names in postings_names
+        for name in names
+        if (posting.id, ids[name]) not in existing
+    }.values()
+    PostingTag.objects.bulk_create(rows, ignore_conflicts=True)
+
+    added = Counter(row.tag_id for row in rows)
+    for tag_id, count in added.items():
+        counters.increment(TagCounter, 'tag_id', tag_id, postings=count)
+    record_activity(added)
+
+
+def remove_tags(posting_id, names):
+    tag_ids = list(Tag.objects.filter(name__in=names).values_list('id', flat=True)) if names else []
+    release(posting_id, tag_ids)
+
+
+def release(posting_id, tag_ids=None):
+    """게시물에서 tag 를 뗀다. tag_ids 가 None 이면 모두 뗀다. (게시물 삭제)
+
+    인기 tag 는 '최근에 많이 붙은' tag 라서 bucket 은 줄이지 않는다.
+    """
+    rows = PostingTag.objects.filter(posting_id=posting_id)
+    if tag_ids is not None:
+        rows = rows.filter(tag_id__in=tag_ids)
+
+    removed = list(rows.values_list('tag_id', flat=True))
+    if removed:
+        rows.delete()
+        for tag_id in removed:
+            counters.increment(TagCounter, 'tag_id', tag_id, postings=-1)
+
+
+def add_mentions(mentions):
+    """(게시물 id, 댓글 id 또는 None, email 목록) 목록. 없는 user 는 무시한다."""
+    emails = unique(email for _, _, emails in mentions for email in emails)
+    if not emails:
+        return
+
+    users = dict(User.objects.filter(email__in=emails).values_list('email', 'id'))
+    Mention.objects.bulk_create([
+        Mention(posting_id=posting_id, comment_id=comment_id, user_id=users[email])
+        for posting_id, comment_id, emails in mentions
+        for email in emails
+        if email in users
+    ])
+
+
+def attach(postings):
+    """새로 쓴 게시물들의 hashtag, mention 을 저장한다."""
+    add_tags([(posting, parse_tags(posting.content)) for posting in postings])
+    add_mentions([(posting.id, None, parse_mentions(posting.content)) for posting in postings])
+
+
+def update(posting, old_content):
+    """게시물 수정. 예전 본문과 비교해서 바뀐 hashtag, mention 만 고친다."""
+    old_tags, new_tags = parse_tags(old_content), parse_tags(posting.content)
+    remove_tags(posting.id, [name for name in old_tags if name not in new_tags])
+    add_tags([(posting, [name for name in new_tags if name not in old_tags])])
+
+    old_mentions, new_mentions = parse_mentions(old_content), parse_mentions(posting.content)
+    removed = [email for email in old_mentions if email not in new_mentions]
+    if removed:
+        Mention.objects.filter(posting_id=posting.id, comment__isnull=True, user__email__in=removed).delete()
+    add_mentions([(posting.id, None, [email for email in new_mentions if email not in old_mentions])])
+
+
+def attach_comments(comments):
+    """댓글의 mention 을 저장한다. 게시물 작성자가 단 댓글의 hashtag 는 게시물에 붙인다. (댓글을 지워도 tag 는 남는다)"""
+    tagged = [(comment, parse_tags(comment.content)) for comment in comments]
+    tagged = [(comment, names) for comment, names in tagged if names]
+    if tagged:
+        postings = Posting.objects.only('id', 'user_id', 'created_at').in_bulk({comment.posting_id for comment, _ in tagged})
+        add_tags([
+            (postings[comment.posting_id], names)
+            for comment, names in tagged
+            if postings[comment.posting_id].user_id == comment.user_id
+        ])
+    add_mentions([(comment.posting_id, comment.id, parse_mentions(comment.content)) for comment in comments])
+
+
+def post_counts(tag_ids):
+    return {tag_id: count['postings'] for tag_id, count in counters.totals(TagCounter, 'tag_id', tag_ids, ['postings']).items()}
+
+
+def trending(limit):
+    """최근 TAG_TRENDING_HOURS 시간 동안 많이 붙은 tag. bucket table 만 읽는다."""
+    since = bucket(timezone.now() - datetime.timedelta(hours=settings.TAG_TRENDING_HOURS))
+    rows  = list(
+        TagActivity.objects
+        .filter(bucket__gte=since)
+        .values('tag_id', 'tag__name')
+        .annotate(recent=Sum('count'))
+        .order_by('-recent', 'tag_id')[:limit]
+    )
+    counts = post_counts([row['tag_id'] for row in rows])
+    return [{
+        'name'        : row['tag__name'],
+        'recent_count': row['recent'],
+        'post_count'  : counts[row['tag_id']]
+    } for row in rows]
@@ -1,14 +1,35 @@
+import io
+import os
+import re
 import json
+import time
+import unittest
+import unittest.mock
+import threading
 import datetime
+import sqlite3
+import tempfile
 import jwt
 import bcrypt
 
-from django.test import TestCase, Client
-from my_settings import SECRET, ALGORITHM
-
-from user.utils  import login_decorator
-from .models     import Posting, Image, Comment, CommentOfComment, Like
-from user.models import User
+from asgiref.sync                import async_to_sync
+from django.conf                 import settings
+from django.http                 import JsonResponse
+from django.test                 import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.test.utils           import CaptureQueriesContext
+from django.core.management      import call_command
+from django.db                   import connection, connections, transaction, OperationalError
+from django.db.models            import F
+from my_settings                 import SECRET, ALGORITHM
+
+from user.utils  import login_decorator, token_cache
+from user        import graph
+from .           import feed, async_views, cache, search, tags, synthetic, batch
+from .management.commands import bench
+from .models     import Posting, Image, Comment, Like, Timeline, PulledAuthor, PostingCounter, Tag, PostingTag, TagActivity, Mention, path_segment
+from user.models import User, Follow, UserCounter
+from westagram_project import counters, renderers, metrics, executors, replicas, pool
+from westagram_project.pagination import encode_cursor
 
 
 class PostingTest(TestCase):
@@ -100,10 +121,13 @@ class PostingTest(TestCase):
         response = client.get('/posting/7')
         self.assertEqual(response.json(), 
             {'posting_data':[{
-                'id'        : 7,
-                'content'   : 'hihi',
-                'image'     : ['cat.cat', 'cat1.cat'],
-                'created_at': posting.created_at.strftime('%Y-%m-%d %H:%M:%S')
+                'id'           : 7,
+                'user_id'      : 10,
+                'content'      : 'hihi',
+                'image'        : ['cat.cat', 'cat1.cat'],
+                'like_count'   : 0,
+                'comment_count': 0,
+                'created_at'   : posting.created_at.strftime('%Y-%m-%d %H:%M:%S')
             }]}
         )
         self.assertEqual(response.status_code, 200)
@@ -192,7 +216,7 @@ class PostingListTest(TestCase):
         client = Client()
         User.objects.create(
             id      =11,
-            email   ='test@tes.tes',
+            email   ='test11@tes.tes',
             password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         )
         posting = Posting.objects.create(
@@ -213,14 +237,51 @@ class PostingListTest(TestCase):
         response = client.get('/posting/list/11')
         self.assertEqual(response.json(), 
             {'posting_list': [{
-                'id'        : 11,
-                'content'   : 'hihi',
-                'image'     : ['cat.cat', 'cat1.cat'],
-                'created_at': posting.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            }]}
+                'id'           : 11,
+                'user_id'      : 11,
+                'content'      : 'hihi',
+                'image'        : ['cat.cat', 'cat1.cat'],
+                'like_count'   : 0,
+                'comment_count': 0,
+                'created_at'   : posting.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            }],
+            'next_cursor': None}
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_get_posting_list_paginate(self):
+        client = Client()
+
+        for index in range(5):
+            Posting.objects.create(user_id=1, content='page{}'.format(index))
+
+        response = client.get('/posting/list/1?limit=4')
+        first    = response.json()
+        self.assertEqual(len(first['posting_list']), 4)
+        self.assertIsNotNone(first['next_cursor'])
+
+        response = client.get('/posting/list/1', {'limit': 4, 'cursor': first['next_cursor']})
+        second   = response.json()
+        self.assertEqual(len(second['posting_list']), 2)
+        self.assertIsNone(second['next_cursor'])
+
+        ids = [data['id'] for data in first['posting_list'] + second['posting_list']]
+        self.assertEqual(ids, list(Posting.objects.filter(user_id=1).order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_get_posting_list_invalid_cursor(self):
+        client = Client()
+
+        response = client.get('/posting/list/1?cursor=invalid')
+        self.assertEqual(response.json(), {'message': 'INVALID PAGE'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_posting_list_cursor_wrong_type(self):
+        # datetime 자리에 문자열이 아닌 값이 들어 있는 cursor
+        response = Client().get('/posting/list/1', {'cursor': encode_cursor([[1, 2], 1])})
+
+        self.assertEqual(response.json(), {'message': 'INVALID PAGE'})
+        self.assertEqual(response.status_code, 400)
+
 
 class CommentTest(TestCase):
     maxDiff = None
@@ -295,7 +356,7 @@ class CommentTest(TestCase):
 
         User.objects.create(
             id      =11,
-            email   ='test@tes.tes',
+            email   ='test11@tes.tes',
             password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         )
         Posting.objects.create(
@@ -323,11 +384,29 @@ class CommentTest(TestCase):
                     'user_id'   : 1,
                     'posting_id': '1',
                     'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M')
-                }]
+                }],
+                'next_cursor': None
             }
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_get_comment_paginate(self):
+        client = Client()
+
+        Comment.objects.bulk_create([Comment(user_id=1, posting_id=1, content=str(index)) for index in range(4)])
+        first  = client.get('/posting/comment?posting-id=1&limit=3').json()
+        second = client.get('/posting/comment?posting-id=1&limit=3&cursor=' + first['next_cursor']).json()
+
+        contents = [data['content'] for data in first['comment_data'] + second['comment_data']]
+        self.assertEqual(contents, ['aaaaa', '0', '1', '2', '3'])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_get_comment_cursor_wrong_type(self):
+        response = Client().get('/posting/comment', {'posting-id': 1, 'cursor': encode_cursor([[1, 2], 1])})
+
+        self.assertEqual(response.json(), {'message': 'INVALID PAGE'})
+        self.assertEqual(response.status_code, 400)
+
     def test_get_comment_posting_not_exist(self):
         client = Client()
 
@@ -375,13 +454,18 @@ class CommentOfCommentTest(TestCase):
             id        =1,
             user_id   =1,
             posting_id=1,
-            content   ='aaaaa'
+            content   ='aaaaa',
+            path      ='0000000001/'
         )
-        CommentOfComment.objects.create(
-            id        =1,
+        Comment.objects.create(
+            id        =2,
             content   ='hihi',
             user_id   =1,
-            comment_id=1
+            posting_id=1,
+            parent_id =1,
+            root_id   =1,
+            depth     =1,
+            path      ='0000000001/0000000002/'
         )
         expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)  
         self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8') 
@@ -425,11 +509,12 @@ class CommentOfCommentTest(TestCase):
         self.assertEqual(response.json(), 
             {
                 'comment_of_comment_list':[{
-                    'id'        : 1,
+                    'id'        : 2,
                     'user_id'   : 1,
                     'content'   : 'hihi',
                     'comment_id': 1
-                }]
+                }],
+                'next_cursor': None
             }
         )
         self.assertEqual(response.status_code, 200)
@@ -499,6 +584,7 @@ class LikeTest(TestCase):
             user_id   =1,
             posting_id=2
         )
+        call_command('reconcile_counters', stdout=io.StringIO())
         expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)  
         self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8') 
 
@@ -513,9 +599,31 @@ class LikeTest(TestCase):
         headers = {'HTTP_Authorization': self.token}
         data = {}
         response = client.post('/posting/like/2', json.dumps(data), **headers, content_type='application/json')
-        self.assertEqual(response.json(), {'message': 'SUCCESS'})
+        self.assertEqual(response.json(), {'message': 'SUCCESS', 'liked': False, 'like_count': 0})
         self.assertEqual(response.status_code, 200)
 
+    def test_post_like_toggle(self):
+        client = Client()
+
+        headers  = {'HTTP_Authorization': self.token}
+        response = client.post('/posting/like/1', **headers)
+        self.assertEqual(response.json(), {'message': 'SUCCESS', 'liked': True, 'like_count': 2})
+        self.assertTrue(Like.objects.filter(user_id=1, posting_id=1).exists())
+
+        response = client.post('/posting/like/1', **headers)
+        self.assertEqual(response.json(), {'message': 'SUCCESS', 'liked': False, 'like_count': 1})
+        self.assertFalse(Like.objects.filter(user_id=1, posting_id=1).exists())
+
+    def test_post_like_statement_count(self):
+        client = Client()
+
+        headers = {'HTTP_Authorization': self.token}
+        client.post('/posting/like/1', **headers)
+        with CaptureQueriesContext(connection) as context:
+            Like.objects.toggle(1, 1)
+        statements = [query['sql'] for query in context if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(statements), 1)
+
     def test_post_like_posting_not_exist(self):
         client = Client()
 
@@ -535,7 +643,9 @@ class LikeTest(TestCase):
                     'id'        : 2,
                     'posting_id': 1,
                     'user_id'   : 2
-                }]
+                }],
+                'like_count' : 1,
+                'next_cursor': None
             }
         )
         self.assertEqual(response.status_code, 200)
@@ -546,3 +656,1629 @@ class LikeTest(TestCase):
         response = client.get('/posting/like/10')
         self.assertEqual(response.json(), {'message': 'NOT FOUND'})
         self.assertEqual(response.status_code, 404)
+
+
+class FeedTest(TestCase):
+    def setUp(self):
+        User.objects.create(
+            id      =1,
+            email   ='test1@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        User.objects.create(
+            id      =2,
+            email   ='test2@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        User.objects.create(
+            id      =3,
+            email   ='test3@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        Follow.objects.create(
+            id          =1,
+            from_user_id=1,
+            to_user_id  =2
+        )
+        call_command('reconcile_counters', stdout=io.StringIO())
+        expire      = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token  = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+        self.token2 = jwt.encode({'user_id': 2, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        User.objects.all().delete()
+        Follow.objects.all().delete()
+        Posting.objects.all().delete()
+        Timeline.objects.all().delete()
+
+    def test_post_posting_fan_out_to_follower(self):
+        client = Client()
+
+        headers = {'HTTP_Authorization': self.token2}
+        data = {
+            'content': 'hi',
+            'image'  : ['hi.hi']
+        }
+        client.post('/posting', json.dumps(data), **headers, content_type='application/json')
+
+        posting = Posting.objects.get(user_id=2)
+        self.assertEqual(
+            sorted(Timeline.objects.filter(posting=posting).values_list('user_id', flat=True)),
+            [1, 2]
+        )
+
+    def test_get_feed_success(self):
+        client = Client()
+
+        headers = {'HTTP_Authorization': self.token2}
+        data = {
+            'content': 'hi',
+            'image'  : ['hi.hi']
+        }
+        client.post('/posting', json.dumps(data), **headers, content_type='application/json')
+        posting = Posting.objects.get(user_id=2)
+
+        headers = {'HTTP_Authorization': self.token}
+        response = client.get('/posting/feed', **headers)
+        self.assertEqual(response.json(),
+            {'feed': [{
+                'id'           : posting.id,
+                'user_id'      : 2,
+                'content'      : 'hi',
+                'image'        : ['hi.hi'],
+                'like_count'   : 0,
+                'comment_count': 0,
+                'created_at'   : posting.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            }],
+            'next_cursor': None}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_feed_paginate(self):
+        client = Client()
+
+        PulledAuthor.objects.create(user_id=2)
+        for index in range(3):
+            Posting.objects.create(user_id=2, content='page{}'.format(index))
+
+        headers  = {'HTTP_Authorization': self.token}
+        response = client.get('/posting/feed?limit=2', **headers)
+        first    = response.json()
+        response = client.get('/posting/feed', {'limit': 2, 'cursor': first['next_cursor']}, **headers)
+        second   = response.json()
+
+        self.assertEqual(
+            [data['content'] for data in first['feed'] + second['feed']],
+            ['page2', 'page1', 'page0']
+        )
+        self.assertIsNone(second['next_cursor'])
+
+    def test_get_feed_without_token(self):
+        client = Client()
+
+        response = client.get('/posting/feed')
+        self.assertEqual(response.json(), {'message': 'INVALID USER'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_follow_backfill_and_unfollow_remove(self):
+        posting = Posting.objects.create(user_id=3, content='hihi', is_pushed=True)
+
+        Follow.objects.create(from_user_id=1, to_user_id=3)
+        self.assertTrue(Timeline.objects.filter(user_id=1, posting=posting).exists())
+
+        Follow.objects.filter(from_user_id=1, to_user_id=3).delete()
+        self.assertFalse(Timeline.objects.filter(user_id=1, posting=posting).exists())
+
+    def test_delete_posting_remove_timeline(self):
+        client = Client()
+
+        headers = {'HTTP_Authorization': self.token2}
+        data = {
+            'content': 'hi',
+            'image'  : ['hi.hi']
+        }
+        client.post('/posting', json.dumps(data), **headers, content_type='application/json')
+        posting = Posting.objects.get(user_id=2)
+
+        client.delete('/posting/{}'.format(posting.id), **headers)
+        self.assertFalse(Timeline.objects.filter(posting_id=posting.id).exists())
+
+    @override_settings(FEED_FANOUT_THRESHOLD=0)
+    def test_post_posting_over_threshold_not_fan_out(self):
+        client = Client()
+
+        headers = {'HTTP_Authorization': self.token2}
+        data = {
+            'content': 'hi',
+            'image'  : ['hi.hi']
+        }
+        client.post('/posting', json.dumps(data), **headers, content_type='application/json')
+
+        posting = Posting.objects.get(user_id=2)
+        self.assertFalse(posting.is_pushed)
+        self.assertEqual(list(Timeline.objects.filter(posting=posting).values_list('user_id', flat=True)), [2])
+        self.assertTrue(PulledAuthor.objects.filter(user_id=2).exists())
+        self.assertEqual([data['id'] for data in client.get('/posting/feed', HTTP_Authorization=self.token).json()['feed']], [posting.id])
+
+    def test_feed_metrics_exported(self):
+        metrics.clear()
+        client = Client()
+        client.post('/posting', json.dumps({'content': 'hi', 'image': []}), HTTP_Authorization=self.token2, content_type='application/json')
+        client.get('/posting/feed', HTTP_Authorization=self.token)
+
+        text = client.get('/metrics').content.decode('utf-8')
+        self.assertIn('westagram_feed_postings_total{mode="pushed"} 1', text)
+        self.assertIn('westagram_feed_timeline_writes_total 2', text)
+        self.assertIn('westagram_feed_read_rows_total{source="pushed"} 1', text)
+        self.assertIn('westagram_feed_read_seconds_count 1', text)
+        metrics.clear()
+
+    def test_pull_only_from_pulled_authors(self):
+        # push 되지 않은 게시물이 있어도 PulledAuthor 가 아닌 작성자의 게시물은 읽지 않는다.
+        Posting.objects.create(user_id=2, content='not pulled')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(feed.pulled_entries(1, 10), [])
+
+    def test_get_feed_merge_pushed_and_pulled(self):
+        client = Client()
+
+        Follow.objects.create(from_user_id=1, to_user_id=3)
+        PulledAuthor.objects.create(user_id=2)
+        pulled = Posting.objects.create(user_id=2, content='pulled')
+        pushed = Posting.objects.create(user_id=3, content='pushed', is_pushed=True)
+        Timeline.objects.create(user_id=1, author_id=3, posting=pushed, created_at=pushed.created_at)
+        latest = Posting.objects.create(user_id=2, content='latest')
+
+        headers = {'HTTP_Authorization': self.token}
+        response = client.get('/posting/feed', **headers)
+        self.assertEqual([data['id'] for data in response.json()['feed']], [latest.id, pushed.id, pulled.id])
+        self.assertEqual(response.status_code, 200)
+
+    def test_feed_merge_deduplicate(self):
+        now     = datetime.datetime(2020, 10, 1)
+        earlier = datetime.datetime(2020, 9, 1)
+
+        merged = feed.merge([[(now, 3), (earlier, 1)], [(now, 3), (now, 2)]], 10)
+        self.assertEqual(merged, [(now, 3), (now, 2), (earlier, 1)])
+
+
+class CounterTest(TestCase):
+    def setUp(self):
+        User.objects.create(
+            id      =1,
+            email   ='test@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        Posting.objects.create(
+            id     =1,
+            user_id=1,
+            content='hihi'
+        )
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        User.objects.all().delete()
+        Posting.objects.all().delete()
+        PostingCounter.objects.all().delete()
+
+    def count(self, *fields):
+        return counters.total(PostingCounter, 'posting_id', 1, fields)
+
+    def test_increment_sum_shards(self):
+        for _ in range(20):
+            counters.increment(PostingCounter, 'posting_id', 1, likes=1)
+        counters.increment(PostingCounter, 'posting_id', 1, likes=-5)
+
+        self.assertEqual(self.count('likes'), {'likes': 15})
+        self.assertLessEqual(PostingCounter.objects.filter(posting_id=1).count(), 8)
+
+    def test_comment_post_and_delete_update_counter(self):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+
+        data = {
+            'posting_id': 1,
+            'content'   : 'lol'
+        }
+        client.post('/posting/comment', json.dumps(data), **headers, content_type='application/json')
+        comment = Comment.objects.get(posting_id=1)
+
+        data = {
+            'comment_id': comment.id,
+            'content'   : 'lol'
+        }
+        client.post('/posting/commentofcomment', json.dumps(data), **headers, content_type='application/json')
+        self.assertEqual(self.count('comments', 'replies'), {'comments': 1, 'replies': 1})
+
+        client.delete('/posting/comment/{}'.format(comment.id), **headers)
+        self.assertEqual(self.count('comments', 'replies'), {'comments': 0, 'replies': 0})
+
+    def test_reconcile_counters(self):
+        Like.objects.create(user_id=1, posting_id=1)
+        counters.increment(PostingCounter, 'posting_id', 1, likes=7)
+
+        call_command('reconcile_counters', stdout=io.StringIO())
+
+        self.assertEqual(self.count('likes', 'comments'), {'likes': 1, 'comments': 0})
+        self.assertEqual(counters.total(UserCounter, 'user_id', 1, ['posts']), {'posts': 1})
+
+
+@override_settings(CACHES={alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'} for alias in settings.CACHES})
+class QueryCountTest(TestCase):
+    """목록 API의 query 수가 row 수와 관계없이 일정한지 확인한다. 응답 cache 는 끄고 잰다."""
+
+    def setUp(self):
+        User.objects.create(
+            id      =1,
+            email   ='test1@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        User.objects.create(
+            id      =2,
+            email   ='test2@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        Follow.objects.create(from_user_id=1, to_user_id=2)
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        User.objects.all().delete()
+        Posting.objects.all().delete()
+
+    def add_postings(self, count):
+        for index in range(count):
+            posting = Posting.objects.create(user_id=2, content='posting{}'.format(index))
+            Image.objects.create(posting=posting, image='a.a')
+            Image.objects.create(posting=posting, image='b.b')
+            Like.objects.create(user_id=1, posting=posting)
+            Comment.objects.create(user_id=1, posting=posting, content='comment')
+            counters.increment(PostingCounter, 'posting_id', posting.id, likes=1, comments=1)
+
+    def count_queries(self, path, **headers):
+        client = Client()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(path, **headers)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def assertConstantQueries(self, path, **headers):
+        self.add_postings(1)
+        # login token을 cache에 올려둔다.
+        self.count_queries(path, **headers)
+        single = self.count_queries(path, **headers)
+        self.add_postings(10)
+        many   = self.count_queries(path, **headers)
+        self.assertEqual(single, many)
+
+    def test_posting_list_queries(self):
+        self.assertConstantQueries('/posting/list/2')
+
+    def test_posting_list_query_count(self):
+        self.add_postings(20)
+        # posting, image, counter
+        self.assertEqual(self.count_queries('/posting/list/2'), 3)
+
+    def test_posting_detail_query_count(self):
+        self.add_postings(1)
+        posting = Posting.objects.get()
+        self.assertEqual(self.count_queries('/posting/{}'.format(posting.id)), 3)
+
+    def test_feed_queries(self):
+        self.assertConstantQueries('/posting/feed', HTTP_Authorization=self.token)
+
+    def test_like_list_queries(self):
+        self.add_postings(1)
+        posting = Posting.objects.get()
+        single = self.count_queries('/posting/like/{}'.format(posting.id))
+        User.objects.bulk_create([User(email='bulk{}@tes.tes'.format(index), password='x') for index in range(10)])
+        Like.objects.bulk_create([Like(user=user, posting=posting) for user in User.objects.filter(email__startswith='bulk')])
+        self.assertEqual(single, self.count_queries('/posting/like/{}'.format(posting.id)))
+
+    def test_comment_list_queries(self):
+        self.add_postings(1)
+        posting = Posting.objects.get()
+        single  = self.count_queries('/posting/comment?posting-id={}'.format(posting.id))
+        Comment.objects.bulk_create([Comment(user_id=2, posting=posting, content='c') for _ in range(10)])
+        self.assertEqual(single, self.count_queries('/posting/comment?posting-id={}'.format(posting.id)))
+
+
+class AsyncViewTest(TransactionTestCase):
+    def setUp(self):
+        User.objects.create(
+            id      =1,
+            email   ='test@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        Posting.objects.create(
+            id     =1,
+            user_id=1,
+            content='hihi'
+        )
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+        token_cache.clear()
+
+    def tearDown(self):
+        token_cache.clear()
+
+    def call(self, view, request, **kwargs):
+        return async_to_sync(view.as_view())(request, **kwargs)
+
+    def test_async_posting_get_success(self):
+        request  = RequestFactory().get('/posting/1')
+        response = self.call(async_views.PostingDetailView, request, posting_id=1)
+
+        self.assertEqual(json.loads(response.content)['posting_data'][0]['content'], 'hihi')
+        self.assertEqual(response.status_code, 200)
+
+    def test_async_posting_post_success(self):
+        data = {
+            'content': 'async',
+            'image'  : ['a.a']
+        }
+        for _ in range(2):
+            request  = RequestFactory().post('/posting', json.dumps(data), content_type='application/json', HTTP_Authorization=self.token)
+            response = self.call(async_views.PostingDetailView, request)
+            self.assertEqual(json.loads(response.content), {'message': 'SUCCESS'})
+
+        self.assertEqual(Posting.objects.filter(content='async').count(), 2)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_async_login_required(self):
+        request  = RequestFactory().get('/posting/feed')
+        response = self.call(async_views.FeedView, request)
+
+        self.assertEqual(json.loads(response.content), {'message': 'INVALID USER'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_async_method_not_allowed(self):
+        request  = RequestFactory().put('/posting/list/1')
+        response = self.call(async_views.PostingListView, request, user_id=1)
+
+        self.assertEqual(response.status_code, 405)
+
+    def test_async_like_stream(self):
+        Like.objects.create(user_id=1, posting_id=1)
+        request  = RequestFactory().get('/posting/like/1?stream=ndjson')
+        response = self.call(async_views.LikeView, request, posting_id=1)
+
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['user_id'], 1)
+
+
+class IndexTest(TestCase):
+    """자주 쓰는 조회가 full table scan 이나 정렬용 임시 table 을 쓰지 않는지 실행 계획으로 확인한다."""
+
+    def assertIndexed(self, queryset):
+        plan = queryset.explain()
+
+        if connection.vendor == 'sqlite':
+            table = queryset.model._meta.db_table
+            self.assertIsNone(re.search(r'SCAN {}$'.format(table), plan, re.MULTILINE), plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+        elif connection.vendor == 'mysql':
+            self.assertNotIn(' ALL ', plan)
+            self.assertNotIn('Using filesort', plan)
+
+    def test_user_email_indexed(self):
+        self.assertIndexed(User.objects.filter(email='test@tes.tes'))
+
+    def test_like_pair_indexed(self):
+        self.assertIndexed(Like.objects.filter(user_id=1, posting_id=1))
+
+    def test_follow_pair_indexed(self):
+        self.assertIndexed(Follow.objects.filter(from_user_id=1, to_user_id=2))
+
+    def test_posting_list_indexed(self):
+        self.assertIndexed(Posting.objects.filter(user_id=1).order_by('-created_at', '-id')[:21])
+
+    def test_comment_list_indexed(self):
+        self.assertIndexed(Comment.objects.filter(posting_id=1).order_by('created_at', 'id')[:21])
+
+    def test_feed_indexed(self):
+        self.assertIndexed(Timeline.objects.filter(user_id=1).order_by('-created_at', '-posting_id')[:21])
+
+    def test_like_list_indexed(self):
+        self.assertIndexed(Like.objects.filter(posting_id=1).order_by('id')[:21])
+
+    def test_full_scan_detected(self):
+        with self.assertRaises(AssertionError):
+            self.assertIndexed(Posting.objects.filter(content='hihi'))
+
+
+class LikeConcurrencyTest(TransactionTestCase):
+    """여러 thread 가 동시에 좋아요를 눌러도 좋아요 row 와 counter 가 어긋나지 않는지 확인한다."""
+
+    THREADS = 8
+    TAPS    = 25
+    RETRIES = 50
+
+    def setUp(self):
+        User.objects.create(id=1, email='test@tes.tes', password='x')
+        Posting.objects.create(id=1, user_id=1, content='hihi')
+
+    def retry(self, func, *args, **kwargs):
+        for attempt in range(self.RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError:
+                # sqlite 는 동시에 쓰면 기다리지 않고 lock error 를 내므로 다시 시도한다.
+                # 실제 deadlock 이면 test 가 멈추지 않고 실패하도록 마지막에는 error 를 그대로 낸다.
+                if attempt == self.RETRIES - 1:
+                    raise
+                time.sleep(0.01)
+
+    def tap(self, barrier, errors):
+        barrier.wait()
+        try:
+            for _ in range(self.TAPS):
+                liked, changed = self.retry(Like.objects.toggle, 1, 1)
+                if changed:
+                    self.retry(counters.increment, PostingCounter, 'posting_id', 1, likes=1 if liked else -1)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    def test_concurrent_double_tap(self):
+        barrier = threading.Barrier(self.THREADS)
+        errors  = []
+        threads = [threading.Thread(target=self.tap, args=(barrier, errors)) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        likes = Like.objects.filter(user_id=1, posting_id=1).count()
+        self.assertIn(likes, (0, 1))
+        self.assertEqual(counters.total(PostingCounter, 'posting_id', 1, ['likes']), {'likes': likes})
+
+
+class BatchTest(TestCase):
+    def setUp(self):
+        User.objects.create(
+            id      =1,
+            email   ='test1@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        User.objects.create(
+            id      =2,
+            email   ='test2@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        Posting.objects.create(
+            id      =1,
+            user_id =2,
+            content ='hi',
+            is_pushed=True
+        )
+        Like.objects.create(
+            user_id   =1,
+            posting_id=1
+        )
+        call_command('reconcile_counters', stdout=io.StringIO())
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        User.objects.all().delete()
+        Posting.objects.all().delete()
+
+    def post(self, operations):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+        return client.post('/posting/batch', json.dumps({'operations': operations}), content_type='application/json', **headers)
+
+    def test_post_batch_success(self):
+        response = self.post([
+            {'type': 'posting', 'content': 'hello', 'image': ['a.a', 'b.b']},
+            {'type': 'comment', 'posting_id': 1, 'content': 'nice'},
+            {'type': 'comment', 'posting_id': 100, 'content': 'nice'},
+            {'type': 'like', 'posting_id': 1},
+            {'type': 'follow', 'to_user_id': 2},
+            {'type': 'follow', 'to_user_id': 2},
+            {'type': 'comment', 'posting_id': 1},
+            {'type': 'share'}
+        ])
+        posting_id = Posting.objects.get(content='hello').id
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'type': 'posting', 'message': 'SUCCESS', 'id': posting_id},
+            {'type': 'comment', 'message': 'SUCCESS'},
+            {'type': 'comment', 'message': 'NOT FOUND'},
+            {'type': 'like', 'message': 'ALREADY EXIST'},
+            {'type': 'follow', 'message': 'SUCCESS'},
+            {'type': 'follow', 'message': 'ALREADY EXIST'},
+            {'type': 'comment', 'message': 'KEY ERROR'},
+            {'type': 'share', 'message': 'INVALID TYPE'}
+        ])
+        self.assertEqual(Image.objects.filter(posting_id=posting_id).count(), 2)
+        self.assertEqual(Comment.objects.filter(posting_id=1).count(), 1)
+        self.assertEqual(Follow.objects.filter(from_user_id=1, to_user_id=2).count(), 1)
+        self.assertTrue(Timeline.objects.filter(user_id=1, posting_id=1).exists())
+        self.assertEqual(counters.total(PostingCounter, 'posting_id', 1, ['comments', 'likes']), {'comments': 1, 'likes': 1})
+        self.assertEqual(counters.total(UserCounter, 'user_id', 1, ['posts', 'following']), {'posts': 1, 'following': 1})
+        self.assertEqual(counters.total(UserCounter, 'user_id', 2, ['followers']), {'followers': 1})
+
+    @override_settings(COUNTER_SHARDS=1)
+    def test_post_batch_query_count(self):
+        operations = [{'type': 'comment', 'posting_id': 1, 'content': 'nice'}]
+        self.post(operations)
+
+        with CaptureQueriesContext(connection) as few:
+            self.post(operations * 2)
+        with CaptureQueriesContext(connection) as many:
+            self.post(operations * 50)
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(Comment.objects.count(), 53)
+
+    def test_post_batch_concurrent_comments(self):
+        fill_paths = Comment.objects.fill_paths
+
+        def interleave(*args, **kwargs):
+            # 같은 user 의 다른 batch 가 그 사이에 넣은 댓글
+            Comment.objects.bulk_create([Comment(user_id=1, posting_id=1, content='other')])
+            return fill_paths(*args, **kwargs)
+
+        with unittest.mock.patch.object(Comment.objects, 'fill_paths', interleave), \
+             unittest.mock.patch.object(search, 'index_many') as index_many:
+            self.post([{'type': 'comment', 'posting_id': 1, 'content': 'nice'}])
+
+        indexed = {kind: documents for (kind, documents), _ in index_many.call_args_list}
+        self.assertEqual([content for _, content in indexed['comment']], ['nice'])
+        self.assertEqual(Comment.objects.get(content='nice').path, path_segment(Comment.objects.get(content='nice').id))
+
+    def test_post_batch_concurrent_like_follow(self):
+        Posting.objects.create(id=2, user_id=2, content='hello')
+        create_comments = batch.create_comments
+
+        def interleave(comments):
+            # 확인한 뒤 insert 하기 전에 다른 요청이 같은 좋아요와 follow 를 넣는다.
+            Like.objects.bulk_create([Like(user_id=1, posting_id=2)])
+            Follow.objects.bulk_create([Follow(from_user_id=1, to_user_id=2)])
+            return create_comments(comments)
+
+        with unittest.mock.patch.object(batch, 'create_comments', interleave):
+            response = self.post([{'type': 'like', 'posting_id': 2}, {'type': 'follow', 'to_user_id': 2}])
+
+        self.assertEqual([result['message'] for result in response.json()['results']], ['ALREADY EXIST', 'ALREADY EXIST'])
+        self.assertEqual(counters.total(PostingCounter, 'posting_id', 2, ['likes']), {'likes': 0})
+        self.assertEqual(counters.total(UserCounter, 'user_id', 1, ['following']), {'following': 0})
+        self.assertEqual(counters.total(UserCounter, 'user_id', 2, ['followers']), {'followers': 0})
+
+    def test_post_batch_indexes_posting_once(self):
+        with unittest.mock.patch.object(search, 'index') as index, \
+             unittest.mock.patch.object(search, 'index_many') as index_many:
+            self.post([{'type': 'posting', 'content': 'hello', 'image': []}])
+
+        indexed  = [(kind, id) for (kind, id, _), _ in index.call_args_list]
+        indexed += [(kind, id) for (kind, documents), _ in index_many.call_args_list for id, _ in documents]
+        self.assertEqual(indexed, [('posting', Posting.objects.get(content='hello').id)])
+
+    def test_post_batch_too_many_operations(self):
+        with self.settings(BATCH_MAX_OPERATIONS=2):
+            response = self.post([{'type': 'like', 'posting_id': 1}] * 3)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message': 'TOO MANY OPERATIONS'})
+
+    def test_post_batch_key_error(self):
+        response = self.post([])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message': 'KEY ERROR'})
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        User.objects.create(
+            id      =1,
+            email   ='test1@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        Posting.objects.create(
+            id      =1,
+            user_id =1,
+            content ='hi'
+        )
+        Image.objects.create(
+            posting_id=1,
+            image     ='a.a'
+        )
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        User.objects.all().delete()
+        Posting.objects.all().delete()
+        cache.backend().clear()
+
+    def get(self, path):
+        client = Client()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(path)
+        return response.json(), len(context)
+
+    def test_posting_detail_cached(self):
+        first, _        = self.get('/posting/1')
+        second, queries = self.get('/posting/1')
+
+        self.assertEqual(first, second)
+        self.assertEqual(queries, 0)
+
+    def test_posting_list_cached(self):
+        first, _        = self.get('/posting/list/1')
+        second, queries = self.get('/posting/list/1')
+
+        self.assertEqual(first, second)
+        self.assertEqual(queries, 0)
+
+    def test_invalidate_on_image_and_comment(self):
+        self.get('/posting/1')
+        Image.objects.create(posting_id=1, image='b.b')
+        self.assertEqual(self.get('/posting/1')[0]['posting_data'][0]['image'], ['a.a', 'b.b'])
+
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+        client.post('/posting/comment', json.dumps({'posting_id': 1, 'content': 'hi'}), content_type='application/json', **headers)
+        self.assertEqual(self.get('/posting/1')[0]['posting_data'][0]['comment_count'], 1)
+
+    def test_invalidate_on_like_toggle(self):
+        self.get('/posting/list/1')
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+        client.post('/posting/like/1', **headers)
+
+        self.assertEqual(self.get('/posting/list/1')[0]['posting_list'][0]['like_count'], 1)
+
+    def test_invalidate_list_on_new_posting(self):
+        self.get('/posting/list/1')
+        Posting.objects.create(user_id=1, content='new')
+
+        self.assertEqual(len(self.get('/posting/list/1')[0]['posting_list']), 2)
+
+    def test_invalidate_on_posting_delete(self):
+        self.get('/posting/1')
+        Posting.objects.get(id=1).delete()
+
+        self.assertEqual(self.get('/posting/1')[0], {'message': 'NOT FOUND'})
+
+    def test_single_flight(self):
+        builds  = []
+        barrier = threading.Barrier(8)
+
+        def build():
+            builds.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        def request(results):
+            barrier.wait()
+            results.append(cache.single_flight('single-flight-test', build))
+
+        results = []
+        threads = [threading.Thread(target=request, args=(results,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(results, ['value'] * 8)
+
+
+class ConditionalRequestTest(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        User.objects.create(
+            id      =1,
+            email   ='test1@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        Posting.objects.create(
+            id      =1,
+            user_id =1,
+            content ='hi'
+        )
+        comment = Comment.objects.add(1, 1, 'hi')
+        Comment.objects.add(1, 1, 'hi', parent=comment)
+        self.comment_id = comment.id
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        User.objects.all().delete()
+        Posting.objects.all().delete()
+        cache.backend().clear()
+
+    def assertNotModified(self, path):
+        client   = Client()
+        response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+
+        cached = client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+        self.assertEqual(cached['ETag'], response['ETag'])
+        return response
+
+    def test_posting_detail_not_modified(self):
+        response = self.assertNotModified('/posting/1')
+        # 좋아요 수처럼 updated_at 을 바꾸지 않는 값이 있어서 Last-Modified 는 보내지 않는다.
+        self.assertNotIn('Last-Modified', response)
+
+    def test_posting_detail_modified_after_like(self):
+        client   = Client()
+        response = client.get('/posting/1')
+        client.post('/posting/like/1', HTTP_Authorization=self.token)
+
+        self.assertEqual(client.get('/posting/1', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        # If-Modified-Since 만 보내도 예전 좋아요 수로 304 를 주지 않는다.
+        modified = client.get('/posting/1', HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 2099 00:00:00 GMT')
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(modified.json()['posting_data'][0]['like_count'], 1)
+
+    def test_posting_list_not_modified(self):
+        self.assertNotModified('/posting/list/1')
+
+    def test_comment_list_not_modified(self):
+        response = self.assertNotModified('/posting/comment?posting-id=1')
+        client   = Client()
+
+        Comment.objects.create(posting_id=1, user_id=1, content='new')
+        self.assertEqual(client.get('/posting/comment?posting-id=1', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_comment_list_modified_after_delete(self):
+        client   = Client()
+        response = client.get('/posting/comment?posting-id=1')
+        client.delete('/posting/comment/{}'.format(self.comment_id), HTTP_Authorization=self.token)
+
+        self.assertEqual(client.get('/posting/comment?posting-id=1', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        # If-Modified-Since 만 보내도 지워진 댓글이 남은 응답에 304 를 주지 않는다.
+        modified = client.get('/posting/comment?posting-id=1', HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 2099 00:00:00 GMT')
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(modified.json()['comment_data'], [])
+
+    def test_comment_list_not_modified_query_count(self):
+        response = Client().get('/posting/comment?posting-id=1')
+
+        with CaptureQueriesContext(connection) as context:
+            Client().get('/posting/comment?posting-id=1', HTTP_IF_NONE_MATCH=response['ETag'])
+        # 게시물 확인, validator aggregate
+        self.assertEqual(len(context), 2)
+
+    def test_commentofcomment_not_modified(self):
+        path     = '/posting/commentofcomment?comment-id={}'.format(self.comment_id)
+        response = self.assertNotModified(path)
+        self.assertNotIn('Last-Modified', response)
+
+        Comment.objects.add(1, 1, 'new', parent=Comment.objects.get(id=self.comment_id))
+        modified = Client().get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(modified.status_code, 200)
+
+
+class RendererTest(TestCase):
+    def setUp(self):
+        self.data = {
+            'comment_data': [{
+                'id'        : 1,
+                'content'   : '안녕 "hi"\n',
+                'user_id'   : 1,
+                'posting_id': '1',
+                'created_at': renderers.minutes(datetime.datetime(2020, 9, 1, 7, 5, 3, 123456))
+            }],
+            'next_cursor': None,
+            'liked'      : True
+        }
+
+    def test_datetime_format(self):
+        value = datetime.datetime(2020, 9, 1, 7, 5, 3, 123456, tzinfo=datetime.timezone.utc)
+
+        self.assertEqual(renderers.minutes(value), value.strftime('%Y-%m-%d %H:%M'))
+        self.assertEqual(renderers.seconds(value), value.strftime('%Y-%m-%d %H:%M:%S'))
+        self.assertEqual(renderers.seconds(value.replace(microsecond=0)), value.strftime('%Y-%m-%d %H:%M:%S'))
+
+    @override_settings(JSON_BACKEND='json')
+    def test_json_backend_byte_compatible(self):
+        response = renderers.JsonResponse(self.data, status=200)
+
+        self.assertEqual(response.content, JsonResponse(self.data).content)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    @unittest.skipIf(renderers.orjson is None, 'orjson is not installed')
+    @override_settings(JSON_BACKEND='orjson')
+    def test_orjson_backend_same_value(self):
+        self.assertEqual(renderers.backend(), 'orjson')
+        self.assertEqual(json.loads(renderers.dumps(self.data)), self.data)
+
+    @override_settings(JSON_BACKEND='orjson')
+    def test_orjson_backend_fallback(self):
+        orjson, renderers.orjson = renderers.orjson, None
+        try:
+            self.assertEqual(renderers.backend(), 'json')
+            self.assertEqual(renderers.dumps(self.data), JsonResponse(self.data).content)
+        finally:
+            renderers.orjson = orjson
+
+
+@override_settings(STREAM_CHUNK_SIZE=2)
+class StreamingTest(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        User.objects.bulk_create([
+            User(id=index, email='test{}@tes.tes'.format(index), password='x') for index in range(1, 6)
+        ])
+        Posting.objects.create(
+            id      =1,
+            user_id =1,
+            content ='hi'
+        )
+        Like.objects.bulk_create([Like(user_id=index, posting_id=1) for index in range(1, 6)])
+        Comment.objects.bulk_create([Comment(user_id=1, posting_id=1, content=str(index)) for index in range(5)])
+
+    def tearDown(self):
+        User.objects.all().delete()
+        Posting.objects.all().delete()
+
+    def read(self, path):
+        response = Client().get(path)
+        self.assertTrue(response.streaming)
+        with CaptureQueriesContext(connection) as context:
+            content = b''.join(response.streaming_content)
+        return response, content, len(context)
+
+    def test_like_stream_json(self):
+        response, content, queries = self.read('/posting/like/1?stream=json')
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(content), [
+            {'id': like.id, 'posting_id': 1, 'user_id': like.user_id} for like in Like.objects.order_by('id')
+        ])
+        # 5개를 2개씩 끊어 읽는다.
+        self.assertEqual(queries, 3)
+
+    def test_comment_stream_ndjson(self):
+        response, content, _ = self.read('/posting/comment?posting-id=1&stream=ndjson')
+        lines = content.decode('utf-8').splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['content'] for line in lines], ['0', '1', '2', '3', '4'])
+
+    def test_stream_json_byte_compatible(self):
+        _, content, _ = self.read('/posting/like/1?stream=json')
+        paged         = Client().get('/posting/like/1?limit=100').json()['like_list']
+
+        self.assertEqual(content, json.dumps(paged).encode('utf-8'))
+
+    def test_stream_invalid_format(self):
+        response = Client().get('/posting/like/1?stream=xml')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message': 'INVALID FORMAT'})
+
+
+class CommentThreadTest(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        User.objects.create(
+            id      =1,
+            email   ='test1@tes.tes',
+            password=bcrypt.hashpw('123456789'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        Posting.objects.create(
+            id      =1,
+            user_id =1,
+            content ='hi'
+        )
+        # a ─ a1 ─ a11
+        #   └ a2
+        # b ─ b1
+        # c
+        self.a   = Comment.objects.add(1, 1, 'a')
+        self.a1  = Comment.objects.add(1, 1, 'a1', parent=self.a)
+        self.a11 = Comment.objects.add(1, 1, 'a11', parent=self.a1)
+        self.a2  = Comment.objects.add(1, 1, 'a2', parent=self.a)
+        self.b   = Comment.objects.add(1, 1, 'b')
+        self.b1  = Comment.objects.add(1, 1, 'b1', parent=self.b)
+        self.c   = Comment.objects.add(1, 1, 'c')
+        call_command('reconcile_counters', stdout=io.StringIO())
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        User.objects.all().delete()
+        Posting.objects.all().delete()
+
+    def contents(self, nodes):
+        return [(node['content'], self.contents(node['replies'])) for node in nodes]
+
+    def test_add_path_and_depth(self):
+        self.assertEqual(self.a11.path, self.a.path + self.a1.path[-11:] + self.a11.path[-11:])
+        self.assertEqual((self.a11.root_id, self.a11.depth), (self.a.id, 2))
+        self.assertEqual(Comment.objects.get(id=self.a11.id).path, self.a11.path)
+
+    def test_get_thread_branches(self):
+        client = Client()
+
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/posting/comment/thread?posting-id=1&limit=2&replies=2')
+        thread = response.json()['thread']
+
+        # 게시물 확인, 최상위 댓글, 대댓글
+        self.assertEqual(len(context), 3)
+        self.assertEqual(self.contents(thread), [('a', [('a1', [('a11', [])])]), ('b', [('b1', [])])])
+        self.assertEqual([node['reply_count'] for node in thread], [3, 1])
+
+        response = client.get('/posting/comment/thread?posting-id=1&limit=2&cursor=' + response.json()['next_cursor'])
+        self.assertEqual(self.contents(response.json()['thread']), [('c', [])])
+
+    def test_first_replies_without_window(self):
+        # window function 이 없는 server 에서도 같은 대댓글과 대댓글 수를 돌려준다.
+        root_ids = [self.a.id, self.b.id, self.c.id]
+        expected = [(reply.id, reply.reply_total) for reply in Comment.objects.first_replies(root_ids, 2)]
+        replies  = Comment.objects.first_replies_without_window(root_ids, 2)
+
+        self.assertEqual([(reply.id, reply.reply_total) for reply in replies], expected)
+        self.assertEqual(expected, [(self.a1.id, 3), (self.a11.id, 3), (self.b1.id, 1)])
+
+    def test_get_thread_subtree(self):
+        response = Client().get('/posting/comment/thread?comment-id={}'.format(self.a.id))
+        thread   = response.json()['thread']
+
+        self.assertEqual(self.contents(thread), [('a', [('a1', [('a11', [])]), ('a2', [])])])
+        self.assertEqual(thread[0]['replies'][0]['depth'], 1)
+
+        response = Client().get('/posting/comment/thread?comment-id={}'.format(self.a1.id))
+        self.assertEqual(self.contents(response.json()['thread']), [('a1', [('a11', [])])])
+
+    def test_get_thread_not_exist(self):
+        self.assertEqual(Client().get('/posting/comment/thread?comment-id=100').status_code, 404)
+        self.assertEqual(Client().get('/posting/comment/thread?posting-id=100').status_code, 404)
+        self.assertEqual(Client().get('/posting/comment/thread?posting-id=1&replies=0').status_code, 400)
+
+    def test_post_reply_with_parent(self):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+        data    = {'posting_id': 1, 'parent_id': self.a11.id, 'content': 'a111'}
+
+        response = client.post('/posting/comment', json.dumps(data), **headers, content_type='application/json')
+
+        self.assertEqual(response.json(), {'message': 'SUCCESS'})
+        self.assertEqual(Comment.objects.get(content='a111').depth, 3)
+        self.assertEqual(counters.total(PostingCounter, 'posting_id', 1, ['comments', 'replies']), {'comments': 3, 'replies': 5})
+
+    @override_settings(COMMENT_MAX_DEPTH=2)
+    def test_post_reply_too_deep(self):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+        data    = {'comment_id': self.a11.id, 'content': 'a111'}
+
+        response = client.post('/posting/commentofcomment', json.dumps(data), **headers, content_type='application/json')
+
+        self.assertEqual(response.json(), {'message': 'TOO DEEP'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete_subtree(self):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+
+        client.delete('/posting/comment/{}'.format(self.a1.id), **headers)
+        self.assertFalse(Comment.objects.filter(id__in=[self.a1.id, self.a11.id]).exists())
+        self.assertEqual(counters.total(PostingCounter, 'posting_id', 1, ['comments', 'replies']), {'comments': 3, 'replies': 2})
+
+        client.delete('/posting/comment/{}'.format(self.a.id), **headers)
+        self.assertEqual(list(Comment.objects.order_by('id').values_list('content', flat=True)), ['b', 'b1', 'c'])
+        self.assertEqual(counters.total(PostingCounter, 'posting_id', 1, ['comments', 'replies']), {'comments': 2, 'replies': 1})
+
+    def test_comment_list_top_level_only(self):
+        response = Client().get('/posting/comment?posting-id=1')
+
+        self.assertEqual([data['content'] for data in response.json()['comment_data']], ['a', 'b', 'c'])
+
+
+class RelationshipTest(TestCase):
+    def setUp(self):
+        User.objects.bulk_create([
+            User(id=index, email='test{}@naver.com'.format(index), password='123456789')
+            for index in range(1, 4)
+        ])
+        Posting.objects.bulk_create([Posting(id=index, user_id=index, content='hihi') for index in range(1, 4)])
+        Like.objects.create(user_id=1, posting_id=2)
+        Like.objects.create(user_id=2, posting_id=3)
+        Follow.objects.create(from_user_id=1, to_user_id=3)
+        Follow.objects.create(from_user_id=2, to_user_id=1)
+        graph.backend().clear()
+        token_cache.clear()
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        graph.backend().clear()
+        token_cache.clear()
+
+    def test_relationship(self):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+
+        response = client.get('/posting/relationship?posting-ids=1,2,3&user-ids=2,3', **headers)
+        self.assertEqual(response.json(), {
+            'posting': [
+                {'posting_id': 1, 'liked': False},
+                {'posting_id': 2, 'liked': True},
+                {'posting_id': 3, 'liked': False},
+            ],
+            'user'   : [
+                {'user_id': 2, 'following': False},
+                {'user_id': 3, 'following': True},
+            ]
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def test_relationship_one_query(self):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+        path    = '/posting/relationship?posting-ids={}&user-ids={}'.format(
+            ','.join(str(index) for index in range(1, 101)),
+            ','.join(str(index) for index in range(1, 101))
+        )
+
+        client.get(path, **headers)
+        # token 과 follow graph 가 cache 되면 좋아요 IN query 하나만 남는다.
+        with self.assertNumQueries(1):
+            response = client.get(path, **headers)
+        self.assertEqual(len(response.json()['posting']), 100)
+
+    def test_relationship_empty(self):
+        response = Client().get('/posting/relationship', HTTP_Authorization=self.token)
+
+        self.assertEqual(response.json(), {'posting': [], 'user': []})
+
+    def test_relationship_invalid(self):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+
+        response = client.get('/posting/relationship?posting-ids=a', **headers)
+        self.assertEqual(response.json(), {'message': 'KEY ERROR'})
+        self.assertEqual(response.status_code, 400)
+
+        with override_settings(RELATIONSHIP_MAX_IDS=2):
+            response = client.get('/posting/relationship?user-ids=1,2,3', **headers)
+        self.assertEqual(response.json(), {'message': 'TOO MANY'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchTest(TransactionTestCase):
+    # index 는 commit 뒤에 반영되므로 TransactionTestCase 를 쓴다.
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.override  = override_settings(SEARCH_BACKEND='index', SEARCH_INDEX_PATH=os.path.join(self.directory, 'search.sqlite3'))
+        self.override.enable()
+
+        User.objects.create(id=1, email='test1@naver.com', password='123456789')
+        Posting.objects.create(id=1, user_id=1, content='apple banana')
+        Posting.objects.create(id=2, user_id=1, content='Apple apple apple')
+        Posting.objects.create(id=3, user_id=1, content='cherry')
+        Posting.objects.create(id=4, user_id=1, content='안녕하세요 오늘 사과')
+        Comment.objects.add(1, 1, 'banana split')
+        Comment.objects.add(1, 1, 'apple pie')
+        cache.backend().clear()
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        self.override.disable()
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+        cache.backend().clear()
+        token_cache.clear()
+
+    def search(self, **params):
+        return Client().get('/posting/search', params)
+
+    def test_index_failure_does_not_fail_write(self):
+        # 열 수 없는 index 파일 (directory)
+        with override_settings(SEARCH_INDEX_PATH=self.directory), self.assertLogs('posting.search', 'ERROR'):
+            response = Client().post(
+                '/posting',
+                json.dumps({'content': 'durian', 'image': ['durian.jpg']}),
+                content_type       = 'application/json',
+                HTTP_AUTHORIZATION = self.token
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Image.objects.filter(posting__content='durian', image='durian.jpg').exists())
+
+    def test_search_posting_ranked(self):
+        response = self.search(q='apple')
+
+        self.assertEqual([data['id'] for data in response.json()['posting_list']], [2, 1])
+        self.assertEqual(response.json()['posting_list'][0]['content'], 'Apple apple apple')
+        self.assertEqual(response.status_code, 200)
+
+    def test_search_multiple_terms(self):
+        response = self.search(q='banana cherry')
+
+        self.assertEqual(sorted(data['id'] for data in response.json()['posting_list']), [1, 3])
+
+    def test_search_korean(self):
+        response = self.search(q='사과')
+
+        self.assertEqual([data['id'] for data in response.json()['posting_list']], [4])
+
+    def test_search_comment(self):
+        response = self.search(q='banana', type='comment')
+
+        self.assertEqual([data['content'] for data in response.json()['comment_data']], ['banana split'])
+
+    def test_search_paginate(self):
+        first = self.search(q='apple', limit=1).json()
+        self.assertEqual([data['id'] for data in first['posting_list']], [2])
+
+        second = self.search(q='apple', limit=1, cursor=first['next_cursor']).json()
+        self.assertEqual([data['id'] for data in second['posting_list']], [1])
+        self.assertIsNone(second['next_cursor'])
+
+    @override_settings(SEARCH_MAX_RESULTS=1)
+    def test_search_max_results(self):
+        first = self.search(q='apple', limit=5).json()
+        self.assertEqual([data['id'] for data in first['posting_list']], [2])
+        self.assertIsNone(first['next_cursor'])
+
+        # 끝을 넘어선 offset 도 뒤로 돌아가는 cursor 를 만들지 않는다.
+        response = self.search(q='apple', cursor=encode_cursor(10 ** 9))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'posting_list': [], 'next_cursor': None})
+
+    def test_search_incremental(self):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+
+        client.patch('/posting/3', json.dumps({'content': 'cherry apple', 'image': []}), **headers, content_type='application/json')
+        self.assertEqual(sorted(data['id'] for data in self.search(q='apple').json()['posting_list']), [1, 2, 3])
+
+        Posting.objects.filter(id=2).delete()
+        self.assertEqual(sorted(data['id'] for data in self.search(q='apple').json()['posting_list']), [1, 3])
+
+    def test_search_batch(self):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+        data    = {'operations': [
+            {'type': 'posting', 'content': 'durian', 'image': []},
+            {'type': 'comment', 'posting_id': 3, 'content': 'durian smoothie'},
+        ]}
+
+        client.post('/posting/batch', json.dumps(data), **headers, content_type='application/json')
+        self.assertEqual(len(self.search(q='durian').json()['posting_list']), 1)
+        self.assertEqual(len(self.search(q='durian', type='comment').json()['comment_data']), 1)
+
+    def test_rebuild_search_index(self):
+        search.backend().clear('posting')
+        self.assertEqual(self.search(q='apple').json()['posting_list'], [])
+
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual([data['id'] for data in self.search(q='apple').json()['posting_list']], [2, 1])
+
+    def test_search_key_error(self):
+        response = self.search(q=' ')
+
+        self.assertEqual(response.json(), {'message': 'KEY ERROR'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TagTest(TestCase):
+    def setUp(self):
+        User.objects.create(id=1, email='test1@naver.com', password='123456789')
+        User.objects.create(id=2, email='test2@naver.com', password='123456789')
+        cache.backend().clear()
+        token_cache.clear()
+        expire       = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token   = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+        self.token_2 = jwt.encode({'user_id': 2, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        cache.backend().clear()
+        token_cache.clear()
+
+    def post(self, content, token=None):
+        Client().post(
+            '/posting',
+            json.dumps({'content': content, 'image': []}),
+            HTTP_Authorization=token or self.token,
+            content_type='application/json'
+        )
+        return Posting.objects.latest('id')
+
+    def post_count(self, name):
+        tag = Tag.objects.get(name=name)
+        return tags.post_counts([tag.id])[tag.id]
+
+    def test_parse(self):
+        self.assertEqual(tags.parse_tags('#Sun #sun #해변, #sun_set!'), ['sun', '해변', 'sun_set'])
+        self.assertEqual(tags.parse_mentions('hi @test1@naver.com. mail test2@naver.com'), ['test1@naver.com'])
+
+    def test_post_posting_tags_and_mentions(self):
+        posting = self.post('#Sun #beach with @test2@naver.com and @nobody@naver.com')
+
+        self.assertEqual(sorted(PostingTag.objects.filter(posting=posting).values_list('tag__name', flat=True)), ['beach', 'sun'])
+        self.assertEqual(self.post_count('sun'), 1)
+        self.assertEqual(list(Mention.objects.values_list('posting_id', 'comment_id', 'user_id')), [(posting.id, None, 2)])
+
+    def test_tag_list_paginate(self):
+        first  = self.post('#sun one')
+        second = self.post('#sun two')
+        self.post('#rain')
+        client = Client()
+
+        response = client.get('/posting/tag/SUN?limit=1')
+        page     = response.json()
+        self.assertEqual(page['tag'], 'sun')
+        self.assertEqual(page['post_count'], 2)
+        self.assertEqual([data['id'] for data in page['posting_list']], [second.id])
+
+        response = client.get('/posting/tag/sun', {'limit': 1, 'cursor': page['next_cursor']})
+        self.assertEqual([data['id'] for data in response.json()['posting_list']], [first.id])
+        self.assertIsNone(response.json()['next_cursor'])
+
+    def test_tag_not_found(self):
+        response = Client().get('/posting/tag/nothing')
+
+        self.assertEqual(response.json(), {'message': 'NOT FOUND'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_patch_updates_tags(self):
+        posting = self.post('#sun #beach @test2@naver.com')
+
+        Client().patch(
+            '/posting/{}'.format(posting.id),
+            json.dumps({'content': '#beach #sea', 'image': []}),
+            HTTP_Authorization=self.token,
+            content_type='application/json'
+        )
+
+        self.assertEqual(sorted(PostingTag.objects.filter(posting=posting).values_list('tag__name', flat=True)), ['beach', 'sea'])
+        self.assertEqual(self.post_count('sun'), 0)
+        self.assertEqual(self.post_count('beach'), 1)
+        self.assertFalse(Mention.objects.exists())
+
+    def test_delete_posting_releases_tags(self):
+        posting = self.post('#sun')
+
+        Client().delete('/posting/{}'.format(posting.id), HTTP_Authorization=self.token)
+
+        self.assertEqual(self.post_count('sun'), 0)
+
+    def test_comment_tags_and_mentions(self):
+        posting = self.post('#sun')
+        client  = Client()
+
+        for token, content in [(self.token, '#beach by author'), (self.token_2, '#rain @test1@naver.com')]:
+            client.post(
+                '/posting/comment',
+                json.dumps({'posting_id': posting.id, 'content': content}),
+                HTTP_Authorization=token,
+                content_type='application/json'
+            )
+
+        # 작성자가 아닌 user 의 댓글 hashtag 는 게시물에 붙지 않는다.
+        self.assertEqual(sorted(PostingTag.objects.filter(posting=posting).values_list('tag__name', flat=True)), ['beach', 'sun'])
+        self.assertFalse(PostingTag.objects.filter(tag__name='rain').exists())
+        comment = Comment.objects.get(content__startswith='#rain')
+        self.assertEqual(list(Mention.objects.values_list('posting_id', 'comment_id', 'user_id')), [(posting.id, comment.id, 1)])
+
+    def test_trending(self):
+        self.post('#sun')
+        self.post('#sun #rain')
+        self.post('#beach')
+        # 오래된 bucket 은 인기 tag 에 들어가지 않는다.
+        old = tags.bucket(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=2))
+        TagActivity.objects.create(tag=Tag.objects.get(name='beach'), bucket=old, count=100)
+
+        response = Client().get('/posting/trending/tag?limit=2')
+
+        self.assertEqual(response.json(), {'trending': [
+            {'name': 'sun', 'recent_count': 2, 'post_count': 2},
+            {'name': 'rain', 'recent_count': 1, 'post_count': 1},
+        ]})
+        self.assertEqual(response.status_code, 200)
+
+
+class MetricsTest(TransactionTestCase):
+    def setUp(self):
+        User.objects.create(id=1, email='test1@naver.com', password='123456789')
+        Posting.objects.create(id=1, user_id=1, content='hihi')
+        cache.backend().clear()
+        metrics.clear()
+
+    def tearDown(self):
+        cache.backend().clear()
+        metrics.clear()
+
+    def scrape(self):
+        response = Client().get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode('utf-8')
+
+    def value(self, text, sample):
+        for line in text.splitlines():
+            if line.startswith(sample + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return None
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_request_recorded(self):
+        Client().get('/posting/list/1')
+        text   = self.scrape()
+        labels = '{view="PostingListView",method="GET"}'
+
+        self.assertEqual(self.value(text, 'westagram_request_latency_seconds_count' + labels), 1)
+        self.assertEqual(self.value(text, 'westagram_request_latency_seconds_bucket{view="PostingListView",method="GET",le="+Inf"}'), 1)
+        self.assertGreater(self.value(text, 'westagram_request_queries_sum' + labels), 0)
+        self.assertGreater(self.value(text, 'westagram_request_db_seconds_sum' + labels), 0)
+        self.assertGreater(self.value(text, 'westagram_request_serialization_seconds_sum' + labels), 0)
+        self.assertEqual(self.value(text, 'westagram_request_duplicate_queries_sum' + labels), 0)
+        self.assertEqual(self.value(text, 'westagram_metrics_sample_rate'), 1)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        Client().get('/posting/list/1')
+
+        self.assertNotIn('PostingListView', self.scrape())
+
+    @override_settings(METRICS_N_PLUS_ONE_THRESHOLD=3)
+    def test_duplicate_queries(self):
+        recorder = metrics.Recorder()
+        token    = metrics.current.set(recorder)
+        try:
+            metrics.install(connection)
+            for posting_id in range(3):
+                Posting.objects.filter(id=posting_id).exists()
+            User.objects.filter(id=1).exists()
+        finally:
+            metrics.current.reset(token)
+        metrics.record(RequestFactory().get('/nothing'), recorder, 0.01)
+        text = self.scrape()
+
+        self.assertEqual((recorder.queries, recorder.duplicates()), (4, 2))
+        self.assertEqual(self.value(text, 'westagram_request_duplicate_queries_sum{view="unmatched",method="GET"}'), 2)
+        self.assertEqual(self.value(text, 'westagram_n_plus_one_total{view="unmatched",method="GET"}'), 1)
+
+    def test_async_queries_recorded(self):
+        recorder = metrics.Recorder()
+        token    = metrics.current.set(recorder)
+        try:
+            async_to_sync(executors.database_sync_to_async(lambda: User.objects.filter(id=1).exists()))()
+        finally:
+            metrics.current.reset(token)
+
+        self.assertEqual(recorder.queries, 1)
+
+    def test_histogram_buckets_cumulative(self):
+        histogram = metrics.Histogram('test', 'test', (1, 5))
+        for value in (0, 3, 3, 10):
+            histogram.observe(('A', 'GET'), value)
+
+        self.assertEqual(histogram.render()[2:], [
+            'test_bucket{view="A",method="GET",le="1"} 1',
+            'test_bucket{view="A",method="GET",le="5"} 3',
+            'test_bucket{view="A",method="GET",le="+Inf"} 4',
+            'test_sum{view="A",method="GET"} 16',
+            'test_count{view="A",method="GET"} 4',
+        ])
+
+
+class PoolTest(TransactionTestCase):
+    def setUp(self):
+        User.objects.create(id=1, email='test1@naver.com', password='123456789')
+        cache.backend().clear()
+        metrics.clear()
+
+    def tearDown(self):
+        cache.backend().clear()
+        metrics.clear()
+
+    def test_usage(self):
+        connection.ensure_connection()
+        with pool.checkout():
+            self.assertGreaterEqual(pool.usage()[('default', 'in_use')], 1)
+        self.assertGreaterEqual(pool.usage()[('default', 'idle')], 1)
+
+        text = Client().get('/metrics').content.decode('utf-8')
+        self.assertIn('westagram_db_connections{alias="default",state="idle"}', text)
+
+    def test_wait_recorded(self):
+        async_to_sync(executors.database_sync_to_async(lambda: User.objects.filter(id=1).exists()))()
+
+        self.assertIn('westagram_db_pool_wait_seconds_count 1', '\n'.join(pool.WAIT.render()))
+
+    @override_settings(DATABASE_HEALTH_CHECK_IDLE=10)
+    def test_health_check(self):
+        connection.ensure_connection()
+        connection.pool_last_used = time.monotonic() - 5
+        with pool.checkout():
+            pass
+        self.assertEqual(pool.HEALTH_CHECKS.render()[2:], [])
+
+        # 오래 쉬는 동안 끊긴 connection
+        connection.pool_last_used = time.monotonic() - 60
+        connection.is_usable      = lambda: False
+        try:
+            with pool.checkout():
+                pass
+        finally:
+            del connection.is_usable
+        self.assertEqual(pool.HEALTH_CHECKS.render()[2:], ['westagram_db_health_checks_total{alias="default",result="failed"} 1'])
+        self.assertTrue(User.objects.filter(id=1).exists())
+
+
+class ReplicaTest(TransactionTestCase):
+    """default 를 복사한 SQLite 파일 두 개를 replica 로 쓴다. replicate() 다음에 default 에 쓴 row 는 replica 에 없다."""
+
+    REPLICAS = ['replica-1', 'replica-2']
+
+    def setUp(self):
+        User.objects.create(id=1, email='test1@naver.com', password='123456789')
+        Posting.objects.create(id=1, user_id=1, content='hihi')
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+        self.directory = tempfile.TemporaryDirectory()
+        for alias in self.REPLICAS:
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME'  : os.path.join(self.directory.name, alias + '.sqlite3')
+            }
+        self.replicate()
+        self.settings = override_settings(DATABASE_REPLICAS=self.REPLICAS)
+        self.settings.enable()
+        cache.backend().clear()
+
+    def tearDown(self):
+        self.settings.disable()
+        for alias in self.REPLICAS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        self.directory.cleanup()
+        cache.backend().clear()
+
+    def replicate(self):
+        connection.ensure_connection()
+        for alias in self.REPLICAS:
+            connections[alias].close()
+            replica = sqlite3.connect(connections.databases[alias]['NAME'])
+            connection.connection.backup(replica)
+            replica.close()
+
+    def comments(self, client, **headers):
+        response = client.get('/posting/comment', {'posting-id': 1}, **headers)
+        return [comment['content'] for comment in response.json()['comment_data']]
+
+    def test_reads_go_to_replica(self):
+        Comment.objects.create(posting_id=1, user_id=1, path=path_segment(1), content='new')
+
+        self.assertEqual(self.comments(Client()), [])
+        # request 밖(management command, signal 처리)에서는 default 에서 읽는다.
+        self.assertEqual(Comment.objects.all().db, 'default')
+
+    def test_sticky_after_write(self):
+        client   = Client()
+        response = client.post(
+            '/posting/comment',
+            json.dumps({'posting_id': 1, 'content': 'new'}),
+            content_type       = 'application/json',
+            HTTP_AUTHORIZATION = self.token
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.comments(client), ['new'])
+        # cookie 가 없어도 같은 token 이면 default 에서 읽는다.
+        self.assertEqual(self.comments(Client(), HTTP_AUTHORIZATION=self.token), ['new'])
+        self.assertEqual(self.comments(Client()), [])
+
+    def test_failed_write_not_sticky(self):
+        response = Client().post(
+            '/posting/comment',
+            json.dumps({'posting_id': 2, 'content': 'new'}),
+            content_type       = 'application/json',
+            HTTP_AUTHORIZATION = self.token
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+    def test_transaction_reads_primary(self):
+        token = replicas.current.set('replica-1')
+        try:
+            self.assertEqual(Comment.objects.all().db, 'replica-1')
+            with transaction.atomic():
+                self.assertEqual(Comment.objects.all().db, 'default')
+        finally:
+            replicas.current.reset(token)
+
+    def test_cache_filled_from_primary(self):
+        Posting.objects.create(id=2, user_id=1, content='new')
+
+        response = Client().get('/posting/list/1')
+
+        self.assertEqual([posting['id'] for posting in response.json()['posting_list']], [2, 1])
+
+
+@override_settings(BCRYPT_ROUNDS=4)
+class SyntheticTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings  = override_settings(SEARCH_INDEX_PATH=os.path.join(self.directory.name, 'search.sqlite3'))
+        self.settings.enable()
+        cache.backend().clear()
+        token_cache.clear()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+        cache.backend().clear()
+
+    def generate(self):
+        generator = synthetic.Generator(users=20, follows=5, posts=2, images=1, comments=2, replies=1, likes=3)
+        return generator, generator.run()
+
+    def test_rows(self):
+        generator, rows = self.generate()
+
+        self.assertEqual(
+            {table: rows[table] for table in ('User', 'Posting', 'Image', 'Comment', 'Like')},
+            {'User': 20, 'Posting': 40, 'Image': 40, 'Comment': 160, 'Like': 120}
+        )
+        self.assertEqual(rows['Follow'], Follow.objects.count())
+        self.assertFalse(Follow.objects.filter(from_user_id=F('to_user_id')).exists())
+
+        reply = Comment.objects.filter(parent__isnull=False).select_related('parent').first()
+        self.assertEqual(reply.path, reply.parent.path + path_segment(reply.id))
+        # 작성자 본인의 timeline 에는 자기 게시물이 모두 들어간다.
+        self.assertEqual(Timeline.objects.filter(user_id=F('author_id')).count(), 40)
+        self.assertTrue(search.search('posting', Posting.objects.first().content, 0, 1))
+
+    def test_counters_match_rows(self):
+        self.generate()
+        postings = counters.totals(PostingCounter, 'posting_id', list(Posting.objects.values_list('id', flat=True)), ['likes', 'comments', 'replies'])
+        users    = counters.totals(UserCounter, 'user_id', list(User.objects.values_list('id', flat=True)), ['followers', 'following', 'posts'])
+
+        call_command('reconcile_counters', stdout=io.StringIO())
+
+        self.assertEqual(postings, counters.totals(PostingCounter, 'posting_id', list(postings), ['likes', 'comments', 'replies']))
+        self.assertEqual(users, counters.totals(UserCounter, 'user_id', list(users), ['followers', 'following', 'posts']))
+
+    def test_sign_in_with_seed_password(self):
+        generator, _ = self.generate()
+        response     = Client().post(
+            '/user/signin',
+            json.dumps({'email': synthetic.EMAIL.format(generator.user_id(0)), 'password': synthetic.PASSWORD}),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_seed_command(self):
+        output = io.StringIO()
+        call_command('seed', users=20, follows=5, posts=2, comments=2, replies=1, likes=3, chunk_users=7, stdout=output)
+        lines  = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        self.assertEqual([line['phase'] for line in lines], list(synthetic.Generator.PHASES) + ['total'])
+        self.assertEqual(lines[-1]['rows']['Comment'], Comment.objects.count())
+        self.assertEqual(lines[-1]['rows']['Timeline'], Timeline.objects.count())
+        # user 범위를 나눠 만들어도 한 번에 만든 것과 id 가 같다.
+        self.assertEqual(
+            list(Comment.objects.filter(parent__isnull=False).values_list('id', 'root_id')[:2]),
+            [(2, 1), (4, 3)]
+        )
+
+    def test_bench_covers_every_route(self):
+        self.assertEqual(bench.uncovered(), [])
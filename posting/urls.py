@@ -1,13 +1,25 @@
 from django.urls import path
-from .           import views
+from django.conf import settings
+
+if settings.ASYNC_VIEWS:
+    from . import async_views as views
+else:
+    from . import views
 
 app_name = 'posting'
 urlpatterns = [
     path('', views.PostingDetailView.as_view()),
     path('/<int:posting_id>', views.PostingDetailView.as_view()),
+    path('/batch', views.BatchView.as_view()),
     path('/list/<int:user_id>', views.PostingListView.as_view()),
+    path('/feed', views.FeedView.as_view()),
     path('/comment', views.CommentView.as_view()),
     path('/comment/<int:comment_id>', views.CommentView.as_view()),
+    path('/comment/thread', views.CommentThreadView.as_view()),
     path('/commentofcomment', views.CommentOfCommentView.as_view()),
     path('/like/<int:posting_id>', views.LikeView.as_view()),
+    path('/relationship', views.RelationshipView.as_view()),
+    path('/search', views.SearchView.as_view()),
+    path('/tag/<str:name>', views.TagView.as_view()),
+    path('/trending/tag', views.TrendingTagView.as_view()),
 ]
\ No newline at end of file
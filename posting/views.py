@@ -1,13 +1,75 @@
 import json
 import datetime
 
-from django.views     import View
-from django.http      import JsonResponse
-from django.db.models import Q
+from django.views                 import View
+from django.conf                  import settings
+from django.db                    import transaction
+from django.db.models             import Q, Count, Max
 
-from user.utils       import login_decorator
-from user.models      import User
-from .models          import Posting, Image, Comment, Like, CommentOfComment
+from user.utils                   import login_decorator, parse_ids
+from user                         import graph
+from user.models                  import User, UserCounter
+from westagram_project            import counters
+from westagram_project.pagination import InvalidPage, page_params, paginate, iterate, encode_cursor
+from westagram_project.conditional import make_etag, conditional_response
+from westagram_project            import renderers
+from westagram_project.renderers   import JsonResponse, minutes
+from .models                      import Posting, Image, Comment, Like, PostingCounter, Tag, PostingTag
+from .serializers                 import serialize_postings
+from .                            import feed, batch, cache, search, tags
+
+
+def entry_validator(entry):
+    # payload 중 바뀔 수 있는 값은 게시물 수정 시각과 좋아요, 댓글 수 뿐이다.
+    return entry.payload['id'], entry.updated_at, entry.payload['like_count'], entry.payload['comment_count']
+
+
+def stream_response(request, queryset, keys, serialize):
+    """?stream=json|ndjson 이면 page 없이 전체 목록을 keyset chunk 단위로 읽으면서 흘려보낸다."""
+    format = request.GET['stream']
+    if format not in renderers.STREAM_FORMATS:
+        return JsonResponse({'message': 'INVALID FORMAT'}, status=400)
+
+    return renderers.stream(serialize(iterate(queryset, keys, settings.STREAM_CHUNK_SIZE)), format)
+
+
+def add_comment(request, posting_id, content, parent=None):
+    if parent is not None and parent.depth >= settings.COMMENT_MAX_DEPTH:
+        return JsonResponse({'message': 'TOO DEEP'}, status=400)
+
+    # 댓글 수까지 바뀐 뒤에 commit 되어야 cache 가 예전 댓글 수를 다시 담지 않는다.
+    with transaction.atomic():
+        comment = Comment.objects.add(posting_id, request.user.id, content, parent)
+        tags.attach_comments([comment])
+        if parent is None:
+            counters.increment(PostingCounter, 'posting_id', posting_id, comments=1)
+        else:
+            counters.increment(PostingCounter, 'posting_id', posting_id, replies=1)
+
+    return JsonResponse({'message': 'SUCCESS'}, status=200)
+
+
+def comment_node(id, user_id, content, depth, created_at):
+    return {
+        'id'        : id,
+        'user_id'   : user_id,
+        'content'   : content,
+        'depth'     : depth,
+        'created_at': minutes(created_at),
+        'replies'   : []
+    }
+
+
+def build_tree(rows):
+    """path 순서로 정렬된 (id, parent_id, node) 를 중첩된 replies 트리로 만든다. 부모가 없는 node 가 최상위가 된다."""
+    nodes, top = {}, []
+    for id, parent_id, node in rows:
+        nodes[id] = node
+        if parent_id in nodes:
+            nodes[parent_id]['replies'].append(node)
+        else:
+            top.append(node)
+    return top
 
 
 class PostingDetailView(View):
@@ -15,38 +77,43 @@ class PostingDetailView(View):
     def post(self, request):
         data = json.loads(request.body)
         try:
-            posting = Posting.objects.create(user=request.user, content=data.get('content', None))
+            posting = Posting.objects.create(
+                user      = request.user,
+                content   = data.get('content', None),
+                is_pushed = feed.is_pushed(request.user.id)
+            )
             
-            for image in data['image']:
-                Image.objects.create(image=image, posting=posting)
+            Image.objects.bulk_create([Image(image=image, posting=posting) for image in data['image']])
+            tags.attach([posting])
+
+            feed.fan_out(posting)
+            counters.increment(UserCounter, 'user_id', request.user.id, posts=1)
 
             return JsonResponse({'message': 'SUCCESS'}, status=200)
         
         except KeyError:
             return JsonResponse({'message': 'KEY ERROR'}, status=400)
 
-    def get(self, posting_id):
-        try:
-            posting = Posting.objects.get(id=posting_id)
-
-            result = {
-                'id'        : posting_id,
-                'content'   : posting.content,
-                'image'     : [data.image for data in Image.objects.filter(posting=posting)],
-                'created_at': posting.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            }
-
-            return JsonResponse({'posting_data': [result]}, status=200)
-        except Posting.DoesNotExist:
+    def get(self, request, posting_id):
+        entry = cache.get_posting(posting_id)
+        if entry is None:
             return JsonResponse({'message': 'NOT FOUND'}, status=404)
 
+        return conditional_response(
+            request,
+            lambda: JsonResponse({'posting_data': [entry.payload]}, status=200),
+            make_etag(entry_validator(entry))
+        )
+
     @login_decorator
     def patch(self, request, posting_id):
         try:
             data = json.loads(request.body)
             posting = Posting.objects.get(id=posting_id)
+            old_content = posting.content
             posting.content = data['content']
             posting.save()
+            tags.update(posting, old_content)
             
             Image.objects.filter(posting_id=posting_id).delete()
             image_list = data['image']
@@ -55,6 +122,8 @@ class PostingDetailView(View):
             for image in image_list:
                 bulk_create_list.append(Image(image=image, posting_id=posting_id))
             Image.objects.bulk_create(bulk_create_list)
+            # bulk_create 는 signal 을 보내지 않는다.
+            cache.invalidate_postings([posting_id])
 
             return JsonResponse({'message': 'SUCCESS'}, status=200)
         
@@ -62,9 +131,11 @@ class PostingDetailView(View):
             return JsonResponse({'message': 'NOT FOUND'}, status=404)
 
     @login_decorator
-    def delete(self, posting_id):
+    def delete(self, request, posting_id):
         try:
-            Posting.objects.get(id=posting_id).delete()
+            posting = Posting.objects.get(id=posting_id)
+            posting.delete()
+            counters.increment(UserCounter, 'user_id', posting.user_id, posts=-1)
             
             return JsonResponse({'message': 'SUCCESS'}, status=200)
         
@@ -72,34 +143,69 @@ class PostingDetailView(View):
             return JsonResponse({'message': 'NOT FOUND'}, status=404)
 
 
+class BatchView(View):
+    @login_decorator
+    def post(self, request):
+        try:
+            data    = json.loads(request.body)
+            results = batch.apply(request.user, data['operations'])
+
+            return JsonResponse({'message': 'SUCCESS', 'results': results}, status=200)
+
+        except KeyError:
+            return JsonResponse({'message': 'KEY ERROR'}, status=400)
+
+        except batch.InvalidBatch as error:
+            return JsonResponse({'message': str(error)}, status=400)
+
+
 class PostingListView(View):
-    def get(self, user_id):
-        posting = Posting.objects.filter(user_id=user_id).prefetch_related('image_set')
+    def get(self, request, user_id):
+        try:
+            limit, cursor     = page_params(request)
+            entries, position = cache.get_posting_list(user_id, limit, cursor)
+        except InvalidPage:
+            return JsonResponse({'message': 'INVALID PAGE'}, status=400)
 
-        results = [{
-            'id'        : data.id,
-            'content'   : data.content,
-            'image'     : [data.image for data in Image.objects.filter(posting=data)],
-            'created_at': data.created_at.strftime('%Y-%m-%d %H:%M:%S')
-        } for data in posting]
+        next_cursor = encode_cursor(position)
+        results     = [entry.payload for entry in entries]
+
+        return conditional_response(
+            request,
+            lambda: JsonResponse({'posting_list': results, 'next_cursor': next_cursor}, status=200),
+            make_etag(next_cursor, [entry_validator(entry) for entry in entries])
+        )
+
+
+class FeedView(View):
+    @login_decorator
+    def get(self, request):
+        try:
+            limit, cursor = page_params(request)
+            postings, position = feed.read(request.user.id, limit, cursor)
+        except InvalidPage:
+            return JsonResponse({'message': 'INVALID PAGE'}, status=400)
+
+        results = serialize_postings(postings)
+
+        return JsonResponse({'feed': results, 'next_cursor': encode_cursor(position)}, status=200)
 
-        return JsonResponse({'posting_list': results}, status=200)
 
 class CommentView(View):
     @login_decorator
     def post(self, request):
         data = json.loads(request.body)
         try:
-            if not Posting.objects.filter(id=data['posting_id']).exists():
+            parent = None
+            if data.get('parent_id') is not None:
+                parent = Comment.objects.filter(id=data['parent_id'], posting_id=data['posting_id']).first()
+                if parent is None:
+                    return JsonResponse({'message': 'NOT FOUND'}, status=404)
+
+            elif not Posting.objects.filter(id=data['posting_id']).exists():
                 return JsonResponse({'message': 'NOT FOUND'}, status=404)
 
-            Comment.objects.create(
-                posting_id = data['posting_id'],
-                user       = request.user,
-                content    = data['content']
-            )
-            
-            return JsonResponse({'message': 'SUCCESS'}, status=200)
+            return add_comment(request, data['posting_id'], data['content'], parent)
         
         except KeyError:
             return JsonResponse({'message': 'KEY ERROR'}, status=400)
@@ -109,21 +215,57 @@ class CommentView(View):
         if not Posting.objects.filter(id=posting_id).exists():
             return JsonResponse({'message': 'NOT FOUND'}, status=404)
 
-        results = Comment.objects.filter(posting_id=posting_id).select_related('user')
-        result = [{
-            'id'         : data.id,
-            'content'    : data.content,
-            'user_id'    : data.user.id,
-            'posting_id' : posting_id,
-            'created_at' : data.created_at.strftime('%Y-%m-%d %H:%M')
-        } for data in results]
+        # 댓글이 추가, 삭제되면 count 가, 수정되면 max updated_at 이 바뀐다. 대댓글은 목록에 넣지 않는다.
+        comments  = Comment.objects.filter(posting_id=posting_id, parent__isnull=True)
+        validator = comments.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+        rows      = comments.values_list('id', 'content', 'user_id', 'created_at')
+
+        def serialize(rows):
+            return ({
+                'id'         : id,
+                'content'    : content,
+                'user_id'    : user_id,
+                'posting_id' : posting_id,
+                'created_at' : minutes(created_at)
+            } for id, content, user_id, created_at in rows)
+
+        def build():
+            if 'stream' in request.GET:
+                return stream_response(request, rows, ('created_at', 'id'), serialize)
+
+            try:
+                limit, cursor = page_params(request)
+                results, position = paginate(rows, ('created_at', 'id'), limit, cursor)
+            except InvalidPage:
+                return JsonResponse({'message': 'INVALID PAGE'}, status=400)
 
-        return JsonResponse({'comment_data': result}, status=200)
+            result = list(serialize(results))
+
+            return JsonResponse({'comment_data': result, 'next_cursor': encode_cursor(position)}, status=200)
+
+        return conditional_response(
+            request,
+            build,
+            make_etag(validator['count'], validator['updated_at'])
+        )
 
     @login_decorator
-    def delete(self, comment_id):
+    def delete(self, request, comment_id):
         try:
-            Comment.objects.get(id=comment_id).delete()
+            comment = Comment.objects.get(id=comment_id)
+            # 댓글을 지우면 그 아래 대댓글도 모두 지워진다.
+            if comment.parent_id is None:
+                subtree = Comment.objects.filter(Q(id=comment.id) | Q(root_id=comment.id))
+            else:
+                subtree = Comment.objects.filter(root_id=comment.root_id, path__startswith=comment.path)
+            size = subtree.count()
+
+            with transaction.atomic():
+                subtree.delete()
+                if comment.parent_id is None:
+                    counters.increment(PostingCounter, 'posting_id', comment.posting_id, comments=-1, replies=1 - size)
+                else:
+                    counters.increment(PostingCounter, 'posting_id', comment.posting_id, replies=-size)
             
             return JsonResponse({'message': 'SUCCESS'}, status=200)
         
@@ -136,58 +278,261 @@ class CommentOfCommentView(View):
     def post(self, request):
         data = json.loads(request.body)
         
-        if not Comment.objects.filter(id=data['comment_id']).exists():
+        parent = Comment.objects.filter(id=data['comment_id']).first()
+        if parent is None:
             return JsonResponse({'message': 'NOT FOUND'}, status=404)
         
-        CommentOfComment.objects.create(
-            user          = request.user, 
-            comment_id    = data['comment_id'],
-            content       = data['content']
-            )
-        
-        return JsonResponse({'message': 'SUCCESS'}, status=200)
+        return add_comment(request, parent.posting_id, data['content'], parent)
     
     def get(self, request):
         comment_id = request.GET.get('comment-id', None)
         if not Comment.objects.filter(id=comment_id).exists():
             return JsonResponse({'message': 'NOT FOUND'}, status=404)
 
-        comments = CommentOfComment.objects.filter(comment_id=comment_id).select_related('user')
-        results = [{
-            'id'        : data.id,
-            'user_id'   : data.user.id,
-            'content'   : data.content,
-            'comment_id': data.comment.id
-        } for data in comments]
+        replies   = Comment.objects.filter(parent_id=comment_id)
+        validator = replies.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+
+        def build():
+            try:
+                limit, cursor = page_params(request)
+                comments, position = paginate(
+                    replies.values_list('id', 'user_id', 'content', 'parent_id'),
+                    ('id',),
+                    limit,
+                    cursor
+                )
+            except InvalidPage:
+                return JsonResponse({'message': 'INVALID PAGE'}, status=400)
+
+            results = [{
+                'id'        : id,
+                'user_id'   : user_id,
+                'content'   : content,
+                'comment_id': comment_id
+            } for id, user_id, content, comment_id in comments]
 
-        return JsonResponse({'comment_of_comment_list': results}, status=200)
+            return JsonResponse({'comment_of_comment_list': results, 'next_cursor': encode_cursor(position)}, status=200)
+
+        return conditional_response(
+            request,
+            build,
+            make_etag(validator['count'], validator['updated_at'])
+        )
+
+
+class CommentThreadView(View):
+    """댓글 트리를 중첩된 replies 로 돌려준다.
+
+    comment-id 를 주면 그 댓글 아래 전체 트리를, posting-id 를 주면 최상위 댓글 한 page 와
+    각 최상위 댓글의 처음 replies 개 대댓글을 돌려준다. 어느 쪽이든 query 수는 트리 크기와 관계없다.
+    """
+
+    FIELDS = ('id', 'parent_id', 'user_id', 'content', 'depth', 'created_at')
+
+    def get(self, request):
+        if 'comment-id' in request.GET:
+            return self.subtree(request.GET['comment-id'])
+
+        posting_id = request.GET.get('posting-id', None)
+        if not Posting.objects.filter(id=posting_id).exists():
+            return JsonResponse({'message': 'NOT FOUND'}, status=404)
+
+        try:
+            limit, cursor = page_params(request)
+            replies       = int(request.GET.get('replies', settings.COMMENT_THREAD_REPLIES))
+            if replies < 1:
+                raise InvalidPage
+
+            roots, position = paginate(
+                Comment.objects.filter(posting_id=posting_id, parent__isnull=True).values_list(*self.FIELDS),
+                ('created_at', 'id'),
+                limit,
+                cursor
+            )
+        except (InvalidPage, ValueError):
+            return JsonResponse({'message': 'INVALID PAGE'}, status=400)
+
+        rows = [(id, None, comment_node(id, user_id, content, depth, created_at))
+                for id, _, user_id, content, depth, created_at in roots]
+        top  = {node['id']: node for _, _, node in rows}
+        for node in top.values():
+            node['reply_count'] = 0
+
+        for reply in Comment.objects.first_replies(list(top), replies):
+            top[reply.root_id]['reply_count'] = reply.reply_total
+            rows.append((reply.id, reply.parent_id, comment_node(
+                reply.id, reply.user_id, reply.content, reply.depth, reply.created_at
+            )))
+
+        return JsonResponse({'thread': build_tree(rows), 'next_cursor': encode_cursor(position)}, status=200)
+
+    def subtree(self, comment_id):
+        comment = Comment.objects.filter(id=comment_id).only('id', 'root_id', 'path').first()
+        if comment is None:
+            return JsonResponse({'message': 'NOT FOUND'}, status=404)
+
+        if comment.root_id is None:
+            comments = Comment.objects.filter(Q(id=comment.id) | Q(root_id=comment.id))
+        else:
+            comments = Comment.objects.filter(root_id=comment.root_id, path__startswith=comment.path)
+
+        rows = comments.order_by('path').values_list(*self.FIELDS)
+        tree = build_tree(
+            (id, parent_id, comment_node(id, user_id, content, depth, created_at))
+            for id, parent_id, user_id, content, depth, created_at in rows
+        )
+
+        return JsonResponse({'thread': tree}, status=200)
 
 
 class LikeView(View):
     @login_decorator
     def post(self, request, posting_id):
-        data = json.loads(request.body)
-        
-        if not Posting.objects.filter(id=posting_id).exists():
+        try:
+            liked, changed = Like.objects.toggle(request.user.id, posting_id)
+        except Posting.DoesNotExist:
             return JsonResponse({'message': 'NOT FOUND'}, status=404)
-        
-        if Like.objects.filter(Q(user=request.user) & Q(posting_id=posting_id)).exists():
-            # 이미 좋아요를 누른 user라서 한번 더 누르면 좋아요 취소로 설정
-            Like.objects.filter(Q(user=request.user) & Q(posting_id=posting_id)).delete()
-        
-        Like.objects.create(user=request.user, posting_id=posting_id)
-        
-        return JsonResponse({'message': 'SUCCESS'}, status=200)
 
-    def get(self, posting_id):
+        if changed:
+            counters.increment(PostingCounter, 'posting_id', posting_id, likes=1 if liked else -1)
+            cache.invalidate_postings([posting_id])
+        like_count = counters.total(PostingCounter, 'posting_id', posting_id, ['likes'])['likes']
+
+        return JsonResponse({'message': 'SUCCESS', 'liked': liked, 'like_count': like_count}, status=200)
+
+    def get(self, request, posting_id):
         if not Like.objects.filter(posting_id=posting_id).exists():
             return JsonResponse({'message': 'NOT FOUND'}, status=404)
         
-        likes = Like.objects.filter(posting_id=posting_id)
-        results = [{
-            'id'         : data.id,
-            'posting_id' : posting_id,
-            'user_id'    : data.user.id
-        } for data in likes]
+        rows = Like.objects.filter(posting_id=posting_id).values_list('id', 'user_id')
+
+        def serialize(rows):
+            return ({
+                'id'         : id,
+                'posting_id' : posting_id,
+                'user_id'    : user_id
+            } for id, user_id in rows)
+
+        if 'stream' in request.GET:
+            return stream_response(request, rows, ('id',), serialize)
+
+        try:
+            limit, cursor = page_params(request)
+            likes, position = paginate(rows, ('id',), limit, cursor)
+        except InvalidPage:
+            return JsonResponse({'message': 'INVALID PAGE'}, status=400)
+
+        results = list(serialize(likes))
+        like_count = counters.total(PostingCounter, 'posting_id', posting_id, ['likes'])['likes']
         
-        return JsonResponse({'like_list': results}, status=200)
\ No newline at end of file
+        return JsonResponse({
+            'like_list'  : results,
+            'like_count' : like_count,
+            'next_cursor': encode_cursor(position)
+        }, status=200)
+
+
+class RelationshipView(View):
+    """feed 한 page 를 그릴 때 필요한 좋아요, follow 여부를 한 번에 돌려준다."""
+
+    @login_decorator
+    def get(self, request):
+        try:
+            posting_ids = parse_ids(request.GET.get('posting-ids', ''))
+            user_ids    = parse_ids(request.GET.get('user-ids', ''))
+        except ValueError:
+            return JsonResponse({'message': 'KEY ERROR'}, status=400)
+
+        if max(len(posting_ids), len(user_ids)) > settings.RELATIONSHIP_MAX_IDS:
+            return JsonResponse({'message': 'TOO MANY'}, status=400)
+
+        # (user, posting) unique index 만 읽는 IN query 하나. follow 여부는 follow graph cache 에서 찾는다.
+        liked     = set(
+            Like.objects
+            .filter(user_id=request.user.id, posting_id__in=posting_ids)
+            .values_list('posting_id', flat=True)
+        ) if posting_ids else set()
+        following = graph.follows(request.user.id, user_ids) if user_ids else {}
+
+        return JsonResponse({
+            'posting': [{'posting_id': posting_id, 'liked': posting_id in liked} for posting_id in posting_ids],
+            'user'   : [{'user_id': user_id, 'following': following[user_id]} for user_id in user_ids]
+        }, status=200)
+
+
+class SearchView(View):
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        kind  = request.GET.get('type', 'posting')
+        if not query or kind not in search.MODELS:
+            return JsonResponse({'message': 'KEY ERROR'}, status=400)
+
+        try:
+            limit, cursor = page_params(request)
+            # 점수 순서라 keyset 을 쓸 수 없으므로 cursor 는 지금까지 읽은 결과 수(offset)이다.
+            offset = cursor or 0
+            if not isinstance(offset, int) or offset < 0:
+                raise InvalidPage
+        except InvalidPage:
+            return JsonResponse({'message': 'INVALID PAGE'}, status=400)
+
+        # SEARCH_MAX_RESULTS 까지 읽었으면 빈 page 와 next_cursor null 을 돌려준다.
+        limit = max(0, min(limit, settings.SEARCH_MAX_RESULTS - offset))
+        ids   = search.search(kind, query, offset, limit + 1) if limit > 0 else []
+
+        more        = len(ids) > limit and offset + limit < settings.SEARCH_MAX_RESULTS
+        next_cursor = encode_cursor(offset + limit) if more else None
+        ids         = ids[:limit]
+
+        if kind == 'posting':
+            results = [entry.payload for entry in cache.get_postings(ids)]
+            return JsonResponse({'posting_list': results, 'next_cursor': next_cursor}, status=200)
+
+        # index 에 남아 있지만 지워진 댓글은 빼고 점수 순서를 지킨다.
+        rows    = {row[0]: row for row in Comment.objects.filter(id__in=ids).values_list('id', 'content', 'user_id', 'posting_id', 'created_at')}
+        results = [{
+            'id'        : id,
+            'content'   : content,
+            'user_id'   : user_id,
+            'posting_id': posting_id,
+            'created_at': minutes(created_at)
+        } for id, content, user_id, posting_id, created_at in (rows[id] for id in ids if id in rows)]
+        return JsonResponse({'comment_data': results, 'next_cursor': next_cursor}, status=200)
+
+
+class TagView(View):
+    def get(self, request, name):
+        tag = Tag.objects.filter(name=name.lower()).first()
+        if tag is None:
+            return JsonResponse({'message': 'NOT FOUND'}, status=404)
+
+        try:
+            limit, cursor = page_params(request)
+            rows, position = paginate(
+                PostingTag.objects.filter(tag=tag).values_list('id', 'posting_id', 'created_at'),
+                ('-created_at', '-id'),
+                limit,
+                cursor
+            )
+        except InvalidPage:
+            return JsonResponse({'message': 'INVALID PAGE'}, status=400)
+
+        results = [entry.payload for entry in cache.get_postings([posting_id for _, posting_id, _ in rows])]
+        return JsonResponse({
+            'tag'         : tag.name,
+            'post_count'  : tags.post_counts([tag.id])[tag.id],
+            'posting_list': results,
+            'next_cursor' : encode_cursor(position)
+        }, status=200)
+
+
+class TrendingTagView(View):
+    def get(self, request):
+        try:
+            limit, _ = page_params(request)
+        except InvalidPage:
+            return JsonResponse({'message': 'INVALID PAGE'}, status=400)
+
+        # 모든 요청이 같은 결과를 보므로 response cache 에 잠깐 담아 둔다.
+        results = cache.single_flight('trending_tags:{}'.format(limit), lambda: tags.trending(limit))
+        return JsonResponse({'trending': results}, status=200)
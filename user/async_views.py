@@ -0,0 +1,9 @@
+from westagram_project.async_views import asyncify
+from .                             import views
+
+SignUpView           = asyncify(views.SignUpView)
+SignInView           = asyncify(views.SignInView)
+FollowView           = asyncify(views.FollowView)
+FollowStatusView     = asyncify(views.FollowStatusView)
+MutualFollowView     = asyncify(views.MutualFollowView)
+FollowSuggestionView = asyncify(views.FollowSuggestionView)
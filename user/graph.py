@@ -0,0 +1,291 @@
+import time
+import random
+import threading
+
+from array                      import array
+from bisect                     import bisect_left
+from collections                import Counter, OrderedDict, defaultdict
+from heapq                      import nsmallest
+
+from django.conf                import settings
+from django.core.cache          import caches
+from django.db                  import transaction
+
+from westagram_project.replicas import primary
+from .models                    import Follow
+
+# following: user 가 follow 하는 user id, followers: user 를 follow 하는 user id
+DIRECTIONS = {
+    'following': ('from_user_id', 'to_user_id'),
+    'followers': ('to_user_id', 'from_user_id'),
+}
+
+# array 는 process 안(Store)에 들고 있고, 공유 cache 에는 user 마다 version 과 최근 변경(log)만 둔다.
+# follow/unfollow 는 version 을 올리고 변경 하나를 log 에 남긴다.
+# 다른 process 는 다음 읽기에서 version 차이만큼 log 를 array 에 반영한다.
+
+
+def backend():
+    return caches[settings.GRAPH_CACHE_ALIAS]
+
+
+def key(direction, user_id):
+    """user 의 version key. 지우면 모든 process 가 다음 읽기에서 DB 에서 다시 읽는다."""
+    return 'follow_graph:{}:{}'.format(direction, user_id)
+
+
+def log_key(direction, user_id, version):
+    return 'follow_graph_log:{}:{}:{}'.format(direction, user_id, version)
+
+
+def contains(ids, user_id):
+    index = bisect_left(ids, user_id)
+    return index < len(ids) and ids[index] == user_id
+
+
+class Store:
+    """process 안에 들고 있는 (direction, user_id) 별 정렬된 id array 와 그 array 가 반영한 version.
+
+    id 는 하나에 8 byte 이고, 모두 합쳐 GRAPH_LOCAL_MAX_EDGES 개가 넘으면 가장 오래 안 읽은 array 부터 버린다.
+    GRAPH_LOCAL_TTL 보다 오래전에 DB 에서 읽은 array 는 없는 것으로 보고 다시 읽는다.
+    공유 cache 가 process 마다 따로인 경우(locmem)에도 다른 process 의 follow 가 이 시간 안에 보인다.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size    = 0
+        self.lock    = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] > settings.GRAPH_LOCAL_TTL:
+                del self.entries[name]
+                self.size -= len(entry[1])
+                return None
+            self.entries.move_to_end(name)
+            return tuple(entry)
+
+    def put(self, name, version, ids):
+        with self.lock:
+            old = self.entries.pop(name, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[name] = [version, ids, time.monotonic()]
+            self.size         += len(ids)
+
+            while self.size > settings.GRAPH_LOCAL_MAX_EDGES and len(self.entries) > 1:
+                _, (_, evicted, _) = self.entries.popitem(last=False)
+                self.size         -= len(evicted)
+
+    def apply(self, name, version, other_id, add):
+        """version 바로 앞까지 반영한 array 이면 변경 하나를 반영한 새 array 로 바꾸고 돌려준다. 아니면 None.
+
+        adjacency 가 돌려준 array 는 lock 밖에서 읽히므로 고치지 않고 새로 만든다. (copy-on-write)
+        """
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or entry[0] != version - 1:
+                return None
+
+            ids   = entry[1]
+            index = bisect_left(ids, other_id)
+            found = index < len(ids) and ids[index] == other_id
+            if add and not found:
+                entry[1]   = ids[:index] + array('q', [other_id]) + ids[index:]
+                self.size += 1
+            elif not add and found:
+                entry[1]   = ids[:index] + ids[index + 1:]
+                self.size -= 1
+            entry[0] = version
+            return entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+store = Store()
+
+
+def versions(direction, user_ids):
+    """공유 cache 의 user 별 version. 없으면 임의의 값에서 시작한다.
+
+    지워졌다가 다시 생긴 version 이 예전에 읽은 array 의 version 과 겹치지 않게 한다.
+    """
+    cache   = backend()
+    names   = {user_id: key(direction, user_id) for user_id in user_ids}
+    current = cache.get_many(names.values())
+
+    missing = [user_id for user_id in user_ids if names[user_id] not in current]
+    if missing:
+        for user_id in missing:
+            cache.add(names[user_id], random.getrandbits(48), None)
+        current.update(cache.get_many([names[user_id] for user_id in missing]))
+
+    return {user_id: current.get(names[user_id]) for user_id in user_ids}
+
+
+def load(direction, user_ids):
+    source, target = DIRECTIONS[direction]
+    loaded = defaultdict(lambda: array('q'))
+    rows   = (
+        Follow.objects
+        .filter(**{source + '__in': user_ids})
+        .order_by(source, target)
+        .values_list(source, target)
+    )
+    # 여러 요청이 같이 쓰는 array 이므로 replica 가 아닌 default 에서 읽는다.
+    with primary():
+        for user_id, other_id in rows.iterator(chunk_size=settings.GRAPH_LOAD_CHUNK_SIZE):
+            loaded[user_id].append(other_id)
+    return {user_id: loaded[user_id] for user_id in user_ids}
+
+
+def adjacency(direction, user_ids):
+    """user id 마다 정렬된 id array. Store 의 array 를 복사하지 않고 돌려주므로 고치면 안 된다.
+    follow/unfollow 는 새 array 로 바꾸므로 돌려받은 array 는 바뀌지 않는다.
+
+    version 이 GRAPH_LOG_SIZE 이내로 뒤처진 array 는 log 를 반영하고,
+    없거나 더 뒤처졌거나 log 가 비어 있으면 한 번의 query 로 읽어서 채운다.
+    """
+    user_ids = set(user_ids)
+    current  = versions(direction, user_ids)
+    found    = {}
+    behind   = {}
+    missing  = set()
+
+    for user_id in user_ids:
+        entry = store.get((direction, user_id))
+        if entry is None or current[user_id] is None:
+            missing.add(user_id)
+        elif entry[0] == current[user_id]:
+            found[user_id] = entry[1]
+        elif 0 < current[user_id] - entry[0] <= settings.GRAPH_LOG_SIZE:
+            behind[user_id] = entry[0]
+        else:
+            missing.add(user_id)
+
+    if behind:
+        changes = backend().get_many([
+            log_key(direction, user_id, version)
+            for user_id, start in behind.items() for version in range(start + 1, current[user_id] + 1)
+        ])
+        for user_id, start in behind.items():
+            for version in range(start + 1, current[user_id] + 1):
+                change = changes.get(log_key(direction, user_id, version))
+                ids    = store.apply((direction, user_id), version, *change) if change is not None else None
+                if ids is None:
+                    missing.add(user_id)
+                    break
+            else:
+                found[user_id] = ids
+
+    if missing:
+        # version 을 먼저 읽었으므로 읽는 사이에 생긴 변경은 다음 읽기에서 log 로 반영된다.
+        for user_id, ids in load(direction, missing).items():
+            found[user_id] = ids
+            if current[user_id] is not None:
+                store.put((direction, user_id), current[user_id], ids)
+
+    return found
+
+
+def following(user_id):
+    return adjacency('following', [user_id])[user_id]
+
+
+def followers(user_id):
+    return adjacency('followers', [user_id])[user_id]
+
+
+def _update(direction, user_id, other_id, add):
+    """version 을 올리고 변경을 log 에 남긴 뒤 이 process 의 array 에 반영한다.
+
+    version 이 없으면(지워졌으면) 모든 process 가 다음 읽기에서 DB 에서 다시 읽으므로 남길 필요가 없다.
+    """
+    cache = backend()
+    try:
+        version = cache.incr(key(direction, user_id))
+    except ValueError:
+        return
+
+    cache.set(log_key(direction, user_id, version), (other_id, add), settings.GRAPH_LOG_TIMEOUT)
+    store.apply((direction, user_id), version, other_id, add)
+
+
+def _write_through(from_user_id, to_user_id, add):
+    def apply():
+        _update('following', from_user_id, to_user_id, add)
+        _update('followers', to_user_id, from_user_id, add)
+
+    # rollback 된 follow 가 array 에 남지 않도록 commit 된 뒤에 반영한다.
+    transaction.on_commit(apply)
+
+
+def follow(from_user_id, to_user_id):
+    _write_through(from_user_id, to_user_id, True)
+
+
+def unfollow(from_user_id, to_user_id):
+    _write_through(from_user_id, to_user_id, False)
+
+
+def intersect(small, large):
+    """정렬된 두 array 의 교집합(정렬된 list). 크기 차이가 크면 작은 쪽을 binary search 하고, 비슷하면 큰 쪽을 set 으로 한 번 훑는다."""
+    if len(small) > len(large):
+        small, large = large, small
+    if not small:
+        return []
+
+    if len(small) * len(large).bit_length() < len(large):
+        return [user_id for user_id in small if contains(large, user_id)]
+    return list(filter(set(small).__contains__, large))
+
+
+def is_following(user_id, target_ids):
+    """user 가 target 들을 follow 하는지, target 들이 user 를 follow 하는지를 한 번에 확인한다."""
+    graph = adjacency('following', [user_id])[user_id]
+    fans  = adjacency('followers', [user_id])[user_id]
+    return {
+        target_id: {
+            'following'  : contains(graph, target_id),
+            'followed_by': contains(fans, target_id),
+        }
+        for target_id in target_ids
+    }
+
+
+def follows(user_id, target_ids):
+    """user 가 target 들을 follow 하는지. following array 하나만 읽는다."""
+    graph = following(user_id)
+    return {target_id: contains(graph, target_id) for target_id in target_ids}
+
+
+def mutual_followers(user_id, target_id):
+    """user 가 follow 하는 사람 중 target 을 follow 하는 사람. ('OO님 외 n명이 follow 합니다')"""
+    return intersect(following(user_id), followers(target_id))
+
+
+def suggestions(user_id, limit):
+    """follow 하는 사람들이 follow 하는 사람(friends-of-friends)을 겹치는 수가 많은 순서로 돌려준다.
+
+    edge 가 많은 user 도 시간이 일정하도록 following 중 id 가 큰(최근 가입한) GRAPH_SUGGESTION_SOURCES 명과,
+    그 사람들의 following 중 id 가 큰 GRAPH_SUGGESTION_CANDIDATES 명까지만 센다.
+    """
+    graph   = following(user_id)
+    sources = graph[-settings.GRAPH_SUGGESTION_SOURCES:]
+    counts  = Counter()
+
+    for ids in adjacency('following', sources).values():
+        counts.update(ids[-settings.GRAPH_SUGGESTION_CANDIDATES:])
+
+    counts.pop(user_id, None)
+    candidates = (
+        (-count, candidate_id) for candidate_id, count in counts.items()
+        if not contains(graph, candidate_id)
+    )
+    return [(candidate_id, -count) for count, candidate_id in nsmallest(limit, candidates)]
@@ -0,0 +1,78 @@
+import bcrypt
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from django.conf        import settings
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(password, hashed_password):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+class HashingPool:
+    """bcrypt 연산을 정해진 수의 worker에서만 돌린다.
+
+    실행 중 + 대기 중인 작업이 workers + queue_size 를 넘으면 기다리지 않고 PoolSaturated 를 던진다.
+    """
+
+    def __init__(self, workers, queue_size, executor='thread'):
+        self.workers    = workers
+        self.queue_size = queue_size
+        self.kind       = executor
+        self._slots     = threading.BoundedSemaphore(workers + queue_size)
+        self._lock      = threading.Lock()
+        self._executor  = None
+
+    @property
+    def executor(self):
+        # process pool 은 fork 비용이 있으므로 처음 쓸 때 만든다.
+        with self._lock:
+            if self._executor is None:
+                if self.kind == 'process':
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+            return self._executor
+
+    def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturated
+
+        try:
+            future = self.executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda future: self._slots.release())
+        return future.result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+pool = HashingPool(
+    settings.PASSWORD_HASHING_WORKERS,
+    settings.PASSWORD_HASHING_QUEUE_SIZE,
+    settings.PASSWORD_HASHING_EXECUTOR
+)
+
+
+def hash_password(password):
+    return pool.run(_hashpw, password, settings.BCRYPT_ROUNDS)
+
+
+def check_password(password, hashed_password):
+    return pool.run(_checkpw, password, hashed_password)
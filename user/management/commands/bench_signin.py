@@ -0,0 +1,69 @@
+import json
+import time
+
+from concurrent.futures          import ThreadPoolExecutor
+
+from django.conf                 import settings
+from django.core.management.base import BaseCommand
+from django.test                 import Client
+
+from user                        import hashing
+from user.models                 import User
+from westagram_project.testing   import bench_databases
+
+EMAIL    = 'bench-signin@bench.bench'
+PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = 'test database 에 user 를 만들고 bcrypt worker 수에 따른 로그인 처리량을 잰다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4,8', help='쉼표로 구분한 worker 수 목록')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--rounds', type=int, default=settings.BCRYPT_ROUNDS)
+        parser.add_argument('--executor', default=settings.PASSWORD_HASHING_EXECUTOR)
+
+    def handle(self, *args, **options):
+        with bench_databases():
+            User.objects.create(
+                email    = EMAIL,
+                password = hashing._hashpw(PASSWORD, options['rounds'])
+            )
+            self.measure(options)
+
+    def measure(self, options):
+        original = hashing.pool
+        try:
+            for workers in [int(value) for value in options['workers'].split(',')]:
+                # 대기열을 충분히 크게 잡아서 503 없이 worker 수만의 영향을 본다.
+                hashing.pool = hashing.HashingPool(workers, options['requests'], options['executor'])
+                try:
+                    result = self.run(options['requests'], options['concurrency'])
+                finally:
+                    hashing.pool.shutdown()
+
+                result.update(workers=workers, rounds=options['rounds'], executor=options['executor'])
+                self.stdout.write(json.dumps(result))
+        finally:
+            hashing.pool = original
+
+    def run(self, requests, concurrency):
+        body = json.dumps({'email': EMAIL, 'password': PASSWORD})
+
+        def sign_in(_):
+            return Client().post('/user/signin', body, content_type='application/json').status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            statuses = list(executor.map(sign_in, range(requests)))
+        elapsed = time.perf_counter() - started
+
+        return {
+            'requests'   : requests,
+            'concurrency': concurrency,
+            'succeeded'  : statuses.count(200),
+            'seconds'    : round(elapsed, 4),
+            'throughput' : round(requests / elapsed, 2),
+        }
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_auto_20201004_0542'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('followers', models.IntegerField(default=0)),
+                ('following', models.IntegerField(default=0)),
+                ('posts', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='user.user')),
+            ],
+            options={
+                'db_table': 'user_counters',
+                'unique_together': {('user', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:28
+
+from django.db        import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow     = apps.get_model('user', 'Follow')
+    duplicates = (
+        Follow.objects
+        .values('from_user_id', 'to_user_id')
+        .annotate(first_id=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        Follow.objects.filter(
+            from_user_id = duplicate['from_user_id'],
+            to_user_id   = duplicate['to_user_id'],
+            id__gt       = duplicate['first_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_usercounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+        migrations.RunPython(remove_duplicate_follows, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together={('from_user', 'to_user')},
+        ),
+    ]
@@ -2,7 +2,7 @@ from django.db     import models
 
 
 class User(models.Model):
-    email            = models.CharField(max_length=50)
+    email            = models.CharField(max_length=50, unique=True)
     password         = models.CharField(max_length=300)
     created_at       = models.DateTimeField(auto_now_add=True)
     updated_at       = models.DateTimeField(auto_now=True)
@@ -28,4 +28,17 @@ class Follow(models.Model):
     )
 
     class Meta:
-        db_table = 'follows'
\ No newline at end of file
+        db_table        = 'follows'
+        unique_together = [['from_user', 'to_user']]
+
+
+class UserCounter(models.Model):
+    user      = models.ForeignKey(User, on_delete=models.CASCADE)
+    shard     = models.PositiveSmallIntegerField()
+    followers = models.IntegerField(default=0)
+    following = models.IntegerField(default=0)
+    posts     = models.IntegerField(default=0)
+
+    class Meta:
+        db_table        = 'user_counters'
+        unique_together = [['user', 'shard']]
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch          import receiver
+
+from .models                  import User, Follow
+from .utils                   import token_cache
+from .                        import graph
+
+
+@receiver(post_delete, sender=User)
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.id)
+
+
+@receiver(post_save, sender=Follow)
+def add_edge(sender, instance, created, **kwargs):
+    if created:
+        graph.follow(instance.from_user_id, instance.to_user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_edge(sender, instance, **kwargs):
+    graph.unfollow(instance.from_user_id, instance.to_user_id)
@@ -1,12 +1,20 @@
+import io
 import json
 import bcrypt
 import jwt
 import datetime
 
-from django.test import TestCase, Client
-from my_settings import SECRET, ALGORITHM
+from django.test            import TestCase, TransactionTestCase, Client, RequestFactory
+from django.test.utils      import CaptureQueriesContext
+from django.core.management import call_command
+from django.db              import connection
+from django.http            import JsonResponse
+from my_settings            import SECRET, ALGORITHM
 
-from .models     import User, Follow
+from westagram_project      import counters, metrics
+from .models                import User, Follow, UserCounter
+from .utils                 import TokenCache, EVICTIONS, login_decorator, token_cache
+from .                      import hashing, graph
 
 
 class SignUpTest(TestCase):
@@ -130,6 +138,49 @@ class SignInTest(TestCase):
         self.assertEqual(response.status_code, 400)
 
 
+class HashingPoolTest(TestCase):
+    def setUp(self):
+        User.objects.create(
+            email   ='test1@naver.com',
+            password=bcrypt.hashpw('1234567890'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        self.original = hashing.pool
+        hashing.pool  = hashing.HashingPool(1, 0)
+
+    def tearDown(self):
+        hashing.pool.shutdown()
+        hashing.pool = self.original
+        User.objects.all().delete()
+
+    def test_sign_in_pool_saturated(self):
+        client = Client()
+
+        hashing.pool._slots.acquire()
+        try:
+            user = {
+                'email'   : 'test1@naver.com',
+                'password': '1234567890'
+            }
+            response = client.post('/user/signin', json.dumps(user), content_type='application/json')
+        finally:
+            hashing.pool._slots.release()
+
+        self.assertEqual(response.json(), {'message': 'BUSY'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_sign_in_through_pool(self):
+        client = Client()
+
+        user = {
+            'email'   : 'test1@naver.com',
+            'password': '1234567890'
+        }
+        response = client.post('/user/signin', json.dumps(user), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(hashing.pool._slots._value, 1)
+
+
 class FollowTest(TestCase):
     def setUp(self):
         User.objects.create(
@@ -182,6 +233,7 @@ class FollowTest(TestCase):
             from_user_id=5,
             to_user_id  =1
         )
+        call_command('reconcile_counters', stdout=io.StringIO())
         expire = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)  
         self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8') 
 
@@ -212,6 +264,19 @@ class FollowTest(TestCase):
         self.assertEqual(response.json(), {'message': 'NOT FOUND'})
         self.assertEqual(response.status_code, 404)
 
+    def test_follow_twice_ignored(self):
+        client = Client()
+
+        headers = {'HTTP_Authorization': self.token}
+        data = {
+            'to_user_id'   : 3,
+            'follow_button': '+'
+        }
+        response = client.post('/user/follow', json.dumps(data), **headers, content_type='application/json')
+        self.assertEqual(response.json(), {'message': 'SUCCESS'})
+        self.assertEqual(Follow.objects.filter(from_user_id=1, to_user_id=3).count(), 1)
+        self.assertEqual(counters.total(UserCounter, 'user_id', 3, ['followers']), {'followers': 1})
+
     def test_follow_key_error(self):
         client = Client()
 
@@ -230,15 +295,328 @@ class FollowTest(TestCase):
         self.assertEqual(response.json(), 
             {
                 'follow_list': [{
-                    'following': [3],
-                    'follower' : [2,4,5]
-                }]}
+                    'following'      : [3],
+                    'follower'       : [2,4,5],
+                    'following_count': 1,
+                    'follower_count' : 3
+                }],
+                'next_cursor': None}
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_follow_get_paginate(self):
+        client = Client()
+
+        response = client.get('/user/follow?user-id=1&limit=2')
+        first    = response.json()
+        self.assertEqual(first['follow_list'][0]['following'], [3])
+        self.assertEqual(first['follow_list'][0]['follower'], [2,4])
+
+        response = client.get('/user/follow', {'user-id': 1, 'limit': 2, 'cursor': first['next_cursor']})
+        self.assertEqual(response.json()['follow_list'][0]['following'], [])
+        self.assertEqual(response.json()['follow_list'][0]['follower'], [5])
+        self.assertIsNone(response.json()['next_cursor'])
+        self.assertEqual(response.status_code, 200)
+
     def test_follow_get_user_id_not_exist(self):
         client = Client()
 
         response = client.get('/user/follow?user-id=10')
         self.assertEqual(response.json(), {'message': 'NOT FOUND'})
         self.assertEqual(response.status_code, 404)
+
+    def test_follow_unfollow_update_counter(self):
+        client = Client()
+
+        headers = {'HTTP_Authorization': self.token}
+        data = {
+            'to_user_id'   : 6,
+            'follow_button': '+'
+        }
+        client.post('/user/follow', json.dumps(data), **headers, content_type='application/json')
+        self.assertEqual(counters.total(UserCounter, 'user_id', 1, ['following']), {'following': 2})
+        self.assertEqual(counters.total(UserCounter, 'user_id', 6, ['followers']), {'followers': 1})
+
+        data['follow_button'] = '-'
+        client.post('/user/follow', json.dumps(data), **headers, content_type='application/json')
+        self.assertEqual(counters.total(UserCounter, 'user_id', 1, ['following']), {'following': 1})
+        self.assertEqual(counters.total(UserCounter, 'user_id', 6, ['followers']), {'followers': 0})
+
+
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        User.objects.create(
+            id      =1,
+            email   ='test1@naver.com',
+            password=bcrypt.hashpw('1234567890'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        )
+        expire     = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+        token_cache.clear()
+
+    def tearDown(self):
+        User.objects.all().delete()
+        token_cache.clear()
+
+    @login_decorator
+    def view(self, request):
+        return JsonResponse({'user_id': request.user.id, 'email': request.user.email}, status=200)
+
+    def call(self):
+        request = RequestFactory().get('/', HTTP_Authorization=self.token)
+        with CaptureQueriesContext(connection) as context:
+            response = self.view(request)
+        return response, len(context)
+
+    def test_cached_token_skip_user_lookup(self):
+        response, queries = self.call()
+        self.assertEqual(queries, 1)
+
+        response, queries = self.call()
+        self.assertEqual(queries, 0)
+        self.assertEqual(json.loads(response.content), {'user_id': 1, 'email': 'test1@naver.com'})
+        self.assertEqual(token_cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_token_without_exp(self):
+        self.token = jwt.encode({'user_id': 1}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+        response, queries = self.call()
+        self.assertEqual(response.status_code, 200)
+        response, queries = self.call()
+        self.assertEqual(queries, 0)
+
+    def test_metrics_exported(self):
+        metrics.clear()
+        self.call()
+        self.call()
+
+        text = Client().get('/metrics').content.decode('utf-8')
+        self.assertIn('westagram_token_cache_lookups_total{result="hit"} 1', text)
+        self.assertIn('westagram_token_cache_lookups_total{result="miss"} 1', text)
+        self.assertIn('westagram_token_cache_entries 1', text)
+
+    def test_delete_user_invalidate_token(self):
+        self.call()
+        User.objects.filter(id=1).delete()
+
+        response, queries = self.call()
+        self.assertEqual(json.loads(response.content), {'message': 'INVALID USER'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_lru_eviction(self):
+        cache = TokenCache(2, 300)
+        user  = User(id=1, email='test1@naver.com')
+        exp   = datetime.datetime.utcnow().timestamp() + 3600
+
+        evictions = EVICTIONS.get(())
+        for token in ('a', 'b', 'c'):
+            cache.set(token, {'user_id': 1, 'exp': exp}, user)
+        self.assertEqual(EVICTIONS.get(()) - evictions, 1)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c')['user_id'], 1)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_shared_backend(self):
+        first  = TokenCache(10, 300, 'default')
+        second = TokenCache(10, 300, 'default')
+        user   = User(id=1, email='test1@naver.com')
+        exp    = datetime.datetime.utcnow().timestamp() + 3600
+
+        first.set('shared', {'user_id': 1, 'exp': exp}, user)
+        self.assertEqual(second.get('shared')['email'], 'test1@naver.com')
+
+        third = TokenCache(10, 300, 'default')
+        first.invalidate_user(1)
+        self.assertIsNone(third.get('shared'))
+
+    def test_shared_backend_invalidate_local_entry(self):
+        # 두 process 의 cache. 둘 다 local 에 entry 를 들고 있다.
+        first  = TokenCache(10, 300, 'default')
+        second = TokenCache(10, 300, 'default')
+        user   = User(id=1, email='test1@naver.com')
+        exp    = datetime.datetime.utcnow().timestamp() + 3600
+
+        first.set('shared', {'user_id': 1, 'exp': exp}, user)
+        self.assertIsNotNone(second.get('shared'))
+
+        first.invalidate_user(1)
+        self.assertIsNone(second.get('shared'))
+        self.assertEqual(second.stats()['size'], 0)
+
+
+class FollowGraphTest(TransactionTestCase):
+    # write-through 가 commit 뒤에 일어나므로 TransactionTestCase 를 쓴다.
+    def setUp(self):
+        User.objects.bulk_create([
+            User(id=index, email='test{}@naver.com'.format(index), password='1234567890')
+            for index in range(1, 7)
+        ])
+        Follow.objects.bulk_create([
+            Follow(from_user_id=from_user_id, to_user_id=to_user_id)
+            for from_user_id, to_user_id in [(1, 2), (1, 3), (2, 4), (3, 4), (3, 5), (4, 1), (5, 1)]
+        ])
+        graph.backend().clear()
+        expire = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600)
+        self.token = jwt.encode({'user_id': 1, 'exp': expire}, SECRET['secret'], algorithm=ALGORITHM).decode('utf-8')
+
+    def tearDown(self):
+        graph.backend().clear()
+        graph.store.clear()
+        token_cache.clear()
+
+    def test_follow_status(self):
+        client = Client()
+
+        response = client.get('/user/follow/status?user-id=1&target-ids=2,4,6')
+        self.assertEqual(response.json(), {'follow_status': [
+            {'user_id': 2, 'following': True, 'followed_by': False},
+            {'user_id': 4, 'following': False, 'followed_by': True},
+            {'user_id': 6, 'following': False, 'followed_by': False},
+        ]})
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_status_cached(self):
+        client = Client()
+
+        client.get('/user/follow/status?user-id=1&target-ids=2')
+        # 두 번째부터는 user 확인 query 만 나간다.
+        with self.assertNumQueries(1):
+            response = client.get('/user/follow/status?user-id=1&target-ids=2')
+        self.assertTrue(response.json()['follow_status'][0]['following'])
+
+    def test_follow_status_key_error(self):
+        client = Client()
+
+        response = client.get('/user/follow/status?user-id=1&target-ids=a')
+        self.assertEqual(response.json(), {'message': 'KEY ERROR'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_follow_write_through(self):
+        client  = Client()
+        headers = {'HTTP_Authorization': self.token}
+
+        self.assertFalse(graph.is_following(1, [6])[6]['following'])
+        self.assertEqual(list(graph.followers(6)), [])
+
+        data = {'to_user_id': 6, 'follow_button': '+'}
+        client.post('/user/follow', json.dumps(data), **headers, content_type='application/json')
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(1, [6])[6]['following'])
+            self.assertEqual(list(graph.followers(6)), [1])
+
+        data['follow_button'] = '-'
+        client.post('/user/follow', json.dumps(data), **headers, content_type='application/json')
+        with self.assertNumQueries(0):
+            self.assertFalse(graph.is_following(1, [6])[6]['following'])
+            self.assertEqual(list(graph.followers(6)), [])
+
+    def test_large_follower_count(self):
+        count = 100000
+        User.objects.bulk_create([
+            User(id=index, email='test{}@naver.com'.format(index), password='1234567890')
+            for index in range(10, 10 + count)
+        ], batch_size=5000)
+        Follow.objects.bulk_create([Follow(from_user_id=index, to_user_id=6) for index in range(10, 10 + count)], batch_size=5000)
+
+        with self.assertNumQueries(1):
+            fans = graph.followers(6)
+        self.assertEqual(len(fans), count)
+
+        # 다른 process 는 자기 array 를 따로 들고 있다.
+        local, other = graph.store, graph.Store()
+        graph.store  = other
+        try:
+            with self.assertNumQueries(1):
+                graph.followers(6)
+        finally:
+            graph.store = local
+
+        # follow/unfollow 는 DB 에서 다시 읽지 않고 변경을 반영한 새 array 로 바꾼다.
+        Follow.objects.create(from_user_id=1, to_user_id=6)
+        Follow.objects.filter(from_user_id=10, to_user_id=6).delete()
+        with self.assertNumQueries(0):
+            updated = graph.followers(6)
+        self.assertEqual(len(updated), count)
+        self.assertTrue(graph.contains(updated, 1))
+        self.assertFalse(graph.contains(updated, 10))
+
+        # 먼저 돌려받은 array 는 그대로다.
+        self.assertEqual(len(fans), count)
+        self.assertFalse(graph.contains(fans, 1))
+        self.assertTrue(graph.contains(fans, 10))
+
+        # 다른 process 는 다음 읽기에서 log 로 따라온다.
+        graph.store = other
+        try:
+            with self.assertNumQueries(0):
+                self.assertEqual(graph.followers(6), updated)
+        finally:
+            graph.store = local
+
+    def test_stale_log_reloads(self):
+        graph.followers(4)
+        local, other = graph.store, graph.Store()
+        graph.store  = other
+        try:
+            graph.followers(4)
+        finally:
+            graph.store = local
+
+        # 남겨둔 변경보다 많이 뒤처진 process 는 DB 에서 다시 읽는다.
+        with self.settings(GRAPH_LOG_SIZE=1):
+            Follow.objects.create(from_user_id=5, to_user_id=4)
+            Follow.objects.create(from_user_id=6, to_user_id=4)
+            graph.store = other
+            try:
+                with self.assertNumQueries(1):
+                    self.assertEqual(list(graph.followers(4)), [2, 3, 5, 6])
+            finally:
+                graph.store = local
+
+    def test_local_ttl_reloads(self):
+        graph.followers(4)
+        # 공유 cache 를 같이 쓰지 않는 다른 process 의 follow 는 version 을 올리지 않는다.
+        Follow.objects.bulk_create([Follow(from_user_id=6, to_user_id=4)])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(list(graph.followers(4)), [2, 3])
+        with self.settings(GRAPH_LOCAL_TTL=0), self.assertNumQueries(1):
+            self.assertEqual(list(graph.followers(4)), [2, 3, 6])
+
+    def test_mutual_followers(self):
+        client = Client()
+
+        response = client.get('/user/follow/mutual?user-id=1&target-id=4&limit=1')
+        first    = response.json()
+        self.assertEqual(first['mutual_followers'], [2])
+        self.assertEqual(first['mutual_count'], 2)
+        self.assertFalse(first['following'])
+        self.assertTrue(first['followed_by'])
+
+        response = client.get('/user/follow/mutual', {'user-id': 1, 'target-id': 4, 'limit': 1, 'cursor': first['next_cursor']})
+        self.assertEqual(response.json()['mutual_followers'], [3])
+        self.assertIsNone(response.json()['next_cursor'])
+
+    def test_mutual_followers_not_found(self):
+        client = Client()
+
+        response = client.get('/user/follow/mutual?user-id=1&target-id=10')
+        self.assertEqual(response.json(), {'message': 'NOT FOUND'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_follow_suggestion(self):
+        client = Client()
+
+        response = client.get('/user/follow/suggestion?user-id=1')
+        self.assertEqual(response.json(), {'suggestion': [
+            {'user_id': 4, 'mutual_count': 2},
+            {'user_id': 5, 'mutual_count': 1},
+        ]})
+        self.assertEqual(response.status_code, 200)
+
+    def test_intersect(self):
+        large = list(range(0, 10000, 2))
+        self.assertEqual(graph.intersect([3, 4, 9998], large), [4, 9998])
+        self.assertEqual(graph.intersect(list(range(0, 10000, 3)), large), list(range(0, 10000, 6)))
+        self.assertEqual(graph.intersect([], large), [])
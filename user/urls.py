@@ -1,9 +1,17 @@
 from django.urls import path
-from .           import views
+from django.conf import settings
+
+if settings.ASYNC_VIEWS:
+    from . import async_views as views
+else:
+    from . import views
 
 app_name = 'user'
 urlpatterns = [
     path('/signup', views.SignUpView.as_view(), name='signup'),
     path('/signin', views.SignInView.as_view(), name='signin'),
     path('/follow', views.FollowView.as_view(), name='follow'),
+    path('/follow/status', views.FollowStatusView.as_view(), name='follow_status'),
+    path('/follow/mutual', views.MutualFollowView.as_view(), name='follow_mutual'),
+    path('/follow/suggestion', views.FollowSuggestionView.as_view(), name='follow_suggestion'),
 ]
\ No newline at end of file
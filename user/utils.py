@@ -1,31 +1,241 @@
 import jwt
+import time
+import hashlib
+import functools
+import threading
 
-from django.http             import JsonResponse
-from my_settings             import SECRET, ALGORITHM
+from collections                 import OrderedDict
 
-from .models                 import User
+from django.conf                 import settings
+from django.core.cache           import caches
+from django.http                 import JsonResponse
+from my_settings                 import SECRET, ALGORITHM
+
+from westagram_project           import metrics
+from westagram_project.executors import database_sync_to_async
+from .models                     import User
+
+
+LOOKUPS   = metrics.Counter('westagram_token_cache_lookups_total', 'login token cache 조회 수 (result=hit, miss)', labels=('result',))
+EVICTIONS = metrics.Counter('westagram_token_cache_evictions_total', 'TOKEN_CACHE_SIZE 를 넘어서 버린 token cache entry 수', labels=())
+
+
+class TokenCache:
+    """검증된 token의 claim과 user 정보를 token 만료 시간까지 들고 있는 LRU cache.
+
+    key는 secret과 token을 같이 hash 해서 만들기 때문에 secret이 바뀌면 기존 entry는 더 이상 맞지 않는다.
+    shared backend(Django cache alias)가 설정되어 있으면 local에서 못 찾은 entry를 거기서 찾고,
+    local에서 찾은 entry도 user별 version을 확인해서 다른 process의 invalidate_user를 바로 반영한다.
+    """
+
+    def __init__(self, max_size, ttl, alias=None):
+        self.max_size = max_size
+        self.ttl      = ttl
+        self.alias    = alias
+        self._lock    = threading.Lock()
+        self._entries = OrderedDict()
+        self._users   = {}
+        self.hits     = 0
+        self.misses   = 0
+
+    @property
+    def backend(self):
+        return caches[self.alias] if self.alias else None
+
+    def key(self, token):
+        return 'token:' + hashlib.sha256((SECRET['secret'] + token).encode('utf-8')).hexdigest()
+
+    def version_key(self, user_id):
+        return 'token_user_version:{}'.format(user_id)
+
+    def get(self, token):
+        key = self.key(token)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires_at'] <= now:
+                self._remove(key)
+                entry = None
+
+        # 다른 process 에서 invalidate_user 한 user 의 entry 는 local 에 있어도 버린다.
+        if entry is not None and self._is_current(entry):
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+            LOOKUPS.inc(('hit',))
+            return entry
+
+        if entry is not None:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._remove(key)
+
+        entry = self._get_shared(key, now)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._store(key, entry)
+        LOOKUPS.inc(('miss',) if entry is None else ('hit',))
+        return entry
+
+    def set(self, token, claims, user):
+        key        = self.key(token)
+        # exp 가 없는 token 도 jwt.decode 를 통과하므로 그때는 ttl 까지만 들고 있는다.
+        expires_at = min(time.time() + self.ttl, claims.get('exp') or float('inf'))
+        backend    = self.backend
+        entry      = {
+            'claims'    : claims,
+            'user_id'   : user.id,
+            'email'     : user.email,
+            'expires_at': expires_at,
+            'version'   : backend.get(self.version_key(user.id), 0) if backend is not None else 0
+        }
+
+        with self._lock:
+            self._store(key, entry)
+
+        if backend is not None:
+            timeout = int(expires_at - time.time())
+            if timeout > 0:
+                backend.set(key, entry, timeout)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._users.pop(user_id, ())):
+                self._entries.pop(key, None)
+
+        backend = self.backend
+        if backend is not None:
+            version_key = self.version_key(user_id)
+            backend.add(version_key, 0, None)
+            backend.incr(version_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._users.clear()
+            self.hits   = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def _get_shared(self, key, now):
+        backend = self.backend
+        if backend is None:
+            return None
+
+        entry = backend.get(key)
+        if entry is None or entry['expires_at'] <= now or not self._is_current(entry):
+            return None
+        return entry
+
+    def _is_current(self, entry):
+        """shared backend 가 있으면 entry 를 만든 뒤로 user 가 invalidate 되지 않았는지 version 으로 확인한다."""
+        backend = self.backend
+        return backend is None or backend.get(self.version_key(entry['user_id']), 0) == entry['version']
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._users.setdefault(entry['user_id'], set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+            EVICTIONS.inc(())
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        keys  = self._users.get(entry['user_id'])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._users[entry['user_id']]
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL, settings.TOKEN_CACHE_ALIAS)
+
+ENTRIES = metrics.Gauge('westagram_token_cache_entries', 'process 안의 login token cache entry 수', (), lambda: {(): token_cache.stats()['size']})
+
+metrics.register(LOOKUPS, EVICTIONS, ENTRIES)
+
+
+def verify(request, access_token):
+    """cache 에 없는 token 을 decode 하고 user 를 조회한다. 실패하면 error response 를 돌려준다."""
+    try:
+        data = jwt.decode(access_token, SECRET['secret'], algorithm=ALGORITHM)
+        user = User.objects.only('id', 'email').get(id=data['user_id'])
+        token_cache.set(access_token, data, user)
+        request.user = user
+
+    except jwt.DecodeError:
+        return JsonResponse({'message': 'INVALID TOKEN'}, status=400)
+
+    except jwt.ExpiredSignatureError:
+        return JsonResponse({'message': 'TOKEN EXPIRED'}, status=400)
+
+    except User.DoesNotExist:
+        return JsonResponse({'message': 'INVALID USER'}, status=400)
+
+    return None
+
+
+def cached_user(access_token):
+    entry = token_cache.get(access_token)
+    if entry is None:
+        return None
+
+    # DB 조회 없이 id, email 만 가진 user 객체를 쓴다.
+    return User(id=entry['user_id'], email=entry['email'])
+
+
+def parse_ids(value):
+    """'1,2,3' 형식의 id 목록. 숫자가 아니면 ValueError."""
+    return [int(id) for id in value.split(',') if id]
 
 
 def login_decorator(func):
+    @functools.wraps(func)
     def wrapper(self, request, *args, **kwargs):
         if not 'Authorization' in request.headers:
             return JsonResponse({'message': 'INVALID USER'}, status=401)
-        
-        try:
-            access_token = request.headers['Authorization']
-            data = jwt.decode(access_token, SECRET['secret'], algorithm=ALGORITHM)
-            user = User.objects.get(id=data['user_id'])
-            request.user = user
-        
-        except jwt.DecodeError:
-            return JsonResponse({'message': 'INVALID TOKEN'}, status=400)
-
-        except jwt.ExpiredSignatureError:
-            return JsonResponse({'message': 'TOKEN EXPIRED'}, status=400)
-
-        except User.DoesNotExist:
-            return JsonResponse({'message': 'INVALID USER'}, status=400)
-        
+
+        access_token = request.headers['Authorization']
+        request.user = cached_user(access_token)
+
+        if request.user is None:
+            response = verify(request, access_token)
+            if response is not None:
+                return response
+
         return func(self, request, *args, **kwargs)
-    
+
+    wrapper.login_required = True
+    return wrapper
+
+
+def async_login_decorator(func):
+    """async handler 용 login_decorator. cache 에 있는 token 은 event loop 에서 바로 처리한다."""
+    @functools.wraps(func)
+    async def wrapper(self, request, *args, **kwargs):
+        if not 'Authorization' in request.headers:
+            return JsonResponse({'message': 'INVALID USER'}, status=401)
+
+        access_token = request.headers['Authorization']
+        request.user = cached_user(access_token)
+
+        if request.user is None:
+            response = await database_sync_to_async(verify)(request, access_token)
+            if response is not None:
+                return response
+
+        return await func(self, request, *args, **kwargs)
+
+    wrapper.login_required = True
     return wrapper
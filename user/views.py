@@ -1,16 +1,31 @@
 import json
-import bcrypt
 import jwt
 import datetime
 
+from bisect           import bisect_right
+
 from django.views     import View
 from django.http      import JsonResponse
+from django.conf      import settings
+from django.db        import IntegrityError, transaction
 from my_settings      import SECRET, ALGORITHM
 
-from .models          import User, Follow
-from .utils           import login_decorator
+from .models          import User, Follow, UserCounter
+from .utils           import login_decorator, parse_ids
+from .hashing         import PoolSaturated, hash_password, check_password
+from .                import graph
 from django.db.models import Q
 
+from westagram_project            import counters
+from westagram_project.pagination import InvalidPage, page_params, paginate, encode_cursor
+
+
+def busy_response():
+    # 비밀번호 hashing worker가 모두 차 있으면 바로 거절하고 다시 시도할 시간을 알려준다.
+    response = JsonResponse({'message': 'BUSY'}, status=503)
+    response['Retry-After'] = settings.PASSWORD_HASHING_RETRY_AFTER
+    return response
+
 
 class SignUpView(View):
     def post(self, request):
@@ -19,41 +34,40 @@ class SignUpView(View):
         MINIMUM_PASSWORD_LENGTH = 8   
         
         try:
-            if User.objects.filter(email=data['email']).exists(): 
-                return JsonResponse({'message': 'ALREADY EXIST'}, status=400)
-            
             if '@' not in data['email'] or '.' not in data['email']:
                 return JsonResponse({'message': 'WRONG FORM'}, status=400)
 
             if len(data['password']) < MINIMUM_PASSWORD_LENGTH:
                 return JsonResponse({'message': 'TOO SHORT'}, status=400)
 
-            hashed_password = bcrypt.hashpw(
-                data['password'].encode('utf-8'), 
-                bcrypt.gensalt()
-            ).decode('utf-8')  
+            hashed_password = hash_password(data['password'])
             
-            User.objects.create(email=data['email'], password=hashed_password)
+            # email 은 unique 이므로 미리 조회하지 않고 insert 가 실패하면 이미 있는 user 이다.
+            with transaction.atomic():
+                User.objects.create(email=data['email'], password=hashed_password)
 
             return JsonResponse({'message': 'SUCCESS'}, status=200)
         
         except KeyError:
             return JsonResponse({'message': 'KEY_ERROR'}, status=400) 
 
+        except IntegrityError:
+            return JsonResponse({'message': 'ALREADY EXIST'}, status=400)
+
+        except PoolSaturated:
+            return busy_response()
+
 
 class SignInView(View):
     def post(self, request):
         data = json.loads(request.body)
 
         try:
-            if not User.objects.filter(email=data['email']).exists(): 
-                return JsonResponse({'message': 'INVALID_USER'}, status=401)
-
             new_password = data['password'] 
-            user         = User.objects.get(email=data['email'])
+            user         = User.objects.only('id', 'password').get(email=data['email'])
             password     = user.password 
 
-            if not bcrypt.checkpw(new_password.encode('utf-8'), password.encode('utf-8')):
+            if not check_password(new_password, password):
                 return JsonResponse({'message': 'WRONG_PASSWORD'}, status=401)
 
             expire = datetime.datetime.utcnow() + datetime.timedelta(seconds=3600) 
@@ -68,6 +82,12 @@ class SignInView(View):
         except KeyError:
             return JsonResponse({'message': 'KEY_ERROR'}, status=400)  
 
+        except User.DoesNotExist:
+            return JsonResponse({'message': 'INVALID_USER'}, status=401)
+
+        except PoolSaturated:
+            return busy_response()
+
 
 class FollowView(View):
     @login_decorator
@@ -77,10 +97,22 @@ class FollowView(View):
             if not User.objects.filter(id=data['to_user_id']).exists():
                 return JsonResponse({'message': 'NOT FOUND'}, status=404)
             
+            changed = 0
             if data['follow_button'] == '+':
-                Follow.objects.create(from_user=request.user, to_user_id=data['to_user_id'])
+                # (from_user, to_user) 가 unique 라서 이미 follow 중이면 insert 가 무시된다.
+                try:
+                    with transaction.atomic():
+                        Follow.objects.create(from_user=request.user, to_user_id=data['to_user_id'])
+                    changed = 1
+                except IntegrityError:
+                    pass
             elif data['follow_button'] == '-':
-                Follow.objects.filter(Q(from_user=request.user) & Q(to_user_id=data['to_user_id'])).delete()
+                changed, _ = Follow.objects.filter(Q(from_user=request.user) & Q(to_user_id=data['to_user_id'])).delete()
+                changed    = -changed
+
+            if changed:
+                counters.increment(UserCounter, 'user_id', request.user.id, following=changed)
+                counters.increment(UserCounter, 'user_id', data['to_user_id'], followers=changed)
             
             return JsonResponse({'message': 'SUCCESS'}, status=200)
         
@@ -89,16 +121,123 @@ class FollowView(View):
 
     def get(self, request):
         user_id = request.GET.get('user-id', None)
+        if not User.objects.filter(id=user_id).exists():
+            return JsonResponse({'message': 'NOT FOUND'}, status=404)
+
         try:
-            
-            from_users = User.objects.get(id=user_id).follow_from_user.all()
-            to_users   = User.objects.get(id=user_id).follow_to_user.all()
-
-            results = [{
-                'following': [user.to_user.id for user in from_users],
-                'follower' : [user.from_user.id for user in to_users]
-            }]
-            return JsonResponse({'follow_list': results}, status=200)
-        except User.DoesNotExist:
+            limit, cursor = page_params(request)
+            # cursor에는 following, follower 목록 각각의 position이 들어있고 끝난 목록은 빠진다.
+            if cursor is None:
+                cursor = {'following': None, 'follower': None}
+            if not isinstance(cursor, dict):
+                raise InvalidPage
+
+            following, following_position = [], None
+            if 'following' in cursor:
+                following, following_position = paginate(
+                    Follow.objects.filter(from_user_id=user_id).values('id', 'to_user_id'),
+                    ('id',),
+                    limit,
+                    cursor['following']
+                )
+
+            follower, follower_position = [], None
+            if 'follower' in cursor:
+                follower, follower_position = paginate(
+                    Follow.objects.filter(to_user_id=user_id).values('id', 'from_user_id'),
+                    ('id',),
+                    limit,
+                    cursor['follower']
+                )
+        except InvalidPage:
+            return JsonResponse({'message': 'INVALID PAGE'}, status=400)
+
+        position = {}
+        if following_position is not None:
+            position['following'] = following_position
+        if follower_position is not None:
+            position['follower'] = follower_position
+
+        count   = counters.total(UserCounter, 'user_id', int(user_id), ['following', 'followers'])
+        results = [{
+            'following'      : [data['to_user_id'] for data in following],
+            'follower'       : [data['from_user_id'] for data in follower],
+            'following_count': count['following'],
+            'follower_count' : count['followers']
+        }]
+        return JsonResponse({'follow_list': results, 'next_cursor': encode_cursor(position or None)}, status=200)
+
+
+
+class FollowStatusView(View):
+    def get(self, request):
+        try:
+            user_id    = int(request.GET['user-id'])
+            target_ids = parse_ids(request.GET['target-ids'])
+        except (KeyError, ValueError):
+            return JsonResponse({'message': 'KEY ERROR'}, status=400)
+
+        if len(target_ids) > settings.GRAPH_MAX_TARGETS:
+            return JsonResponse({'message': 'TOO MANY'}, status=400)
+
+        if not User.objects.filter(id=user_id).exists():
+            return JsonResponse({'message': 'NOT FOUND'}, status=404)
+
+        status  = graph.is_following(user_id, target_ids)
+        results = [dict(status[target_id], user_id=target_id) for target_id in target_ids]
+        return JsonResponse({'follow_status': results}, status=200)
+
+
+class MutualFollowView(View):
+    def get(self, request):
+        try:
+            user_id   = int(request.GET['user-id'])
+            target_id = int(request.GET['target-id'])
+        except (KeyError, ValueError):
+            return JsonResponse({'message': 'KEY ERROR'}, status=400)
+
+        if User.objects.filter(id__in=[user_id, target_id]).count() != len({user_id, target_id}):
             return JsonResponse({'message': 'NOT FOUND'}, status=404)
 
+        try:
+            limit, cursor = page_params(request)
+            # cursor 는 앞 page 의 마지막 user id 이다.
+            if cursor is not None and not isinstance(cursor, int):
+                raise InvalidPage
+        except InvalidPage:
+            return JsonResponse({'message': 'INVALID PAGE'}, status=400)
+
+        mutual = graph.mutual_followers(user_id, target_id)
+        start  = bisect_right(mutual, cursor) if cursor is not None else 0
+        page   = mutual[start:start + limit]
+        status = graph.is_following(user_id, [target_id])[target_id]
+
+        return JsonResponse({
+            'mutual_followers': page,
+            'mutual_count'    : len(mutual),
+            'following'       : status['following'],
+            'followed_by'     : status['followed_by'],
+            'next_cursor'     : encode_cursor(page[-1]) if start + limit < len(mutual) else None
+        }, status=200)
+
+
+class FollowSuggestionView(View):
+    def get(self, request):
+        try:
+            user_id = int(request.GET['user-id'])
+        except (KeyError, ValueError):
+            return JsonResponse({'message': 'KEY ERROR'}, status=400)
+
+        if not User.objects.filter(id=user_id).exists():
+            return JsonResponse({'message': 'NOT FOUND'}, status=404)
+
+        try:
+            limit, _ = page_params(request)
+        except InvalidPage:
+            return JsonResponse({'message': 'INVALID PAGE'}, status=400)
+
+        results = [{
+            'user_id'     : candidate_id,
+            'mutual_count': count
+        } for candidate_id, count in graph.suggestions(user_id, limit)]
+        return JsonResponse({'suggestion': results}, status=200)
@@ -0,0 +1,58 @@
+import asyncio
+import functools
+
+from django.views import View
+
+from user.utils   import async_login_decorator
+from .executors   import database_sync_to_async
+
+
+class AsyncView(View):
+    """handler 가 coroutine 인 class based view.
+
+    Django 3.1 의 View.as_view() 는 동기 함수를 돌려주기 때문에 ASGI handler 가 async view 로 인식하도록 감싼다.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            if response.streaming:
+                # Django 3.1 ASGI handler 는 streaming body 를 event loop 에서 동기로 읽기 때문에
+                # DB 를 읽는 generator 는 거기서 돌 수 없다. DB thread pool 에서 미리 다 읽어둔다.
+                response.streaming_content = await database_sync_to_async(list)(response.streaming_content)
+            return response
+
+        functools.update_wrapper(async_view, view)
+        return async_view
+
+
+def async_handler(handler):
+    # Django 3.1 에는 async ORM 이 없으므로 handler 의 DB 작업은 한 번에 DB thread pool 로 넘긴다.
+    if getattr(handler, 'login_required', False):
+        run = database_sync_to_async(handler.__wrapped__)
+
+        @async_login_decorator
+        async def wrapper(self, request, *args, **kwargs):
+            return await run(self, request, *args, **kwargs)
+    else:
+        run = database_sync_to_async(handler)
+
+        async def wrapper(self, request, *args, **kwargs):
+            return await run(self, request, *args, **kwargs)
+
+    return wrapper
+
+
+def asyncify(view_class):
+    """동기 view class 와 같은 응답을 돌려주는 async view class 를 만든다."""
+    handlers = {
+        method: async_handler(getattr(view_class, method))
+        for method in view_class.http_method_names
+        if method != 'options' and hasattr(view_class, method)
+    }
+    return type(view_class.__name__, (AsyncView, view_class), handlers)
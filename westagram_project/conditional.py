@@ -0,0 +1,25 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+
+
+def make_etag(*validators):
+    """aggregate 값들로 weak ETag 를 만든다. body 를 serialize 하지 않으므로 byte 단위 일치는 보장하지 않는다."""
+    digest = hashlib.md5(repr(validators).encode('utf-8')).hexdigest()
+    return 'W/"{}"'.format(digest)
+
+
+def conditional_response(request, build, etag):
+    """client 의 If-None-Match 가 validator 와 맞으면 build 하지 않고 304 를 돌려준다.
+
+    Last-Modified 는 보내지 않는다. 좋아요, 댓글 수, 삭제는 updated_at 을 바꾸지 않아서
+    If-Modified-Since 만 보내는 client 가 바뀐 응답 대신 304 를 받게 된다.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+
+    response['ETag'] = etag
+    return response
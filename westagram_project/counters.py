@@ -0,0 +1,45 @@
+import random
+
+from django.conf      import settings
+from django.db        import IntegrityError, transaction
+from django.db.models import F, Sum
+
+
+def increment(model, owner, owner_id, **deltas):
+    """임의의 shard 하나에만 F() 로 더해서 같은 row lock 에 writer 가 몰리지 않게 한다.
+
+    owner 는 counter model 의 foreign key attname (ex. 'posting_id') 이다.
+    """
+    shard   = random.randrange(settings.COUNTER_SHARDS)
+    lookup  = {owner: owner_id, 'shard': shard}
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+
+    if model.objects.filter(**lookup).update(**changes):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # 동시에 같은 shard row 가 만들어진 경우
+        model.objects.filter(**lookup).update(**changes)
+
+
+def totals(model, owner, owner_ids, fields):
+    """owner_id 별로 모든 shard 를 합한 값을 돌려준다. counter 가 없으면 0 이다."""
+    results = {owner_id: dict.fromkeys(fields, 0) for owner_id in owner_ids}
+
+    rows = (
+        model.objects
+        .filter(**{owner + '__in': owner_ids})
+        .values(owner)
+        .annotate(**{'total_' + field: Sum(field) for field in fields})
+    )
+    for row in rows:
+        results[row[owner]] = {field: row['total_' + field] for field in fields}
+
+    return results
+
+
+def total(model, owner, owner_id, fields):
+    return totals(model, owner, [owner_id], fields)[owner_id]
@@ -0,0 +1,35 @@
+import time
+import asyncio
+import functools
+import contextvars
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf        import settings
+from django.db          import close_old_connections
+
+from .                  import pool
+
+# async view가 ORM을 쓸 때 사용하는 thread pool. thread 마다 DB connection을 하나씩 갖는다. (DATABASE_CONN_MAX_AGE 동안 다시 쓴다)
+executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='async-db')
+
+
+def _run(func, args, kwargs, queued):
+    close_old_connections()
+    try:
+        with pool.checkout(time.perf_counter() - queued):
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def database_sync_to_async(func):
+    """동기 함수를 크기가 정해진 DB thread pool 에서 실행하는 coroutine function 으로 바꾼다."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop    = asyncio.get_event_loop()
+        # run_in_executor 는 contextvars 를 넘기지 않으므로 직접 복사한다. (metrics.current)
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(executor, context.run, _run, func, args, kwargs, time.perf_counter())
+
+    return wrapper
@@ -0,0 +1,288 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+import collections
+
+from bisect                  import bisect_left
+
+from django.conf             import settings
+from django.db               import connections
+from django.db.backends      import signals
+from django.http             import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger('westagram.metrics')
+
+# 지금 요청의 Recorder. 표본으로 뽑히지 않은 요청은 None 이다.
+# async view 는 DB thread pool 에서 query 를 실행하므로 context 를 그대로 넘겨서 같은 Recorder 에 기록한다. (executors.py)
+current = contextvars.ContextVar('westagram_metrics', default=None)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS   = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """label 값 묶음마다 bucket 별 개수, 합, 개수를 모으는 Prometheus histogram. process 안에만 있다."""
+
+    def __init__(self, name, help, buckets, labels=('view', 'method')):
+        self.name    = name
+        self.help    = help
+        self.buckets = buckets
+        self.labels  = labels
+        self._values = {}
+        self._lock   = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # bucket 마다 개수, +Inf 개수, 합
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0]
+            counts[index] += 1
+            counts[-1]    += value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        with self._lock:
+            values = {labels: list(counts) for labels, counts in self._values.items()}
+
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+        for labels, counts in sorted(values.items()):
+            labels = list(zip(self.labels, labels))
+            total  = 0
+            # bucket 은 누적 개수로 내보낸다.
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                lines.append('{}_bucket{} {}'.format(self.name, format_labels(labels + [('le', bound)]), total))
+            lines.append('{}_sum{} {}'.format(self.name, format_labels(labels), format_value(counts[-1])))
+            lines.append('{}_count{} {}'.format(self.name, format_labels(labels), total))
+        return lines
+
+
+class Counter:
+    """label 값 묶음마다 늘어나기만 하는 수."""
+
+    def __init__(self, name, help, labels=('view', 'method')):
+        self.name    = name
+        self.help    = help
+        self.labels  = labels
+        self._values = collections.Counter()
+        self._lock   = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def get(self, labels):
+        with self._lock:
+            return self._values[labels]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} counter'.format(self.name)]
+        for labels, value in values:
+            lines.append('{}{} {}'.format(self.name, format_labels(zip(self.labels, labels)), format_value(value)))
+        return lines
+
+
+class Gauge:
+    """scrape 할 때 collect() 로 읽는 지금 값. collect 는 label 값 묶음마다 값을 담은 dict 를 돌려준다."""
+
+    def __init__(self, name, help, labels, collect):
+        self.name    = name
+        self.help    = help
+        self.labels  = labels
+        self.collect = collect
+
+    def clear(self):
+        pass
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} gauge'.format(self.name)]
+        for labels, value in sorted(self.collect().items()):
+            lines.append('{}{} {}'.format(self.name, format_labels(zip(self.labels, labels)), format_value(value)))
+        return lines
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    labels = ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"')) for name, value in labels)
+    return '{' + labels + '}' if labels else ''
+
+
+LATENCY       = Histogram('westagram_request_latency_seconds', '요청 처리 시간', LATENCY_BUCKETS)
+DB_TIME       = Histogram('westagram_request_db_seconds', '요청 하나의 query 실행 시간 합', LATENCY_BUCKETS)
+SERIALIZATION = Histogram('westagram_request_serialization_seconds', '요청 하나의 JSON encode 시간 합', LATENCY_BUCKETS)
+QUERIES       = Histogram('westagram_request_queries', '요청 하나의 query 수', QUERY_BUCKETS)
+DUPLICATES    = Histogram('westagram_request_duplicate_queries', '요청 하나에서 같은 SQL 을 다시 실행한 수', QUERY_BUCKETS)
+N_PLUS_ONE    = Counter('westagram_n_plus_one_total', '같은 SQL 을 METRICS_N_PLUS_ONE_THRESHOLD 번 이상 실행한 요청 수')
+
+METRICS = [LATENCY, DB_TIME, SERIALIZATION, QUERIES, DUPLICATES, N_PLUS_ONE]
+
+
+def register(*metrics):
+    """다른 module 이 만든 metric 도 /metrics 에 같이 내보낸다. (ex. pool.py)"""
+    METRICS.extend(metrics)
+
+
+class Recorder:
+    """표본으로 뽑힌 요청 하나의 query, encode 기록. 같은 SQL(parameter 자리는 %s)끼리 실행 횟수를 센다."""
+
+    def __init__(self):
+        self.queries       = 0
+        self.db_time       = 0.0
+        self.serialization = 0.0
+        self.statements    = collections.Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time         += time.perf_counter() - started
+            self.queries         += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        return self.queries - len(self.statements)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    recorder = current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection):
+    # connection 객체(thread 마다 하나)에 한 번만 붙인다. 다시 연결해도 execute_wrappers 는 남아 있다.
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+# DB thread pool 의 connection 은 처음 연결할 때 붙는다.
+signals.connection_created.connect(connection_created)
+
+
+class serialization:
+    """with 블록의 시간을 지금 요청의 encode 시간에 더한다. (renderers.dumps)"""
+
+    __slots__ = ('recorder', 'started')
+
+    def __enter__(self):
+        self.recorder = current.get()
+        if self.recorder is not None:
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.recorder is not None:
+            self.recorder.serialization += time.perf_counter() - self.started
+
+
+def view_labels(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return ('unmatched', request.method)
+    view = getattr(match.func, 'view_class', match.func)
+    return (view.__name__, request.method)
+
+
+def record(request, recorder, elapsed):
+    labels = view_labels(request)
+    LATENCY.observe(labels, elapsed)
+    DB_TIME.observe(labels, recorder.db_time)
+    SERIALIZATION.observe(labels, recorder.serialization)
+    QUERIES.observe(labels, recorder.queries)
+    DUPLICATES.observe(labels, recorder.duplicates())
+
+    if recorder.statements:
+        sql, count = recorder.statements.most_common(1)[0]
+        if count >= settings.METRICS_N_PLUS_ONE_THRESHOLD:
+            N_PLUS_ONE.inc(labels)
+            logger.info('N+1 query in %s %s: %d times: %s', labels[0], labels[1], count, sql)
+
+
+def sampled():
+    rate = settings.METRICS_SAMPLE_RATE
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+@sync_and_async_middleware
+def MetricsMiddleware(get_response):
+    """METRICS_SAMPLE_RATE 비율의 요청만 골라서 view 별 query 수, DB 시간, 중복 query, encode 시간, 전체 시간을 기록한다.
+
+    뽑히지 않은 요청은 난수 하나만 더 만들고, query 마다 ContextVar 를 한 번 읽는다.
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not sampled():
+                return await get_response(request)
+
+            recorder = Recorder()
+            token    = current.set(recorder)
+            started  = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                current.reset(token)
+            record(request, recorder, time.perf_counter() - started)
+            return response
+    else:
+        def middleware(request):
+            if not sampled():
+                return get_response(request)
+
+            # 이 module 이 load 되기 전에 열린 connection 에는 connection_created 가 오지 않았다.
+            for connection in connections.all():
+                install(connection)
+            recorder = Recorder()
+            token    = current.set(recorder)
+            started  = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                current.reset(token)
+            record(request, recorder, time.perf_counter() - started)
+            return response
+
+    return middleware
+
+
+def render():
+    lines = [
+        '# HELP westagram_metrics_sample_rate 기록하는 요청의 비율. 요청 수는 _count 를 이 값으로 나눈다.',
+        '# TYPE westagram_metrics_sample_rate gauge',
+        'westagram_metrics_sample_rate {}'.format(format_value(float(settings.METRICS_SAMPLE_RATE))),
+    ]
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    for metric in METRICS:
+        metric.clear()
+
+
+def metrics_view(request):
+    """Prometheus text format. process 마다 따로 모으므로 worker 마다 scrape 하거나 합쳐서 본다."""
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
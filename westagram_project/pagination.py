@@ -0,0 +1,111 @@
+import json
+import base64
+import binascii
+import datetime
+
+from django.conf            import settings
+from django.core.exceptions import ValidationError
+from django.db.models       import Q
+
+
+class InvalidPage(Exception):
+    pass
+
+
+def serialize_key(value):
+    # DjangoJSONEncoder는 microsecond를 잘라내므로 keyset 비교가 틀어진다.
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def encode_cursor(position):
+    if position is None:
+        return None
+
+    data = json.dumps(position, default=serialize_key, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return json.loads(data)
+    except (binascii.Error, ValueError):
+        raise InvalidPage
+
+
+def page_params(request):
+    """query string의 limit, cursor를 읽는다."""
+    try:
+        limit = int(request.GET.get('limit', settings.PAGE_SIZE))
+    except ValueError:
+        raise InvalidPage
+
+    if limit < 1:
+        raise InvalidPage
+
+    return min(limit, settings.MAX_PAGE_SIZE), decode_cursor(request.GET.get('cursor'))
+
+
+def after(keys, position, model):
+    """keys 순서로 정렬했을 때 position 다음에 오는 row를 고르는 keyset 조건."""
+    if not isinstance(position, list) or len(position) != len(keys):
+        raise InvalidPage
+
+    names  = [key.lstrip('-') for key in keys]
+    values = []
+    try:
+        for name, value in zip(names, position):
+            values.append(model._meta.get_field(name).to_python(value))
+    # 문자열이 아닌 값(ex. datetime 자리의 [1, 2])은 ValidationError 가 아니라 TypeError, ValueError 가 난다.
+    except (ValidationError, TypeError, ValueError):
+        raise InvalidPage
+
+    condition = Q()
+    for index, key in enumerate(keys):
+        lookup = '{}__{}'.format(names[index], 'lt' if key.startswith('-') else 'gt')
+        equals = {names[prefix]: values[prefix] for prefix in range(index)}
+        condition |= Q(**equals, **{lookup: values[index]})
+
+    return condition
+
+
+def key_values(row, keys, fields=()):
+    """row 에서 keys 값을 꺼낸다. values_list() row 는 fields(select 한 field 순서)로 위치를 찾는다."""
+    names = [key.lstrip('-') for key in keys]
+    if isinstance(row, dict):
+        return [row[name] for name in names]
+    if isinstance(row, tuple):
+        return [row[fields.index(name)] for name in names]
+    return [getattr(row, name) for name in names]
+
+
+def paginate(queryset, keys, limit, position=None):
+    """OFFSET 없이 keys 기준 keyset pagination 한다. (rows, 다음 position)을 돌려준다."""
+    queryset = queryset.order_by(*keys)
+    if position is not None:
+        queryset = queryset.filter(after(keys, position, queryset.model))
+
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, key_values(rows[-1], keys, queryset.query.values_select)
+
+
+def iterate(queryset, keys, chunk_size):
+    """keys 기준 keyset 으로 chunk_size 개씩 끊어 읽으면서 row 를 하나씩 돌려준다.
+
+    DB driver 가 결과를 한 번에 받아오는 경우(MySQL)에도 memory 에는 chunk 하나만 올라간다.
+    """
+    position = None
+    while True:
+        rows, position = paginate(queryset, keys, chunk_size, position)
+        yield from rows
+        if position is None:
+            return
@@ -0,0 +1,100 @@
+import time
+import weakref
+import asyncio
+import threading
+import contextlib
+
+from django.conf             import settings
+from django.db               import connections
+from django.db.backends      import signals
+from django.utils.decorators import sync_and_async_middleware
+
+from .                       import metrics
+
+# connection 은 thread 마다 하나씩이고 (DATABASE_CONN_MAX_AGE 동안) 요청이 끝나도 닫지 않는다.
+# WSGI 에서는 worker thread 마다, async view 에서는 DB thread(ASYNC_DB_THREADS) 마다 하나이므로
+# DB thread pool 이 곧 connection pool 이고 thread 를 기다리는 시간이 connection 을 기다리는 시간이다. (executors.py)
+
+# 한 번이라도 연결한 connection 객체. thread 가 끝나면 같이 사라진다.
+_created = weakref.WeakSet()
+_lock    = threading.Lock()
+
+
+def usage():
+    """alias 별로 지금 요청(또는 DB thread 작업)이 쓰고 있는 connection 과 열린 채 쉬고 있는 connection 수."""
+    with _lock:
+        created = list(_created)
+
+    counts = {(alias, state): 0 for alias in settings.DATABASES for state in ('in_use', 'idle')}
+    for connection in created:
+        if connection.connection is not None:
+            state = 'in_use' if getattr(connection, 'pool_in_use', False) else 'idle'
+            counts[(connection.alias, state)] = counts.get((connection.alias, state), 0) + 1
+    return counts
+
+
+CONNECTIONS   = metrics.Gauge('westagram_db_connections', '열려 있는 DB connection 수 (state=in_use, idle)', ('alias', 'state'), usage)
+CONNECTS      = metrics.Counter('westagram_db_connects_total', 'DB 에 새로 연결한 수', labels=('alias',))
+HEALTH_CHECKS = metrics.Counter('westagram_db_health_checks_total', '오래 쉰 connection 을 다시 쓰기 전에 확인한 수', labels=('alias', 'result'))
+WAIT          = metrics.Histogram('westagram_db_pool_wait_seconds', 'async view 의 DB 작업이 DB thread 를 기다린 시간', metrics.LATENCY_BUCKETS, labels=())
+
+metrics.register(CONNECTIONS, CONNECTS, HEALTH_CHECKS, WAIT)
+
+
+def connection_created(sender, connection, **kwargs):
+    CONNECTS.inc((connection.alias,))
+    with _lock:
+        _created.add(connection)
+
+
+signals.connection_created.connect(connection_created)
+
+
+def check(connection):
+    """DATABASE_HEALTH_CHECK_IDLE 보다 오래 쉰 connection 은 한 번 ping 해보고 끊겼으면 닫는다. 다음 query 가 다시 연결한다.
+
+    MySQL wait_timeout 이나 중간 proxy 가 끊은 connection 으로 요청이 실패하지 않게 한다.
+    Django 는 error 가 난 뒤에만 확인한다. (close_if_unusable_or_obsolete)
+    """
+    last_used = getattr(connection, 'pool_last_used', None)
+    if connection.connection is None or last_used is None:
+        return
+    if time.monotonic() - last_used < settings.DATABASE_HEALTH_CHECK_IDLE:
+        return
+
+    usable = connection.is_usable()
+    HEALTH_CHECKS.inc((connection.alias, 'ok' if usable else 'failed'))
+    if not usable:
+        connection.close()
+
+
+@contextlib.contextmanager
+def checkout(waited=None):
+    """with 블록 동안 이 thread 의 connection 을 in_use 로 센다. waited 는 DB thread 를 기다린 시간(초)이다."""
+    if waited is not None:
+        WAIT.observe((), waited)
+
+    used = connections.all()
+    for connection in used:
+        check(connection)
+        connection.pool_in_use = True
+    try:
+        yield
+    finally:
+        now = time.monotonic()
+        for connection in used:
+            connection.pool_in_use    = False
+            connection.pool_last_used = now
+
+
+@sync_and_async_middleware
+def PoolMiddleware(get_response):
+    """동기 view 는 요청 하나 동안 worker thread 의 connection 을 쓴다. async view 는 DB 작업마다 executors 에서 센다."""
+    if asyncio.iscoroutinefunction(get_response):
+        return get_response
+
+    def middleware(request):
+        with checkout():
+            return get_response(request)
+
+    return middleware
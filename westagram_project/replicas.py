@@ -0,0 +1,105 @@
+import random
+import asyncio
+import hashlib
+import contextlib
+import contextvars
+
+from django.conf             import settings
+from django.core.cache       import caches
+from django.db               import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+# 이 요청의 읽기를 보내는 replica alias. None 이면 default(primary) 에서 읽는다.
+current = contextvars.ContextVar('westagram_replica', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRouter:
+    """읽기는 ReplicaMiddleware 가 고른 replica 로, 쓰기는 모두 default 로 보낸다.
+
+    replica 를 고르지 않은 요청(쓰기 요청, 쓰기 직후의 요청, management command, test)과
+    default 에서 transaction 이 열려 있는 동안의 읽기는 default 에서 읽는다.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = current.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replica 는 default 의 복제본이므로 어느 alias 에서 읽은 객체끼리도 연결할 수 있다.
+        return True
+
+
+@contextlib.contextmanager
+def primary():
+    """안에서 하는 읽기를 default 로 보낸다. 여러 요청이 같이 쓰는 cache 를 채울 때 쓴다.
+
+    지연된 replica 에서 읽은 값을 cache 에 넣으면 쓰기 직후 default 에서 읽는 요청도 그 값을 보게 된다.
+    """
+    token = current.set(None)
+    try:
+        yield
+    finally:
+        current.reset(token)
+
+
+def sticky_key(access_token):
+    return 'replica_sticky:' + hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+
+
+def is_sticky(request):
+    if settings.REPLICA_STICKY_COOKIE in request.COOKIES:
+        return True
+    access_token = request.headers.get('Authorization')
+    return bool(access_token) and caches[settings.REPLICA_STICKY_ALIAS].get(sticky_key(access_token)) is not None
+
+
+def choose(request):
+    """읽기를 보낼 replica alias. 쓰기 요청이거나 최근에 쓴 사용자이면 None 이다."""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or request.method not in SAFE_METHODS or is_sticky(request):
+        return None
+    return random.choice(replicas)
+
+
+def stick(request, response):
+    """쓰기가 성공하면 REPLICA_STICKY_SECONDS 동안 같은 cookie, token 의 읽기를 default 로 보낸다."""
+    if not settings.DATABASE_REPLICAS or request.method in SAFE_METHODS or response.status_code >= 400:
+        return
+
+    seconds = settings.REPLICA_STICKY_SECONDS
+    response.set_cookie(settings.REPLICA_STICKY_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+    # cookie 를 보내지 않는 client 를 위해 token 으로도 기억한다.
+    access_token = request.headers.get('Authorization')
+    if access_token:
+        caches[settings.REPLICA_STICKY_ALIAS].set(sticky_key(access_token), True, seconds)
+
+
+@sync_and_async_middleware
+def ReplicaMiddleware(get_response):
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = current.set(choose(request))
+            try:
+                response = await get_response(request)
+            finally:
+                current.reset(token)
+            stick(request, response)
+            return response
+    else:
+        def middleware(request):
+            token = current.set(choose(request))
+            try:
+                response = get_response(request)
+            finally:
+                current.reset(token)
+            stick(request, response)
+            return response
+
+    return middleware
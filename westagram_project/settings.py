@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 import my_settings
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'westagram_project.metrics.MetricsMiddleware',
+    'westagram_project.replicas.ReplicaMiddleware',
+    'westagram_project.pool.PoolMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,6 +83,23 @@ WSGI_APPLICATION = 'westagram_project.wsgi.application'
 
 DATABASES = my_settings.DATABASES
 
+# GET, HEAD, OPTIONS 요청의 읽기를 나눠 보내는 replica alias. default 를 뺀 DATABASES alias 는 모두 replica 로 본다.
+# test 에서는 replica 에 'TEST': {'MIRROR': 'default'} 를 줘서 default test DB 를 같이 쓴다.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS  = ['westagram_project.replicas.ReplicaRouter']
+
+# 요청이 끝나도 connection 을 닫지 않고 다시 쓰는 시간(초). 0 이면 요청마다 새로 연결한다. my_settings 에 CONN_MAX_AGE 가 있으면 그 값을 쓴다.
+# async view 는 DB thread(ASYNC_DB_THREADS) 마다 connection 을 하나씩 가지므로 DB thread pool 이 곧 connection pool 이다.
+DATABASE_CONN_MAX_AGE      = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))
+# 이 시간(초)보다 오래 쉰 connection 은 다시 쓰기 전에 ping 해보고, 끊겼으면 다시 연결한다. (MySQL wait_timeout, proxy idle timeout)
+DATABASE_HEALTH_CHECK_IDLE = 30
+
+for database in DATABASES.values():
+    database.setdefault('CONN_MAX_AGE', DATABASE_CONN_MAX_AGE)
+
+# test 는 SEARCH_INDEX_PATH 대신 임시 directory 에 search index 를 만든다.
+TEST_RUNNER = 'westagram_project.testing.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -146,6 +167,148 @@ CORS_ALLOW_HEADERS = (
     'x-requested-with',
 )
 
+## ASYNC
+# ASGI로 배포할 때는 async view를 쓴다. (asgi.py 에서 ASYNC_VIEWS=1 로 설정)
+ASYNC_VIEWS      = os.environ.get('ASYNC_VIEWS') == '1'
+# async view가 ORM 작업을 넘기는 thread pool 크기
+ASYNC_DB_THREADS = 16
+
+## PASSWORD HASHING
+# bcrypt cost factor
+BCRYPT_ROUNDS                = 12
+# bcrypt를 돌리는 worker 수와 대기열 길이. 둘 다 차면 503을 돌려준다.
+PASSWORD_HASHING_WORKERS     = 4
+PASSWORD_HASHING_QUEUE_SIZE  = 16
+# 'thread' 또는 'process'
+PASSWORD_HASHING_EXECUTOR    = 'thread'
+PASSWORD_HASHING_RETRY_AFTER = 1
+
+## CACHE
+# locmem 은 MAX_ENTRIES 를 넘으면 1/CULL_FREQUENCY 의 key 를 가리지 않고 버린다.
+# 응답 payload 가 많아져도 lock, version key 가 같이 버려지지 않도록 쓰임새마다 alias 를 나누고 크기를 넉넉히 잡는다.
+CACHES = {
+    'default': {
+        'BACKEND' : 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'westagram',
+        'OPTIONS' : {'MAX_ENTRIES': 10000},
+    },
+    'responses': {
+        'BACKEND' : 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'westagram-responses',
+        'OPTIONS' : {'MAX_ENTRIES': 100000},
+    },
+    'graph': {
+        'BACKEND' : 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'westagram-graph',
+        'OPTIONS' : {'MAX_ENTRIES': 100000},
+    },
+}
+# 게시물 응답을 cache 하는 alias. 여러 server 가 같이 쓰려면 memcached, redis 같은 shared backend alias 로 바꾼다.
+RESPONSE_CACHE_ALIAS        = 'responses'
+RESPONSE_CACHE_TIMEOUT      = 60
+# 한 요청이 다시 만드는 동안 다른 요청이 기다리는 최대 시간과 확인 간격(초)
+RESPONSE_CACHE_LOCK_TIMEOUT = 5
+RESPONSE_CACHE_LOCK_WAIT    = 0.05
+
+## TOKEN CACHE
+# login_decorator가 검증한 token을 들고 있는 in-process LRU cache 크기와 유지 시간(초)
+TOKEN_CACHE_SIZE  = 10000
+TOKEN_CACHE_TTL   = 300
+# 여러 process가 같이 쓰는 cache alias (ex. 'default'). None이면 process 안에서만 cache 한다.
+TOKEN_CACHE_ALIAS = None
+
+## FEED
+# follower가 이 수를 넘는 작성자의 게시물은 fan-out 하지 않고 읽는 시점에 pull 한다
+FEED_FANOUT_THRESHOLD  = 10000
+# 게시물 작성 시 follower timeline에 fan-out 하는 단위
+FEED_FANOUT_BATCH_SIZE = 1000
+# follow 직후 timeline에 채워 넣는 최근 게시물 수
+FEED_BACKFILL_SIZE     = 100
+
+## COUNTER
+# 좋아요/댓글/follower 수를 나눠 담는 shard 수. 읽을 때는 shard를 모두 더한다.
+COUNTER_SHARDS = 8
+
+## PAGINATION
+# 목록 API의 기본 limit과 최대 limit
+PAGE_SIZE     = 20
+MAX_PAGE_SIZE = 100
+
+## COMMENT
+# 대댓글을 달 수 있는 최대 깊이. 댓글 path 길이가 이 값으로 정해진다.
+COMMENT_MAX_DEPTH      = 20
+# thread API 에서 최상위 댓글마다 기본으로 보여주는 대댓글 수
+COMMENT_THREAD_REPLIES = 3
+
+## JSON
+# 'json'(stdlib) 또는 'orjson'. orjson 은 따로 설치해야 하고, 없으면 stdlib 을 쓴다.
+JSON_BACKEND = 'json'
+# streaming 응답에서 DB 에서 한 번에 읽고, 한 번에 encode 해서 보내는 row 수
+STREAM_CHUNK_SIZE = 1000
+
+## BATCH
+# batch API 한 번에 받을 수 있는 최대 operation 수
+BATCH_MAX_OPERATIONS = 500
+
+## FOLLOW GRAPH
+# following/follower id array 는 process 안에 두고, process 끼리는 이 cache 로 user 별 version 과 최근 변경을 나눈다.
+# process 끼리 같은 cache 를 보도록 locmem 이 아닌 memcached, redis 같은 backend 를 쓴다.
+GRAPH_CACHE_ALIAS        = 'graph'
+# process 하나가 들고 있는 최대 id 수 (id 하나에 8 byte)
+GRAPH_LOCAL_MAX_EDGES    = 10000000
+# process 안의 array 를 DB 에서 다시 읽기 전까지 쓰는 시간(초). GRAPH_CACHE_ALIAS 가 locmem 이면 다른 process 의 follow 가 이만큼 늦게 보인다.
+GRAPH_LOCAL_TTL          = 60
+# 남겨두는 변경 수와 유지 시간(초). 이보다 뒤처진 array 는 DB 에서 다시 읽는다.
+GRAPH_LOG_SIZE           = 100
+GRAPH_LOG_TIMEOUT        = 60 * 60
+# process 에 없는 array 를 DB 에서 읽을 때 한 번에 가져오는 row 수
+GRAPH_LOAD_CHUNK_SIZE    = 10000
+# 추천 계산에 쓰는 최근 following 수와, 그 사람마다 보는 최근 following 수
+GRAPH_SUGGESTION_SOURCES    = 100
+GRAPH_SUGGESTION_CANDIDATES = 1000
+# is-following 확인 API 한 번에 받을 수 있는 user 수
+GRAPH_MAX_TARGETS           = 1000
+
+## RELATIONSHIP
+# relationship API 한 번에 받을 수 있는 게시물 id, user id 수 (각각)
+RELATIONSHIP_MAX_IDS = 100
+
+## SEARCH
+# 'database'(MySQL FULLTEXT index) 또는 'index'(SEARCH_INDEX_PATH 파일). MySQL 이 아니면 'database' 여도 'index' 를 쓴다.
+SEARCH_BACKEND         = 'database'
+SEARCH_INDEX_PATH      = str(BASE_DIR / 'search_index.sqlite3')
+# index 파일에 다른 process 가 쓰고 있을 때 기다리는 시간(초)
+SEARCH_INDEX_TIMEOUT   = 5
+# 검색 결과는 앞에서부터 이 수까지만 page 로 넘겨볼 수 있다.
+SEARCH_MAX_RESULTS     = 1000
+# local index 에서 검색어 단어마다 읽는 최대 문서 수. 단어 하나짜리 검색은 이 수까지 정확한 순서가 나온다.
+SEARCH_TERM_CANDIDATES = 1000
+
+## TAG
+# 게시물 하나에 붙일 수 있는 최대 hashtag 수
+TAG_MAX_PER_POSTING = 30
+# 인기 tag 를 세는 시간 bucket 크기(분)와 인기 tag 를 고를 때 보는 최근 시간
+TAG_BUCKET_MINUTES  = 60
+TAG_TRENDING_HOURS  = 24
+
+## METRICS
+# view 별 query 수, DB 시간, 중복 query, encode 시간, 처리 시간을 기록하는 요청의 비율 (0 이면 기록하지 않는다)
+# /metrics 에서 Prometheus text format 으로 읽는다.
+METRICS_SAMPLE_RATE          = float(os.environ.get('METRICS_SAMPLE_RATE', 0.1))
+# 한 요청에서 같은 SQL 을 이 횟수 이상 실행하면 N+1 로 센다.
+METRICS_N_PLUS_ONE_THRESHOLD = 5
+
+## REPLICA
+# 쓰기가 성공한 뒤 이 시간(초) 동안은 같은 cookie 나 token 의 읽기를 default 에서 한다. replica 지연보다 길게 잡는다.
+REPLICA_STICKY_SECONDS = 5
+REPLICA_STICKY_COOKIE  = 'westagram_primary'
+# token 별 sticky 표시를 저장하는 cache alias. 여러 server 가 같이 쓰려면 shared backend alias 로 바꾼다.
+REPLICA_STICKY_ALIAS   = 'default'
+
+## LOGGING
+# SQL_LOG=1 이면 실행한 SQL 을 모두 console 에 찍고, N+1 로 센 SQL 도 찍는다. (DEBUG 일 때만 SQL 이 찍힌다)
+SQL_LOG = os.environ.get('SQL_LOG') == '1'
+
 # database 돌아가는 것 shell 에서 확인.
 LOGGING = {
     'disable_existing_loggers': False,
@@ -159,7 +322,12 @@ LOGGING = {
     'loggers': {
         'django.db.backends': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': 'DEBUG' if SQL_LOG else 'INFO',
+            'propagate': False,
+        },
+        'westagram.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO' if SQL_LOG else 'WARNING',
             'propagate': False,
         },
     },
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+import contextlib
+
+from django.conf        import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils  import override_settings, setup_databases, teardown_databases
+
+
+class TestRunner(DiscoverRunner):
+    """test 가 만드는 search index 를 project 의 SEARCH_INDEX_PATH 가 아닌 임시 directory 에 쓴다."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.search_directory      = tempfile.mkdtemp(prefix='westagram-search-')
+        settings.SEARCH_INDEX_PATH = os.path.join(self.search_directory, 'search_index.sqlite3')
+
+    def teardown_test_environment(self, **kwargs):
+        shutil.rmtree(self.search_directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+
+@contextlib.contextmanager
+def bench_databases(keepdb=False):
+    """benchmark command 가 만드는 data 를 설정된 DB 가 아닌 test database 와 임시 search index 에 쓴다.
+
+    test database 는 test 와 같은 이름(test_...)이고 끝나면 지운다. 중간에 process 가 죽어서 남은 것은 다음 실행이 지우고 다시 만든다.
+    """
+    directory  = tempfile.mkdtemp(prefix='westagram-bench-')
+    old_config = setup_databases(0, False, keepdb=keepdb)
+    try:
+        with override_settings(SEARCH_INDEX_PATH=os.path.join(directory, 'search_index.sqlite3')):
+            yield
+    finally:
+        teardown_databases(old_config, 0, keepdb=keepdb)
+        shutil.rmtree(directory, ignore_errors=True)
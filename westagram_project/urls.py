@@ -1,6 +1,9 @@
 from django.urls import path, include
 
+from .metrics    import metrics_view
+
 urlpatterns = [
     path('user', include('user.urls')),
     path('posting', include('posting.urls')),
+    path('metrics', metrics_view),
 ]
\ No newline at end of file